@@ -0,0 +1,50 @@
+"""
+User activity staging table for the streaming COPY sink
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 09:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Create user_activity_staging table (unlogged, COPY-friendly column types)
+    op.create_table(
+        'user_activity_staging',
+        sa.Column('batch_id', sa.BigInteger(), nullable=False),
+        sa.Column('event_id', sa.Text()),
+        sa.Column('user_id', sa.Text()),
+        sa.Column('session_id', sa.Text()),
+        sa.Column('timestamp', sa.DateTime()),
+        sa.Column('event_type', sa.Text()),
+        sa.Column('page_url', sa.Text()),
+        sa.Column('referrer_url', sa.Text()),
+        sa.Column('device_type', sa.Text()),
+        sa.Column('browser', sa.Text()),
+        sa.Column('os', sa.Text()),
+        sa.Column('screen_resolution', sa.Text()),
+        sa.Column('ip_address', sa.Text()),
+        sa.Column('country', sa.Text()),
+        sa.Column('city', sa.Text()),
+        sa.Column('latitude', sa.Float(precision=53)),
+        sa.Column('longitude', sa.Float(precision=53)),
+        sa.Column('product_id', sa.Text()),
+        sa.Column('product_category', sa.Text()),
+        sa.Column('product_price', sa.Float(precision=53)),
+        sa.Column('quantity', sa.Integer()),
+        sa.Column('custom_attributes', sa.Text()),
+        prefixes=['UNLOGGED']
+    )
+
+    op.create_index('idx_user_activity_staging_batch_id', 'user_activity_staging', ['batch_id'])
+
+def downgrade() -> None:
+    op.drop_index('idx_user_activity_staging_batch_id')
+    op.drop_table('user_activity_staging')
\ No newline at end of file
@@ -0,0 +1,36 @@
+"""
+Streaming-maintained hourly metrics
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 10:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Add HLL sketch of user ids, backfill marker and last update time to hourly_metrics
+    op.add_column('hourly_metrics', sa.Column('user_sketch', sa.LargeBinary()))
+    op.add_column('hourly_metrics', sa.Column('backfilled', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('hourly_metrics', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP')))
+
+    # Create streaming_batch_commits table
+    op.create_table(
+        'streaming_batch_commits',
+        sa.Column('sink_name', sa.String(100), primary_key=True),
+        sa.Column('query_id', sa.String(36), primary_key=True),
+        sa.Column('batch_id', sa.BigInteger(), nullable=False),
+        sa.Column('committed_at', sa.DateTime(), server_default=sa.text('CURRENT_TIMESTAMP'))
+    )
+
+def downgrade() -> None:
+    op.drop_table('streaming_batch_commits')
+    op.drop_column('hourly_metrics', 'updated_at')
+    op.drop_column('hourly_metrics', 'backfilled')
+    op.drop_column('hourly_metrics', 'user_sketch')
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""
+Hourly sales table for the transactions stream
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 11:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Create hourly_sales table
+    op.create_table(
+        'hourly_sales',
+        sa.Column('hour', sa.Integer(), primary_key=True),
+        sa.Column('total_sales', sa.Numeric(14, 2), nullable=False),
+        sa.Column('transaction_count', sa.BigInteger(), nullable=False)
+    )
+
+def downgrade() -> None:
+    op.drop_table('hourly_sales')
\ No newline at end of file
@@ -2,7 +2,7 @@
 SQLAlchemy models for the streaming analytics pipeline.
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Numeric, Text, BigInteger, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Numeric, Text, BigInteger, JSON, LargeBinary, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects.postgresql import JSONB
 
@@ -43,7 +43,25 @@ class HourlyMetrics(Base):
     unique_users = Column(Integer, nullable=False)
     purchase_count = Column(Integer, nullable=False)
     revenue = Column(Numeric(10, 2), nullable=False)
+    user_sketch = Column(LargeBinary)
+    backfilled = Column(Boolean, nullable=False, server_default='false')
     created_at = Column(DateTime, server_default='CURRENT_TIMESTAMP')
+    updated_at = Column(DateTime, server_default='CURRENT_TIMESTAMP')
+
+class HourlySales(Base):
+    __tablename__ = 'hourly_sales'
+
+    hour = Column(Integer, primary_key=True)
+    total_sales = Column(Numeric(14, 2), nullable=False)
+    transaction_count = Column(BigInteger, nullable=False)
+
+class StreamingBatchCommit(Base):
+    __tablename__ = 'streaming_batch_commits'
+
+    sink_name = Column(String(100), primary_key=True)
+    query_id = Column(String(36), primary_key=True)
+    batch_id = Column(BigInteger, nullable=False)
+    committed_at = Column(DateTime, server_default='CURRENT_TIMESTAMP')
 
 class DashboardMetadata(Base):
     __tablename__ = 'dashboard_metadata'
@@ -24,6 +24,35 @@ CREATE TABLE IF NOT EXISTS user_activity (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create user_activity staging table for the streaming COPY sink
+-- Columns use COPY-friendly types; the sink casts them when merging into user_activity
+CREATE UNLOGGED TABLE IF NOT EXISTS user_activity_staging (
+    batch_id BIGINT NOT NULL,
+    event_id TEXT,
+    user_id TEXT,
+    session_id TEXT,
+    timestamp TIMESTAMP,
+    event_type TEXT,
+    page_url TEXT,
+    referrer_url TEXT,
+    device_type TEXT,
+    browser TEXT,
+    os TEXT,
+    screen_resolution TEXT,
+    ip_address TEXT,
+    country TEXT,
+    city TEXT,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    product_id TEXT,
+    product_category TEXT,
+    product_price DOUBLE PRECISION,
+    quantity INTEGER,
+    custom_attributes TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_activity_staging_batch_id ON user_activity_staging(batch_id);
+
 -- Create hourly_metrics table
 CREATE TABLE IF NOT EXISTS hourly_metrics (
     id SERIAL PRIMARY KEY,
@@ -32,10 +61,34 @@ CREATE TABLE IF NOT EXISTS hourly_metrics (
     unique_users INTEGER NOT NULL,
     purchase_count INTEGER NOT NULL,
     revenue DECIMAL(10, 2) NOT NULL,
+    user_sketch BYTEA,
+    backfilled BOOLEAN NOT NULL DEFAULT FALSE,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     UNIQUE(hour_timestamp)
 );
 
+-- Columns maintained by the streaming hourly_metrics sink
+ALTER TABLE hourly_metrics ADD COLUMN IF NOT EXISTS user_sketch BYTEA;
+ALTER TABLE hourly_metrics ADD COLUMN IF NOT EXISTS backfilled BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE hourly_metrics ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+-- Create hourly_sales table (accumulated per micro-batch by the stream processor)
+CREATE TABLE IF NOT EXISTS hourly_sales (
+    hour INTEGER PRIMARY KEY,
+    total_sales DECIMAL(14, 2) NOT NULL,
+    transaction_count BIGINT NOT NULL
+);
+
+-- Create streaming_batch_commits table (last micro-batch applied by non-idempotent sinks, per streaming query)
+CREATE TABLE IF NOT EXISTS streaming_batch_commits (
+    sink_name VARCHAR(100) NOT NULL,
+    query_id VARCHAR(36) NOT NULL,
+    batch_id BIGINT NOT NULL,
+    committed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sink_name, query_id)
+);
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_user_activity_timestamp ON user_activity(timestamp);
 CREATE INDEX IF NOT EXISTS idx_user_activity_user_id ON user_activity(user_id);
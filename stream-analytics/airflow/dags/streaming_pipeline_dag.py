@@ -72,17 +72,19 @@ check_schema_registry = SimpleHttpOperator(
     dag=dag,
 )
 
-# Task to submit the user activity processor Spark job
-submit_user_activity_processor = SparkSubmitOperator(
-    task_id='submit_user_activity_processor',
-    application='/opt/spark/work-dir/spark/user_activity_processor.py',
+# Task to submit the stream processor Spark job (all sources in one application)
+submit_stream_processor = SparkSubmitOperator(
+    task_id='submit_stream_processor',
+    application='/opt/spark/work-dir/spark/stream_processor.py',
     conn_id='spark_default',
     verbose=True,
     executor_cores=2,
     executor_memory='2g',
     num_executors=2,
-    name='user_activity_processor',
+    name='stream_processor',
     application_args=[],
+    # The driver imports the shared utils package; executors receive it from ship_executor_modules
+    env_vars={'PYTHONPATH': '/opt/spark/work-dir'},
     conf={
         'spark.dynamicAllocation.enabled': 'false',
         'spark.sql.streaming.schemaInference': 'true',
@@ -98,7 +100,10 @@ data_quality_check = PythonOperator(
     dag=dag,
 )
 
-# Task to generate hourly metrics report
+# Task to backfill the hourly metrics report.
+# hourly_metrics is maintained by the streaming processor; this only fills the
+# previous hour if the stream did not, and is a no-op (and safe to re-run) otherwise.
+# Backfilled rows are marked, and the stream replaces them once it catches up.
 generate_hourly_report = PostgresOperator(
     task_id='generate_hourly_report',
     postgres_conn_id='postgres_default',
@@ -109,6 +114,7 @@ generate_hourly_report = PostgresOperator(
         unique_users,
         purchase_count,
         revenue,
+        backfilled,
         created_at
     )
     SELECT 
@@ -117,13 +123,19 @@ generate_hourly_report = PostgresOperator(
         COUNT(DISTINCT user_id) as unique_users,
         SUM(CASE WHEN event_type = 'purchase' THEN 1 ELSE 0 END) as purchase_count,
         SUM(CASE WHEN event_type = 'purchase' THEN quantity * product_price ELSE 0 END) as revenue,
+        TRUE as backfilled,
         NOW() as created_at
     FROM user_activity
     WHERE 
         timestamp >= date_trunc('hour', NOW() - INTERVAL '1 hour') AND
-        timestamp < date_trunc('hour', NOW())
+        timestamp < date_trunc('hour', NOW()) AND
+        NOT EXISTS (
+            SELECT 1 FROM hourly_metrics
+            WHERE hour_timestamp = date_trunc('hour', NOW() - INTERVAL '1 hour')
+        )
     GROUP BY 
-        date_trunc('hour', timestamp);
+        date_trunc('hour', timestamp)
+    ON CONFLICT (hour_timestamp) DO NOTHING;
     """,
     dag=dag,
 )
@@ -145,7 +157,7 @@ update_dashboard = PythonOperator(
 )
 
 # Define task dependencies
-init_db >> check_kafka >> check_schema_registry >> submit_user_activity_processor
-submit_user_activity_processor >> data_quality_check
+init_db >> check_kafka >> check_schema_registry >> submit_stream_processor
+submit_stream_processor >> data_quality_check
 data_quality_check >> [generate_hourly_report, anomaly_detection]
 [generate_hourly_report, anomaly_detection] >> update_dashboard 
\ No newline at end of file
@@ -0,0 +1,195 @@
+"""
+Custom Attribute Promotion
+
+custom_attributes is a string-to-string map carried on every raw event. Map
+columns compress poorly and their keys cannot be pruned or skipped with
+column statistics, so this module promotes the most used keys to typed
+top-level columns of the raw events table and keeps the other keys in a
+residual custom_attributes map.
+
+The promoted keys are the configured ones plus, if learning is enabled,
+the most frequent keys of the recent raw events, with the narrowest type
+(boolean, long, double or string) that every observed value round-trips
+through. Columns promoted by earlier runs stay promoted, so the table schema
+only grows. Each promoted column records its key and type in its column
+metadata; a value that does not round-trip through the column type is kept
+in the residual map instead, so restore_attributes rebuilds the original map
+exactly.
+"""
+
+import re
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from delta.tables import DeltaTable
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, count, explode, expr, lit, when
+
+logger = logging.getLogger(__name__)
+
+# Column metadata entry holding the promoted key and type
+ATTRIBUTE_METADATA = "custom_attribute"
+
+# Supported column types and their SQL names, narrowest first
+ATTRIBUTE_TYPES = {"boolean": "BOOLEAN", "long": "BIGINT", "double": "DOUBLE", "string": "STRING"}
+
+
+def _quote(value: str) -> str:
+    """SQL string literal."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _round_trips(value_sql: str, attribute_type: str) -> str:
+    """SQL condition that a string value is present and converts to the type and back unchanged."""
+    if attribute_type == "string":
+        return f"{value_sql} IS NOT NULL"
+    return f"CAST(CAST({value_sql} AS {ATTRIBUTE_TYPES[attribute_type]}) AS STRING) = {value_sql}"
+
+
+def column_name(key: str, prefix: str) -> str:
+    """Top-level column name of a promoted key."""
+    return prefix + re.sub(r"[^0-9a-zA-Z_]", "_", key).lower()
+
+
+def promoted_columns(schema) -> List[Dict[str, str]]:
+    """The promoted attribute columns of a schema, as key, type and column."""
+    return [
+        {**field.metadata[ATTRIBUTE_METADATA], "column": field.name}
+        for field in schema.fields if ATTRIBUTE_METADATA in field.metadata
+    ]
+
+
+def restore_attributes(df: DataFrame) -> DataFrame:
+    """Merge promoted columns back into custom_attributes and drop them."""
+    promotions = promoted_columns(df.schema)
+    if not promotions:
+        return df
+
+    entries = ", ".join(
+        f"{_quote(promotion['key'])}, CAST(`{promotion['column']}` AS STRING)" for promotion in promotions
+    )
+    promoted_map = f"map_filter(map({entries}), (k, v) -> v IS NOT NULL)"
+    return df.withColumn(
+        "custom_attributes",
+        expr(f"map_concat(coalesce(custom_attributes, CAST(map() AS MAP<STRING, STRING>)), {promoted_map})")
+    ).drop(*[promotion["column"] for promotion in promotions])
+
+
+def promote_attributes(df: DataFrame, promotions: List[Dict[str, str]]) -> DataFrame:
+    """
+    Move the promoted keys of custom_attributes into typed columns.
+
+    Args:
+        df: Events with a custom_attributes map
+        promotions: Promoted attributes, as key, type and column
+
+    Returns:
+        DataFrame: The events with one column per promoted key and the residual map
+    """
+    if not promotions:
+        return df
+
+    kept_in_map = []
+    for promotion in promotions:
+        value_sql = f"custom_attributes[{_quote(promotion['key'])}]"
+        converts = _round_trips(value_sql, promotion["type"])
+        df = df.withColumn(
+            promotion["column"],
+            when(expr(converts), expr(f"CAST({value_sql} AS {ATTRIBUTE_TYPES[promotion['type']]})"))
+        ).withMetadata(
+            promotion["column"], {ATTRIBUTE_METADATA: {"key": promotion["key"], "type": promotion["type"]}}
+        )
+        kept_in_map.append(f"NOT (k = {_quote(promotion['key'])} AND {_round_trips('v', promotion['type'])})")
+
+    return df.withColumn(
+        "custom_attributes", expr(f"map_filter(custom_attributes, (k, v) -> {' AND '.join(kept_in_map)})")
+    )
+
+
+def learn_promotions(events_df: DataFrame, top_n: int, min_share: float) -> List[Dict[str, str]]:
+    """
+    Pick the most frequent keys of a batch of events and the narrowest type of each.
+
+    Args:
+        events_df: Events with a complete custom_attributes map
+        top_n: Maximum number of keys
+        min_share: Minimum fraction of events carrying a key
+
+    Returns:
+        List[Dict[str, str]]: Learned attributes, as key and type
+    """
+    total = events_df.count()
+    if total == 0:
+        return []
+
+    entries = events_df.select(explode("custom_attributes").alias("key", "value"))
+    stats = entries.groupBy("key").agg(
+        count(lit(1)).alias("rows"),
+        count("value").alias("values"),
+        *[
+            count(when(expr(_round_trips("value", attribute_type)), True)).alias(attribute_type)
+            for attribute_type in ATTRIBUTE_TYPES
+        ]
+    ).filter(
+        col("rows") >= min_share * total
+    ).orderBy(col("rows").desc()).limit(top_n).collect()
+
+    # Keys whose values are all null are kept as strings
+    return [
+        {
+            "key": row["key"],
+            "type": next((t for t in ATTRIBUTE_TYPES if row["values"] and row[t] == row["values"]), "string"),
+        }
+        for row in stats
+    ]
+
+
+def resolve_promotions(spark, raw_path: str, attributes_config: Dict[str, Any]) -> List[Dict[str, str]]:
+    """
+    Decide the promoted attributes of the raw events table for this run.
+
+    Args:
+        spark: Active Spark session
+        raw_path: Path of the raw events table
+        attributes_config: The processing.custom_attributes section of sources.yaml
+
+    Returns:
+        List[Dict[str, str]]: Promoted attributes, as key, type and column
+    """
+    if not attributes_config.get("enabled", False):
+        return []
+
+    prefix = attributes_config.get("column_prefix", "attr_")
+    table_exists = DeltaTable.isDeltaTable(spark, raw_path)
+
+    # Already promoted columns keep their type, then configured keys, then learned keys
+    candidates = promoted_columns(spark.read.format("delta").load(raw_path).schema) if table_exists else []
+    candidates += [{"key": item["key"], "type": item.get("type", "string")} for item in attributes_config.get("promote", [])]
+
+    learn_config = attributes_config.get("learn", {})
+    if learn_config.get("enabled", False) and table_exists:
+        since = datetime.now(timezone.utc) - timedelta(hours=learn_config.get("lookback_hours", 24))
+        recent = restore_attributes(
+            spark.read.format("delta").load(raw_path).filter(
+                col("timestamp") >= expr(f"timestamp_seconds({int(since.timestamp())})")
+            )
+        )
+        candidates += learn_promotions(recent, learn_config.get("top_n", 10), learn_config.get("min_share", 0.05))
+
+    promotions, keys, columns = [], set(), set()
+    for candidate in candidates:
+        if candidate["type"] not in ATTRIBUTE_TYPES:
+            raise ValueError(f"Unsupported attribute type for {candidate['key']}: {candidate['type']}")
+        column = candidate.get("column", column_name(candidate["key"], prefix))
+        if candidate["key"] in keys:
+            continue
+        if column in columns:
+            logger.warning(f"Not promoting custom attribute {candidate['key']}: column {column} is taken")
+            continue
+        keys.add(candidate["key"])
+        columns.add(column)
+        promotions.append({"key": candidate["key"], "type": candidate["type"], "column": column})
+
+    logger.info(f"Promoting custom attributes: {', '.join(p['key'] + ':' + p['type'] for p in promotions) or 'none'}")
+    return promotions
@@ -0,0 +1,102 @@
+"""
+Transaction Attribution
+
+This module attributes transactions to the user activity that preceded them
+with a stream-stream join on user_id: each transaction is matched with the
+same user's touchpoint events (views, clicks, add-to-carts) from the
+configured lookback window before it. Transactions without touchpoints are
+still emitted, with null touchpoint columns, once the watermark rules out
+further matches.
+
+Both inputs are watermarked and the join condition bounds event time on
+both sides, so Spark can drop buffered rows that can no longer match and
+the join state stays bounded by roughly (lookback + watermark delay) of
+touchpoints plus one watermark delay of transactions. Its size is exported
+per query by the streaming progress listener (state_rows, state_memory_bytes).
+"""
+
+import logging
+from typing import Any, Dict
+
+from pyspark.sql.functions import col, expr
+
+from user_activity_processor import parse_user_activity, read_user_activity, deduplicate_events
+from checkpoints import configure_query
+
+logger = logging.getLogger(__name__)
+
+# Touchpoint columns kept in the join state; everything else is dropped early
+TOUCHPOINT_COLUMNS = [
+    "event_id", "user_id", "session_id", "timestamp", "event_type",
+    "page_url", "referrer_url", "product_id",
+]
+
+
+def attributed_transactions(spark, config: Dict[str, Any], transactions_df):
+    """
+    Build the stream of transactions joined with their preceding touchpoints.
+
+    Args:
+        spark: Active Spark session
+        config: The full sources.yaml configuration
+        transactions_df: Parsed transactions stream
+
+    Returns:
+        DataFrame: One row per (transaction, touchpoint), or per unattributed transaction
+    """
+    processing_config = config.get("processing", {})
+    attribution_config = processing_config.get("attribution", {})
+    lookback = attribution_config.get("lookback", "30 minutes")
+    touchpoint_types = attribution_config.get("touchpoint_event_types", ["view", "click", "add_to_cart"])
+
+    touchpoints = deduplicate_events(
+        parse_user_activity(read_user_activity(spark, config)), processing_config
+    ).filter(
+        col("event_type").isin(touchpoint_types)
+    ).select(
+        *[col(name).alias(f"touch_{name}") for name in TOUCHPOINT_COLUMNS]
+    )
+
+    transactions = transactions_df.withWatermark(
+        "timestamp", attribution_config.get("transactions_watermark", "10 minutes")
+    )
+
+    return transactions.join(
+        touchpoints,
+        expr(f"""
+            touch_user_id = user_id AND
+            touch_timestamp >= timestamp - INTERVAL {lookback} AND
+            touch_timestamp <= timestamp
+        """),
+        "leftOuter"
+    ).withColumn(
+        "seconds_before_transaction",
+        expr("unix_seconds(timestamp) - unix_seconds(touch_timestamp)")
+    ).drop("touch_user_id", "key", "processing_time")
+
+
+def start_attribution_query(spark, config: Dict[str, Any], transactions_df):
+    """
+    Start the attribution query writing to Delta, if enabled.
+
+    Args:
+        spark: Active Spark session
+        config: The full sources.yaml configuration
+        transactions_df: Parsed transactions stream
+
+    Returns:
+        StreamingQuery: The attribution query, or None if disabled
+    """
+    attribution_config = config.get("processing", {}).get("attribution", {})
+    if not attribution_config.get("enabled", False):
+        return None
+
+    query = configure_query(
+        attributed_transactions(spark, config, transactions_df).writeStream
+        .queryName("transaction_attribution")
+        .format("delta")
+        .outputMode("append"),
+        config, "transaction_attribution", attribution_config["checkpoint_location"], sink_format="delta"
+    ).start(attribution_config["path"])
+    logger.info(f"Started transaction attribution with a {attribution_config.get('lookback', '30 minutes')} lookback")
+    return query
\ No newline at end of file
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+User Activity Backfill
+
+Recomputes the user activity outputs for an event-time range as a batch job,
+for example after a change to the aggregation logic. Replaying Kafka through
+the streaming job is paced by its triggers; here the range is read in one
+pass (from Kafka by time or offset range, or from the raw events Delta table)
+and run through the same validation, enrichment, deduplication and
+aggregation functions as the stream, at full cluster parallelism. The rows of
+each output table that fall in the range are then replaced with a single
+Delta overwrite (replaceWhere), so readers see either the old or the new
+version of the range, never a mix. Like the streaming job, it needs the
+project root on PYTHONPATH for the shared utils package:
+
+    export PYTHONPATH=.
+    python spark/backfill.py --start 2024-05-01T00:00:00 --end 2024-05-02T00:00:00
+    python spark/backfill.py --start 2024-05-01T00:00:00 --end 2024-05-02T00:00:00 --source delta
+    python spark/backfill.py --start 2024-05-01T00:00:00 --end 2024-05-01T06:00:00 \\
+        --starting-offsets '{"user-activity":{"0":1000,"1":1000,"2":1000}}' \\
+        --ending-offsets '{"user-activity":{"0":9000,"1":9000,"2":9000}}'
+
+The range must be aligned to whole hours so that every replaced window is
+recomputed from all of its events. Events up to --margin-minutes outside the
+range are read as well, so late Kafka deliveries and sessions starting in the
+range are complete, but only rows whose event time (or window start) is in
+the range are written. Backfill ranges the streaming job has finished with:
+a concurrent streaming append into the same range makes the overwrite fail
+rather than lose rows. Heavy hitters, rollup tiers and the PostgreSQL sinks
+are not backfilled.
+"""
+
+import os
+import sys
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from pyspark import StorageLevel
+from pyspark.sql.functions import col, count, lit
+
+from user_activity_processor import (
+    load_config, create_spark_session, ship_executor_modules, user_activity_schema,
+    validate_user_activity, user_activity_events,
+    user_activity_aggregates, aggregate_paths
+)
+from dead_letter import ERROR_COLUMN, valid_records
+from table_layout import layout_strategy, prepare_table, range_condition, with_layout_columns
+from attributes import promote_attributes, resolve_promotions, restore_attributes
+
+OUTPUT_TABLES = ["raw_events", "sessions", "products", "user_behavior", "geo"]
+
+
+def parse_time(value):
+    """Parse an ISO-8601 time; times without an offset are UTC."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def read_kafka_range(spark, config, start, end, args):
+    """Read the raw user activity records of a time or offset range from Kafka as a batch."""
+    reader = (
+        spark.read
+        .format("kafka")
+        .option("kafka.bootstrap.servers", os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092"))
+        .option("subscribe", config["sources"]["user_activity"]["topic"])
+    )
+
+    if args.starting_offsets:
+        reader = reader.option("startingOffsets", args.starting_offsets).option(
+            "endingOffsets", args.ending_offsets or "latest"
+        )
+    else:
+        # Kafka timestamps are epoch milliseconds
+        margin = timedelta(minutes=args.margin_minutes)
+        reader = reader.option(
+            "startingTimestamp", str(int((start - margin).timestamp() * 1000))
+        ).option(
+            "endingTimestamp", str(int((end + margin).timestamp() * 1000))
+        )
+
+    if args.min_partitions:
+        # Split each Kafka partition's range over several tasks
+        reader = reader.option("minPartitions", str(args.min_partitions))
+
+    return reader.load()
+
+
+def read_raw_events(spark, config, start, end, margin_minutes):
+    """Read the stored raw events around [start, end), reduced to the columns of a parsed Kafka record."""
+    raw_path = config["sinks"]["delta_lake"]["tables"]["user_activity_hourly"]["path"]
+    margin = timedelta(minutes=margin_minutes)
+
+    # Enrichment columns are dropped so the current enrichment is applied again
+    return restore_attributes(spark.read.format("delta").load(raw_path).filter(
+        range_condition("timestamp", start - margin, end + margin)
+    )).select(
+        "key", *user_activity_schema.fieldNames(), "processing_time"
+    )
+
+
+def report_invalid_records(validated_df):
+    """Print the number of records that fail validation, by reason."""
+    reasons = validated_df.filter(col(ERROR_COLUMN).isNotNull()).groupBy(ERROR_COLUMN).agg(
+        count(lit(1)).alias("records")
+    ).collect()
+    for row in reasons:
+        print(f"Skipping {row['records']} invalid records: {row[ERROR_COLUMN]}")
+
+
+def backfill_outputs(spark, config, parsed_df, start, end):
+    """
+    Build the recomputed rows of each output table for [start, end).
+
+    Returns:
+        dict: Output name -> (DataFrame, Delta path, range column, partition columns)
+    """
+    processing_config = config.get("processing", {})
+
+    # Same enrichment and deduplication as process_user_activity, without the dimension refresh
+    events_df = user_activity_events(spark, parsed_df, processing_config, refresh=False)
+
+    # The events feed every output, so they are computed once
+    events_df = events_df.persist(StorageLevel.MEMORY_AND_DISK)
+
+    # The raw events are written in the table's layout and with its promoted attributes, as by the stream
+    raw_table_config = config["sinks"]["delta_lake"]["tables"]["user_activity_hourly"]
+    raw_events_df = promote_attributes(
+        events_df.filter(range_condition("timestamp", start, end)),
+        resolve_promotions(spark, raw_table_config["path"], processing_config.get("custom_attributes", {}))
+    )
+    raw_partition_columns = prepare_table(
+        spark, raw_table_config["path"], raw_events_df.schema, layout_strategy(raw_table_config)
+    )
+    outputs = {
+        "raw_events": (
+            with_layout_columns(raw_events_df, raw_partition_columns),
+            raw_table_config["path"],
+            "timestamp",
+            raw_partition_columns,
+        )
+    }
+    paths = aggregate_paths(processing_config)
+    for name, df in user_activity_aggregates(events_df, processing_config).items():
+        outputs[name] = (df.filter(range_condition("window.start", start, end)), paths[name], "window.start", [])
+
+    return outputs
+
+
+def replace_range(df, path, column, start, end, partition_columns):
+    """Replace the rows of a Delta table whose column falls in [start, end) with df, in one commit."""
+    writer = (
+        df.write
+        .format("delta")
+        .mode("overwrite")
+        .option("replaceWhere", range_condition(column, start, end))
+        .option("mergeSchema", "true")
+    )
+    if partition_columns:
+        writer = writer.partitionBy(*partition_columns)
+    writer.save(path)
+
+
+def run_backfill(spark, config, args):
+    """Recompute and replace the selected output tables for the requested range."""
+    start, end = parse_time(args.start), parse_time(args.end)
+    tables = args.tables.split(",")
+
+    if args.source == "kafka":
+        validated_df = validate_user_activity(read_kafka_range(spark, config, start, end, args))
+        validated_df = validated_df.persist(StorageLevel.MEMORY_AND_DISK)
+        report_invalid_records(validated_df)
+        parsed_df = valid_records(validated_df)
+    else:
+        # The raw events table is the input, so it is not rewritten
+        parsed_df = read_raw_events(spark, config, start, end, args.margin_minutes)
+        tables = [table for table in tables if table != "raw_events"]
+
+    outputs = backfill_outputs(spark, config, parsed_df, start, end)
+    for table in tables:
+        df, path, column, partition_columns = outputs[table]
+        print(f"Replacing {table} rows in [{start.isoformat()}, {end.isoformat()}) at {path}")
+        replace_range(df, path, column, start, end, partition_columns)
+
+    print(f"Backfilled {len(tables)} tables from {args.source}")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Recompute the user activity outputs for a time range")
+    parser.add_argument("--start", required=True, help="Start of the event-time range (ISO-8601, UTC by default)")
+    parser.add_argument("--end", required=True, help="End of the event-time range, exclusive")
+    parser.add_argument("--source", choices=["kafka", "delta"], default="kafka",
+                        help="Read Kafka, or re-derive the outputs from the raw events table")
+    parser.add_argument("--starting-offsets", help="Kafka startingOffsets JSON (default: by --start timestamp)")
+    parser.add_argument("--ending-offsets", help="Kafka endingOffsets JSON (default: latest)")
+    parser.add_argument("--margin-minutes", type=int, default=60,
+                        help="Minutes of events read on each side of the range")
+    parser.add_argument("--tables", default=",".join(OUTPUT_TABLES),
+                        help=f"Comma-separated outputs to replace ({', '.join(OUTPUT_TABLES)})")
+    parser.add_argument("--min-partitions", type=int, help="Minimum number of Kafka read tasks")
+    parser.add_argument("--shuffle-partitions", type=int, help="Shuffle partitions of the batch job")
+    args = parser.parse_args()
+
+    start, end = parse_time(args.start), parse_time(args.end)
+    if start >= end:
+        parser.error("--start must be before --end")
+    if any(t.minute or t.second or t.microsecond for t in (start, end)):
+        parser.error("--start and --end must be aligned to whole hours")
+    unknown = set(args.tables.split(",")) - set(OUTPUT_TABLES)
+    if unknown:
+        parser.error(f"Unknown tables: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+
+    try:
+        config = load_config()
+        spark = create_spark_session("UserActivityBackfill")
+        ship_executor_modules(spark)
+        if args.shuffle_partitions:
+            spark.conf.set("spark.sql.shuffle.partitions", str(args.shuffle_partitions))
+
+        run_backfill(spark, config, args)
+        spark.stop()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
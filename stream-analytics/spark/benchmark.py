@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+User Activity Processor Benchmark
+
+Runs the user activity transformation graph (validation, product and geoip
+enrichment, deduplication, attribute promotion on the raw events and the
+session, product, user behavior and geo aggregations) in local[*] mode,
+without Kafka, MinIO or the Schema Registry. Events come from pre-generated
+JSON files or from Spark's rate source, and every output is written to a
+local Delta path. Enrichment and promotion follow processing.enrichment and
+processing.custom_attributes in sources.yaml, as in the processor. Stages
+whose tables are not on the local filesystem (the repository configuration
+keeps them on s3a) are turned off unless a local copy is given with
+--product-dimension or --geoip-ranges, and the hot keys table of salted
+queries is kept under --output. For each combination of input rate and
+shuffle partition count the runner reports, per query, the throughput, batch
+latency percentiles and state store size. Run it from the project root with
+the root on PYTHONPATH, for the shared utils package:
+
+    export PYTHONPATH=.
+    python spark/benchmark.py --generate-files 200 --input /tmp/bench/input
+    python spark/benchmark.py --input /tmp/bench/input --rates 2000,10000 --shuffle-partitions 4,16
+    python spark/benchmark.py --rates 1000,5000,20000 --duration 120
+    python spark/benchmark.py --product-dimension /tmp/bench/products --geoip-ranges /tmp/bench/ip_ranges.csv
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import shutil
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from pyspark.sql import SparkSession
+from pyspark.sql.functions import (
+    col, concat, lit, struct, to_json, when, array, element_at, create_map, current_timestamp
+)
+
+from user_activity_processor import (
+    load_config, parse_user_activity, user_activity_events, user_activity_aggregates
+)
+from enrichment import stop_dimension_refresh
+from attributes import promote_attributes, resolve_promotions
+
+# Values used for synthetic events, matching the Kafka data generator
+EVENT_TYPES = ["click", "view", "scroll", "purchase", "add_to_cart", "remove_from_cart"]
+DEVICE_TYPES = ["desktop", "mobile", "tablet", "other"]
+BROWSERS = ["Chrome", "Firefox", "Safari", "Edge", "Opera"]
+OS_LIST = ["Windows", "MacOS", "Linux", "iOS", "Android"]
+CATEGORIES = ["Electronics", "Clothing", "Books", "Home", "Sports"]
+COUNTRIES = ["US", "GB", "DE", "FR", "IN", "BR", "JP", "CA"]
+
+
+def create_local_spark_session(app_name="UserActivityBenchmark"):
+    """Create a local[*] Spark session with Delta Lake and no S3 configuration."""
+    from delta import configure_spark_with_delta_pip
+
+    builder = (
+        SparkSession.builder
+        .master("local[*]")
+        .appName(app_name)
+        .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
+        .config("spark.sql.catalog.spark_catalog", "org.apache.spark.sql.delta.catalog.DeltaCatalog")
+        .config("spark.ui.enabled", "false")
+        # Keep every progress report of a run for the percentiles
+        .config("spark.sql.streaming.numRecentProgressUpdates", "10000")
+    )
+    return configure_spark_with_delta_pip(builder).getOrCreate()
+
+
+def generate_event(users, sessions, now):
+    """Generate one synthetic user activity event as produced by the data generator."""
+    event_type = random.choice(EVENT_TYPES)
+    product_related = event_type in ["view", "purchase", "add_to_cart", "remove_from_cart"]
+
+    return {
+        "event_id": str(uuid.uuid4()),
+        "user_id": f"user_{random.randint(1, users)}",
+        "session_id": f"session_{random.randint(1, sessions)}",
+        "timestamp": (now - timedelta(seconds=random.uniform(0, 60))).isoformat(),
+        "event_type": event_type,
+        "page_url": f"https://example.com/page/{random.randint(1, 500)}",
+        "referrer_url": f"https://example.com/page/{random.randint(1, 500)}" if random.random() > 0.3 else None,
+        "device_info": {
+            "device_type": random.choice(DEVICE_TYPES),
+            "browser": random.choice(BROWSERS),
+            "os": random.choice(OS_LIST),
+            "screen_resolution": f"{random.choice([1024, 1366, 1920])}x{random.choice([768, 900, 1080])}"
+        },
+        "geo_data": {
+            "ip_address": f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}",
+            "country": random.choice(COUNTRIES),
+            "city": f"city_{random.randint(1, 200)}",
+            "latitude": random.uniform(-90, 90),
+            "longitude": random.uniform(-180, 180)
+        },
+        "product_id": f"product_{random.randint(1, 1000)}" if product_related else None,
+        "product_category": random.choice(CATEGORIES) if product_related else None,
+        "product_price": round(random.uniform(10.0, 500.0), 2) if product_related else None,
+        "quantity": random.randint(1, 5) if product_related and event_type != "view" else None,
+        "custom_attributes": {
+            f"attr_{i}": f"value_{random.randint(1, 100)}"
+            for i in range(random.randint(0, 5))
+        }
+    }
+
+
+def generate_input_files(path, num_files, rows_per_file, users=10000, sessions=1000):
+    """Write JSON lines files of synthetic events for the file input mode."""
+    os.makedirs(path, exist_ok=True)
+    now = datetime.now(timezone.utc)
+
+    for file_index in range(num_files):
+        with open(os.path.join(path, f"events-{file_index:05d}.json"), "w") as f:
+            for _ in range(rows_per_file):
+                f.write(json.dumps(generate_event(users, sessions, now)) + "\n")
+
+    print(f"Generated {num_files} files of {rows_per_file} events in {path}")
+
+
+def read_rate_source(spark, rows_per_second, users=10000, sessions=1000):
+    """Read synthetic events from the rate source, serialized to JSON like the Kafka records."""
+    df = (
+        spark.readStream
+        .format("rate")
+        .option("rowsPerSecond", rows_per_second)
+        .load()
+    )
+
+    def pick(values):
+        return element_at(array(*[lit(v) for v in values]), (col("value") % len(values) + 1).cast("int"))
+
+    event_type = pick(EVENT_TYPES)
+    product_related = event_type.isin("view", "purchase", "add_to_cart", "remove_from_cart")
+
+    event = struct(
+        concat(lit("evt_"), col("value").cast("string")).alias("event_id"),
+        concat(lit("user_"), (col("value") * 7919 % users).cast("string")).alias("user_id"),
+        concat(lit("session_"), (col("value") * 104729 % sessions).cast("string")).alias("session_id"),
+        col("timestamp"),
+        event_type.alias("event_type"),
+        concat(lit("https://example.com/page/"), (col("value") % 500).cast("string")).alias("page_url"),
+        lit(None).cast("string").alias("referrer_url"),
+        struct(
+            pick(DEVICE_TYPES).alias("device_type"),
+            pick(BROWSERS).alias("browser"),
+            pick(OS_LIST).alias("os"),
+            lit("1920x1080").alias("screen_resolution")
+        ).alias("device_info"),
+        struct(
+            lit("10.0.0.1").alias("ip_address"),
+            pick(COUNTRIES).alias("country"),
+            concat(lit("city_"), (col("value") % 200).cast("string")).alias("city"),
+            lit(0.0).alias("latitude"),
+            lit(0.0).alias("longitude")
+        ).alias("geo_data"),
+        when(product_related, concat(lit("product_"), (col("value") % 1000).cast("string"))).alias("product_id"),
+        when(product_related, pick(CATEGORIES)).alias("product_category"),
+        when(product_related, (col("value") % 490 + 10).cast("double")).alias("product_price"),
+        when(product_related & (event_type != "view"), (col("value") % 5 + 1).cast("int")).alias("quantity"),
+        create_map(lit("attr_0"), concat(lit("value_"), (col("value") % 100).cast("string"))).alias("custom_attributes")
+    )
+
+    return df.select(
+        lit(None).cast("string").alias("key"),
+        to_json(event).alias("value"),
+        lit("benchmark").alias("topic"),
+        lit(0).alias("partition"),
+        col("value").alias("offset"),
+        col("timestamp")
+    )
+
+
+def read_file_source(spark, path, max_files_per_trigger):
+    """Read pre-generated JSON lines files, shaped like the Kafka records."""
+    df = (
+        spark.readStream
+        .format("text")
+        .option("maxFilesPerTrigger", max_files_per_trigger)
+        .load(path)
+    )
+
+    return df.select(
+        lit(None).cast("string").alias("key"),
+        col("value"),
+        lit("benchmark").alias("topic"),
+        lit(0).alias("partition"),
+        lit(None).cast("long").alias("offset"),
+        current_timestamp().alias("timestamp")
+    )
+
+
+def is_local_path(path):
+    """Whether a path is on the local filesystem (no scheme, or file:)."""
+    return "://" not in path or path.startswith("file:")
+
+
+def local_benchmark_config(config, args):
+    """
+    Adapt the processing configuration to local[*] mode.
+
+    The product dimension and GeoIP stages read the paths given on the
+    command line, and are turned off when their configured tables are not
+    local. Salted queries keep their hot keys table under the output directory.
+    """
+    processing_config = config.setdefault("processing", {})
+    enrichment_config = processing_config.setdefault("enrichment", {})
+    stages = [
+        ("product_dimension", "path", args.product_dimension),
+        ("geoip", "ranges_path", args.geoip_ranges),
+    ]
+
+    for stage, path_key, local_path in stages:
+        stage_config = enrichment_config.get(stage, {})
+        if local_path:
+            stage_config.update({"enabled": True, path_key: local_path})
+            enrichment_config[stage] = stage_config
+        elif stage_config.get("enabled", False) and not is_local_path(stage_config[path_key]):
+            print(f"Skipping {stage}: {stage_config[path_key]} is not local")
+            stage_config["enabled"] = False
+
+    if "skew" in processing_config:
+        processing_config["skew"]["hot_keys_path"] = os.path.join(args.output, "hot_keys")
+
+    return config
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return float(ordered[rank - 1])
+
+
+def summarize_progress(progress_reports):
+    """Summarize the progress reports of one query."""
+    reports = [p for p in progress_reports if p.get("numInputRows", 0) > 0]
+    if not reports:
+        return {"batches": 0}
+
+    input_rows = sum(p["numInputRows"] for p in reports)
+    latencies = [p["durationMs"].get("triggerExecution", 0) for p in reports]
+    last_state = reports[-1].get("stateOperators", [])
+
+    return {
+        "batches": len(reports),
+        "input_rows": input_rows,
+        "rows_per_second": input_rows / (sum(latencies) / 1000.0) if sum(latencies) else 0.0,
+        "batch_latency_ms_p50": percentile(latencies, 50),
+        "batch_latency_ms_p95": percentile(latencies, 95),
+        "batch_latency_ms_p99": percentile(latencies, 99),
+        "state_rows": sum(op.get("numRowsTotal", 0) for op in last_state),
+        "state_memory_bytes": sum(op.get("memoryUsedBytes", 0) for op in last_state),
+    }
+
+
+def run_benchmark(spark, config, rate, shuffle_partitions, args):
+    """Run the transformation graph at one input rate and shuffle partition count."""
+    run_dir = os.path.join(args.output, f"rate_{rate}_partitions_{shuffle_partitions}")
+    shutil.rmtree(run_dir, ignore_errors=True)
+    spark.conf.set("spark.sql.shuffle.partitions", str(shuffle_partitions))
+
+    if args.input:
+        # In file mode the rate is the number of rows per trigger
+        max_files = max(1, int(round(rate / float(args.rows_per_file))))
+        source_df = read_file_source(spark, args.input, max_files)
+    else:
+        source_df = read_rate_source(spark, rate)
+
+    # The processor's graph: enriched, deduplicated events to the raw table and the aggregations
+    processing_config = config.get("processing", {})
+    events_df = user_activity_events(spark, parse_user_activity(source_df), processing_config)
+    raw_events_df = promote_attributes(
+        events_df,
+        resolve_promotions(spark, os.path.join(run_dir, "tables", "raw_events"), processing_config.get("custom_attributes", {}))
+    )
+    outputs = {"raw_events": raw_events_df}
+    outputs.update(user_activity_aggregates(events_df, processing_config))
+
+    queries = []
+    for name, df in outputs.items():
+        queries.append(
+            df.writeStream
+            .queryName(name)
+            .format("delta")
+            .outputMode("append")
+            .option("checkpointLocation", os.path.join(run_dir, "checkpoints", name))
+            .trigger(processingTime=f"{args.trigger_seconds} seconds")
+            .start(os.path.join(run_dir, "tables", name))
+        )
+
+    time.sleep(args.duration)
+
+    results = {}
+    for query in queries:
+        results[query.name] = summarize_progress([json.loads(p.json) for p in query.recentProgress])
+        query.stop()
+    stop_dimension_refresh()
+
+    return results
+
+
+def print_results(rate, shuffle_partitions, results):
+    """Print the per-query results of one run as a table."""
+    print(f"\nInput rate {rate}, shuffle partitions {shuffle_partitions}")
+    print(f"{'query':<16}{'batches':>8}{'rows':>10}{'rows/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'state rows':>12}{'state MB':>10}")
+    for name, result in results.items():
+        if not result["batches"]:
+            print(f"{name:<16}{0:>8}")
+            continue
+        print(f"{name:<16}{result['batches']:>8}{result['input_rows']:>10}{result['rows_per_second']:>10.0f}"
+              f"{result['batch_latency_ms_p50']:>9.0f}{result['batch_latency_ms_p95']:>9.0f}"
+              f"{result['batch_latency_ms_p99']:>9.0f}{result['state_rows']:>12}"
+              f"{result['state_memory_bytes'] / 1048576.0:>10.1f}")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the user activity processor locally")
+    parser.add_argument("--input", help="Directory of JSON lines event files (default: rate source)")
+    parser.add_argument("--generate-files", type=int, default=0,
+                        help="Generate this many event files into --input and exit")
+    parser.add_argument("--rows-per-file", type=int, default=1000, help="Events per generated file")
+    parser.add_argument("--rates", default="1000,5000,10000",
+                        help="Comma-separated input rates (rows/second, or rows per trigger for files)")
+    parser.add_argument("--shuffle-partitions", default="4,8", help="Comma-separated shuffle partition counts")
+    parser.add_argument("--duration", type=int, default=60, help="Seconds to run each combination")
+    parser.add_argument("--trigger-seconds", type=int, default=5, help="Micro-batch trigger interval")
+    parser.add_argument("--output", default="/tmp/stream-analytics-benchmark", help="Local output directory")
+    parser.add_argument("--report", help="Write all results as JSON to this file")
+    parser.add_argument("--product-dimension", help="Local product dimension table (default: off unless configured locally)")
+    parser.add_argument("--geoip-ranges", help="Local GeoIP range table (default: off unless configured locally)")
+    return parser.parse_args()
+
+
+def main():
+    """Main function."""
+    args = parse_args()
+
+    if args.generate_files:
+        if not args.input:
+            print("--generate-files requires --input")
+            sys.exit(1)
+        generate_input_files(args.input, args.generate_files, args.rows_per_file)
+        return
+
+    # Use the repository configuration unless CONFIG_PATH points elsewhere
+    os.environ.setdefault(
+        "CONFIG_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "sources.yaml")
+    )
+    config = local_benchmark_config(load_config(), args)
+    spark = create_local_spark_session()
+
+    report = []
+    for rate in [int(r) for r in args.rates.split(",")]:
+        for shuffle_partitions in [int(p) for p in args.shuffle_partitions.split(",")]:
+            results = run_benchmark(spark, config, rate, shuffle_partitions, args)
+            print_results(rate, shuffle_partitions, results)
+            report.append({"rate": rate, "shuffle_partitions": shuffle_partitions, "queries": results})
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote benchmark report to {args.report}")
+
+    spark.stop()
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Checkpoint Management
+
+Every micro-batch of a streaming query writes an offset log entry before it
+runs (walCommit) and a commit log entry after it (commitOffsets), and
+stateful queries also upload their state store changes. On S3A/MinIO each of
+these is an object-store round trip on the critical path of the batch, and
+the default checkpoint file manager writes a temporary file and renames it,
+which S3A implements as a copy plus a delete.
+
+This module applies the checkpoint settings of the streaming queries from
+the processing.checkpoints section of sources.yaml:
+
+- checkpoint locations, under one base location unless a query has its own
+- the `abortable` checkpoint file manager, which writes checkpoint files in
+  place with abortable S3A streams instead of rename (needs spark-hadoop-cloud)
+- how many batches of offset/commit log entries and state versions are
+  retained, which bounds the metadata logs and their cleanup
+- the RocksDB state store with changelog checkpointing, which uploads each
+  batch's state changes instead of state files; existing checkpoints keep
+  the provider they were created with
+- an optional trigger interval, so queries do not pay the checkpoint writes
+  for many tiny batches, at the cost of up to one interval of latency
+- asynchronous progress tracking, which takes the offset and commit log
+  writes off the batch's critical path, for the queries that support it
+  (stateless queries writing to Kafka)
+"""
+
+import logging
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FILE_MANAGERS = {
+    "abortable": "org.apache.spark.internal.io.cloud.AbortableStreamBasedCheckpointFileManager",
+}
+
+ROCKSDB_PROVIDER = "org.apache.spark.sql.execution.streaming.state.RocksDBStateStoreProvider"
+
+# Sinks with which Spark supports asynchronous progress tracking (stateless queries only)
+ASYNC_PROGRESS_SINKS = {"kafka"}
+
+
+def _checkpoints_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """The processing.checkpoints section of sources.yaml."""
+    return config.get("processing", {}).get("checkpoints", {})
+
+
+def apply_checkpoint_settings(spark, config: Dict[str, Any]) -> None:
+    """
+    Set the session-wide checkpoint settings.
+
+    Args:
+        spark: Active Spark session, before any query starts
+        config: The full sources.yaml configuration
+    """
+    checkpoints_config = _checkpoints_config(config)
+
+    if "base_location" in checkpoints_config:
+        spark.conf.set("spark.sql.streaming.checkpointLocation", checkpoints_config["base_location"])
+
+    file_manager = checkpoints_config.get("file_manager", "default")
+    if file_manager != "default":
+        if file_manager not in FILE_MANAGERS:
+            raise ValueError(f"Unsupported checkpoint file manager: {file_manager}")
+        spark.conf.set("spark.sql.streaming.checkpointFileManagerClass", FILE_MANAGERS[file_manager])
+
+    if "min_batches_to_retain" in checkpoints_config:
+        spark.conf.set("spark.sql.streaming.minBatchesToRetain", str(checkpoints_config["min_batches_to_retain"]))
+
+    if checkpoints_config.get("state_store", "hdfs") == "rocksdb":
+        spark.conf.set("spark.sql.streaming.stateStore.providerClass", ROCKSDB_PROVIDER)
+        spark.conf.set(
+            "spark.sql.streaming.stateStore.rocksdb.changelogCheckpointing.enabled",
+            str(checkpoints_config.get("changelog_checkpointing", True)).lower()
+        )
+
+    logger.info(f"Checkpoint settings: {checkpoints_config}")
+
+
+def checkpoint_location(config: Dict[str, Any], name: str, default: Optional[str] = None) -> str:
+    """
+    Checkpoint location of a query.
+
+    A location configured for the query under processing.checkpoints.locations
+    wins, then the location from the query's own sink configuration, then a
+    directory named after the query under the base location.
+    """
+    checkpoints_config = _checkpoints_config(config)
+    location = checkpoints_config.get("locations", {}).get(name, default)
+    if location:
+        return location
+    return checkpoints_config.get("base_location", "s3a://data-lake/checkpoints/").rstrip("/") + f"/{name}/"
+
+
+def configure_query(writer, config: Dict[str, Any], name: str, default_location: Optional[str] = None,
+                    sink_format: Optional[str] = None, stateful: bool = True):
+    """
+    Apply the checkpoint location, trigger and progress tracking settings to a query.
+
+    Args:
+        writer: DataStreamWriter of the query
+        config: The full sources.yaml configuration
+        name: Checkpoint name of the query
+        default_location: Checkpoint location from the query's sink configuration, if any
+        sink_format: Format of the sink, or None for foreachBatch sinks
+        stateful: Whether the query has stateful operators
+
+    Returns:
+        DataStreamWriter: The configured writer
+    """
+    checkpoints_config = _checkpoints_config(config)
+    writer = writer.option("checkpointLocation", checkpoint_location(config, name, default_location))
+
+    trigger_interval = checkpoints_config.get("trigger_interval")
+    if trigger_interval:
+        writer = writer.trigger(processingTime=trigger_interval)
+
+    async_config = checkpoints_config.get("async_progress_tracking", {})
+    if async_config.get("enabled", False):
+        if sink_format in ASYNC_PROGRESS_SINKS and not stateful:
+            writer = writer.option("asyncProgressTrackingEnabled", "true").option(
+                "asyncProgressTrackingCheckpointIntervalMs", str(async_config.get("checkpoint_interval_ms", 1000))
+            )
+        else:
+            logger.debug(f"Asynchronous progress tracking is not supported for query {name}")
+
+    return writer
@@ -0,0 +1,159 @@
+"""
+Dead-Letter Routing
+
+`from_json` does not fail on bad input: a record that is not valid JSON, or
+whose fields do not match the schema, comes back as null columns and would
+otherwise flow into every aggregation. This module parses raw Kafka records
+with a corrupt-record column, flags each record with the first validation
+rule it fails, and splits the stream:
+
+- valid records continue into the pipeline, before any stateful operator
+- invalid records are written to a dead-letter Delta table with their raw
+  bytes, Kafka topic/partition/offset and the error reason, so they can be
+  inspected and replayed once the producer is fixed
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pyspark.sql.functions import coalesce, col, count, current_timestamp, expr, from_json, lit, to_date, when
+from pyspark.sql.types import StringType, StructField, StructType
+
+from streaming_metrics import DEAD_LETTER_RECORDS
+from checkpoints import configure_query
+
+logger = logging.getLogger(__name__)
+
+CORRUPT_RECORD_COLUMN = "_corrupt_record"
+ERROR_COLUMN = "validation_error"
+
+# Raw Kafka columns carried alongside the parsed fields until the split
+RAW_COLUMNS = ["raw_value", "kafka_topic", "kafka_partition", "kafka_offset"]
+
+
+def validate_records(df, schema: StructType, rules: Optional[List[Tuple[str, str]]] = None):
+    """
+    Parse raw Kafka records and flag the ones that are malformed or violate the schema.
+
+    Records are checked in order for a missing value, unparseable JSON (or
+    values that do not convert to the field types), missing non-nullable
+    top-level fields and finally the additional rules; the first failure is
+    the record's error reason.
+
+    Args:
+        df: Raw Kafka records (key, value, topic, partition, offset, timestamp)
+        schema: Schema of the JSON values; its non-nullable top-level fields are required
+        rules: Additional (reason, SQL condition) pairs; a record fails a rule when the condition is true
+
+    Returns:
+        DataFrame: key, the schema's fields, processing_time, the raw Kafka
+        columns and validation_error (null for valid records)
+    """
+    parse_schema = StructType(schema.fields + [StructField(CORRUPT_RECORD_COLUMN, StringType(), True)])
+    parsed_df = df.select(
+        col("key").cast("string"),
+        from_json(
+            col("value").cast("string"), parse_schema, {"columnNameOfCorruptRecord": CORRUPT_RECORD_COLUMN}
+        ).alias("data"),
+        col("timestamp").alias("processing_time"),
+        col("value").alias("raw_value"),
+        col("topic").alias("kafka_topic"),
+        col("partition").alias("kafka_partition"),
+        col("offset").alias("kafka_offset"),
+    ).select("key", "data.*", "processing_time", *RAW_COLUMNS)
+
+    checks = [
+        ("empty_value", col("raw_value").isNull()),
+        ("malformed_json", col(CORRUPT_RECORD_COLUMN).isNotNull()),
+    ]
+    checks += [
+        (f"missing_{field.name}", col(field.name).isNull())
+        for field in schema.fields if not field.nullable
+    ]
+    checks += [(reason, expr(condition)) for reason, condition in rules or []]
+
+    return parsed_df.withColumn(
+        ERROR_COLUMN, coalesce(*[when(failed, lit(reason)) for reason, failed in checks])
+    )
+
+
+def valid_records(validated_df):
+    """The records that passed validation, without the validation and raw Kafka columns."""
+    return validated_df.filter(col(ERROR_COLUMN).isNull()).drop(ERROR_COLUMN, CORRUPT_RECORD_COLUMN, *RAW_COLUMNS)
+
+
+def dead_letter_records(validated_df):
+    """The records that failed validation, in the dead-letter table's shape."""
+    return validated_df.filter(col(ERROR_COLUMN).isNotNull()).select(
+        "key",
+        "raw_value",
+        "kafka_topic",
+        "kafka_partition",
+        "kafka_offset",
+        col("processing_time").alias("kafka_timestamp"),
+        col(ERROR_COLUMN).alias("error_reason"),
+        current_timestamp().alias("dead_lettered_at"),
+    ).withColumn("dead_letter_date", to_date(col("dead_lettered_at")))
+
+
+class DeadLetterSink:
+    """foreachBatch sink that appends invalid records to the dead-letter table and counts them by reason."""
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+
+    def __call__(self, batch_df, batch_id: int) -> None:
+        """Write one micro-batch of invalid records."""
+        batch_df = batch_df.persist()
+        try:
+            reasons = batch_df.groupBy("error_reason").agg(count(lit(1)).alias("records")).collect()
+            if not reasons:
+                return
+
+            # txnAppId/txnVersion make the append idempotent if the batch is retried
+            (
+                batch_df.write.format("delta")
+                .mode("append")
+                .option("txnAppId", f"dead_letter_{self.source}")
+                .option("txnVersion", batch_id)
+                .partitionBy("dead_letter_date")
+                .save(self.path)
+            )
+
+            for row in reasons:
+                DEAD_LETTER_RECORDS.labels(source=self.source, reason=row.error_reason).inc(row.records)
+            logger.warning(
+                f"Batch {batch_id}: {sum(row.records for row in reasons)} invalid {self.source} records "
+                f"dead-lettered ({', '.join(f'{row.error_reason}={row.records}' for row in reasons)})"
+            )
+
+        finally:
+            batch_df.unpersist()
+
+
+def start_dead_letter_query(validated_df, config: Dict[str, Any], source: str):
+    """
+    Start the query writing a source's invalid records to the dead-letter table, if enabled.
+
+    Args:
+        validated_df: Output of validate_records for the source
+        config: The full sources.yaml configuration
+        source: Name of the source, used in the table path, metrics and query name
+
+    Returns:
+        StreamingQuery: The dead-letter query, or None if disabled
+    """
+    dead_letter_config = config.get("processing", {}).get("dead_letter", {})
+    if not dead_letter_config.get("enabled", False):
+        logger.warning(f"Dead-letter output is disabled; invalid {source} records are dropped")
+        return None
+
+    base_path = dead_letter_config["path"].rstrip("/")
+    checkpoint_base = dead_letter_config["checkpoint_location"].rstrip("/")
+    return configure_query(
+        dead_letter_records(validated_df).writeStream
+        .queryName(f"dead_letter_{source}")
+        .foreachBatch(DeadLetterSink(f"{base_path}/{source}/", source)),
+        config, f"dead_letter_{source}", f"{checkpoint_base}/{source}/", stateful=False
+    ).start()
@@ -0,0 +1,149 @@
+"""
+Product Dimension Enrichment
+
+This module joins catalog attributes from a product dimension table (Delta
+or Parquet) into the user activity stream, so downstream tables carry
+pre-enriched rows instead of every dashboard joining the catalog at query
+time. The dimension is small: it is cached, broadcast to the executors for
+the stream-static join, and reloaded on a fixed interval by a driver thread,
+without restarting the streaming queries. The processor stops the refresh
+threads with stop_dimension_refresh when its queries stop; batch jobs do not
+start them.
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Dict, List
+
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import broadcast, col
+from pyspark.sql.utils import AnalysisException
+
+from streaming_metrics import DIMENSION_REFRESH_TIMESTAMP, DIMENSION_ROWS
+
+logger = logging.getLogger(__name__)
+
+# Dimensions whose refresh thread is running
+_refreshing: List["ProductDimension"] = []
+
+
+class ProductDimension:
+    """Cached, periodically refreshed product dimension for stream-static joins."""
+
+    def __init__(self, spark, dimension_config: Dict[str, Any], name: str = "product_dimension"):
+        """
+        Initialize the dimension.
+
+        Args:
+            spark: Active Spark session
+            dimension_config: The processing.enrichment.product_dimension section of sources.yaml
+            name: Dimension name used in logs and metrics
+        """
+        self.spark = spark
+        self.name = name
+        self.path = dimension_config["path"]
+        self.format = dimension_config.get("format", "delta")
+        self.key = dimension_config.get("key", "product_id")
+        self.columns: Dict[str, str] = dimension_config.get("columns", {})
+        self.refresh_interval = dimension_config.get("refresh_interval_seconds", 600)
+        self.df = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def output_columns(self) -> List[str]:
+        """Columns added to the stream by the enrichment."""
+        return list(self.columns)
+
+    def load(self) -> DataFrame:
+        """Read, cache and materialize the dimension."""
+        self.df = self.spark.read.format(self.format).load(self.path).select(
+            col(self.key),
+            *[col(source).alias(output) for output, source in self.columns.items()]
+        ).dropDuplicates([self.key]).cache()
+        self._materialize()
+        return self.df
+
+    def _materialize(self) -> None:
+        """Fill the cache and export its size and refresh time."""
+        rows = self.df.count()
+        DIMENSION_ROWS.labels(dimension=self.name).set(rows)
+        DIMENSION_REFRESH_TIMESTAMP.labels(dimension=self.name).set(time.time())
+        logger.info(f"Loaded {rows} rows of {self.name} from {self.path}")
+
+    def refresh(self) -> None:
+        """
+        Reload the dimension in place.
+
+        The streaming join plans against the cached relation, so invalidating
+        the cache for the path and re-materializing it makes the next
+        micro-batches broadcast the new version.
+        """
+        self.spark.catalog.refreshByPath(self.path)
+        self._materialize()
+
+    def _refresh_loop(self) -> None:
+        """Refresh the dimension every refresh_interval seconds until stopped."""
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the previous version rather than failing the stream
+                logger.error(f"Error refreshing {self.name}: {e}")
+
+    def start_refresh(self) -> threading.Thread:
+        """Start the background refresh thread."""
+        self._thread = threading.Thread(target=self._refresh_loop, name=f"{self.name}-refresh", daemon=True)
+        self._thread.start()
+        _refreshing.append(self)
+        return self._thread
+
+    def stop_refresh(self) -> None:
+        """Stop the background refresh thread and wait for a running refresh to finish."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self in _refreshing:
+            _refreshing.remove(self)
+
+    def enrich(self, events_df: DataFrame) -> DataFrame:
+        """Left join the broadcast dimension into the stream on the product key."""
+        return events_df.join(broadcast(self.df), on=self.key, how="left")
+
+
+def enrich_with_product_dimension(spark, events_df: DataFrame, enrichment_config: Dict[str, Any],
+                                  refresh: bool = True) -> DataFrame:
+    """
+    Enrich events with the product dimension, if configured and available.
+
+    Args:
+        spark: Active Spark session
+        events_df: User activity events
+        enrichment_config: The processing.enrichment section of sources.yaml
+        refresh: Whether to reload the dimension periodically (streaming queries)
+
+    Returns:
+        DataFrame: The events with the dimension columns, or unchanged events
+    """
+    dimension_config = enrichment_config.get("product_dimension", {})
+    if not dimension_config.get("enabled", False):
+        return events_df
+
+    dimension = ProductDimension(spark, dimension_config)
+    try:
+        dimension.load()
+    except AnalysisException as e:
+        logger.warning(f"Product dimension not available at {dimension.path}, skipping enrichment: {e}")
+        return events_df
+
+    if refresh:
+        dimension.start_refresh()
+    return dimension.enrich(events_df)
+
+
+def stop_dimension_refresh() -> None:
+    """Stop the refresh threads of all dimensions, once their streaming queries have stopped."""
+    for dimension in list(_refreshing):
+        dimension.stop_refresh()
@@ -0,0 +1,252 @@
+"""
+GeoIP Enrichment
+
+This module derives country, city and coordinates from each event's
+ip_address with an Arrow-based pandas UDF. Every executor Python worker
+loads the IP range table once into sorted NumPy arrays; lookups are a
+vectorized binary search (np.searchsorted) over the range starts, and the
+range of each distinct IP seen recently is kept in a per-worker LRU cache
+so hot IPs skip the search entirely.
+
+The range table (Parquet or CSV) has the columns start_ip, end_ip (IPv4
+addresses as integers), country, city, latitude and longitude, with
+non-overlapping ranges.
+"""
+
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from py4j.protocol import Py4JJavaError
+from pyspark import SparkFiles
+from pyspark.sql.functions import coalesce, col, pandas_udf, struct, when
+
+logger = logging.getLogger(__name__)
+
+GEOIP_SCHEMA = "country string, city string, latitude double, longitude double"
+
+# Per-worker index, loaded on first use
+_INDEX = None
+
+
+def ipv4_to_int(ips: pd.Series) -> np.ndarray:
+    """
+    Convert dotted IPv4 strings to integers; invalid or missing addresses become -1.
+
+    The strings are viewed as a fixed-width matrix of code points, validated
+    with whole-matrix operations and accumulated one character position at
+    a time, so there is no Python work per address.
+    """
+    # One row per character position, one column per address
+    chars = np.ascontiguousarray(
+        ips.fillna("").to_numpy().astype("U16").view(np.uint32).reshape(len(ips), 16).T
+    ).astype(np.int32)
+    digits = chars - 48
+    is_digit = (digits >= 0) & (digits <= 9)
+    is_dot = chars == 46
+    is_end = chars == 0
+
+    # Only digits and dots, exactly three dots, 1-3 digits per octet, nothing after the end
+    valid = (
+        is_end[15]
+        & (is_digit | is_dot | is_end).all(axis=0)
+        & (is_dot.sum(axis=0) == 3)
+        & is_digit[0]
+        & ~(is_dot[:-1] & ~is_digit[1:]).any(axis=0)
+        & ~(is_digit[:-3] & is_digit[1:-2] & is_digit[2:-1] & is_digit[3:]).any(axis=0)
+        & ~(is_end[:-1] & ~is_end[1:]).any(axis=0)
+    )
+
+    result = np.zeros(len(ips), dtype=np.int64)
+    octet = np.zeros(len(ips), dtype=np.int64)
+    for position in range(16):
+        octet = np.where(is_digit[position], octet * 10 + digits[position], octet)
+        dot = is_dot[position]
+        if dot.any():
+            valid &= ~(dot & (octet > 255))
+            result = np.where(dot, (result << 8) | octet, result)
+            octet = np.where(dot, 0, octet)
+
+    valid &= octet <= 255
+    return np.where(valid, (result << 8) | octet, -1)
+
+
+class IpRangeIndex:
+    """Sorted IPv4 range table with vectorized lookups and an LRU cache of hot IPs."""
+
+    def __init__(self, ranges: pd.DataFrame, cache_size: int = 100000):
+        """
+        Build the index.
+
+        Args:
+            ranges: start_ip, end_ip, country, city, latitude, longitude
+            cache_size: Number of distinct IPs whose range is cached
+        """
+        ranges = ranges.sort_values("start_ip").reset_index(drop=True)
+        self.starts = ranges["start_ip"].to_numpy(np.int64)
+        self.ends = ranges["end_ip"].to_numpy(np.int64)
+        self.countries = ranges["country"].to_numpy(object)
+        self.cities = ranges["city"].to_numpy(object)
+        self.latitudes = ranges["latitude"].to_numpy(np.float64)
+        self.longitudes = ranges["longitude"].to_numpy(np.float64)
+        self.cache_size = cache_size
+
+        # LRU cache of IP -> range index, with the batch each IP was last seen in
+        self.cache_keys = np.empty(0, dtype=np.int64)
+        self.cache_values = np.empty(0, dtype=np.int64)
+        self.cache_last_used = np.empty(0, dtype=np.int64)
+        self.cache_index = pd.Index(self.cache_keys)
+        self.batches = 0
+
+    def search(self, ips: np.ndarray) -> np.ndarray:
+        """Index of the range containing each IP, or -1 (vectorized binary search)."""
+        positions = np.searchsorted(self.starts, ips, side="right") - 1
+        clipped = np.clip(positions, 0, None)
+        found = (positions >= 0) & (ips >= 0) & (ips <= self.ends[clipped])
+        return np.where(found, positions, -1)
+
+    def range_indices(self, ips: np.ndarray) -> np.ndarray:
+        """
+        Range index of each IP, using the LRU cache for hot IPs.
+
+        Distinct strings can convert to the same integer (leading zeros, or
+        -1 for every invalid address), so the IPs are deduplicated before the
+        cache is consulted. Cache hits are resolved with one hash lookup over
+        the whole batch; misses are searched and added, evicting the least
+        recently used IPs. Invalid addresses are never cached.
+        """
+        self.batches += 1
+        ips, inverse = np.unique(ips, return_inverse=True)
+        positions = self.cache_index.get_indexer(ips)
+        hits = positions >= 0
+
+        indices = np.empty(len(ips), dtype=np.int64)
+        indices[hits] = self.cache_values[positions[hits]]
+        self.cache_last_used[positions[hits]] = self.batches
+
+        indices[ips < 0] = -1
+        misses = ~hits & (ips >= 0)
+        if misses.any():
+            indices[misses] = self.search(ips[misses])
+            self.cache_keys = np.concatenate([self.cache_keys, ips[misses]])
+            self.cache_values = np.concatenate([self.cache_values, indices[misses]])
+            self.cache_last_used = np.concatenate([
+                self.cache_last_used, np.full(int(misses.sum()), self.batches, dtype=np.int64)
+            ])
+
+            if len(self.cache_keys) > self.cache_size:
+                keep = np.argpartition(-self.cache_last_used, self.cache_size - 1)[:self.cache_size]
+                self.cache_keys = self.cache_keys[keep]
+                self.cache_values = self.cache_values[keep]
+                self.cache_last_used = self.cache_last_used[keep]
+            self.cache_index = pd.Index(self.cache_keys)
+
+        return indices[inverse]
+
+    def lookup(self, ip_addresses: pd.Series) -> pd.DataFrame:
+        """
+        Look up the location of each IP address.
+
+        Args:
+            ip_addresses: Dotted IPv4 strings (may contain nulls)
+
+        Returns:
+            pd.DataFrame: country, city, latitude, longitude; nulls where no range matches
+        """
+        # Search each distinct address once
+        codes, uniques = pd.factorize(ip_addresses)
+        indices = np.full(len(codes), -1, dtype=np.int64)
+        if len(uniques) and len(self.starts):
+            unique_indices = self.range_indices(ipv4_to_int(pd.Series(uniques)))
+            indices = np.where(codes >= 0, unique_indices[codes], -1)
+
+        found = indices >= 0
+        rows = indices[found]
+        result = pd.DataFrame({
+            "country": np.full(len(indices), None, dtype=object),
+            "city": np.full(len(indices), None, dtype=object),
+            "latitude": np.full(len(indices), np.nan),
+            "longitude": np.full(len(indices), np.nan),
+        })
+        result.loc[found, "country"] = self.countries[rows]
+        result.loc[found, "city"] = self.cities[rows]
+        result.loc[found, "latitude"] = self.latitudes[rows]
+        result.loc[found, "longitude"] = self.longitudes[rows]
+        return result
+
+
+def load_ranges(path: str) -> pd.DataFrame:
+    """Read an IP range table from Parquet or CSV."""
+    if path.endswith(".csv"):
+        return pd.read_csv(path)
+    return pd.read_parquet(path)
+
+
+def get_index(file_name: str, cache_size: int) -> IpRangeIndex:
+    """The worker's IP range index, loaded from the distributed file on first use."""
+    global _INDEX
+    if _INDEX is None:
+        ranges = load_ranges(SparkFiles.get(file_name))
+        _INDEX = IpRangeIndex(ranges, cache_size)
+        logger.info(f"Loaded {len(ranges)} IP ranges from {file_name}")
+    return _INDEX
+
+
+def geoip_udf(file_name: str, cache_size: int = 100000):
+    """Build the pandas UDF mapping ip_address to a location struct (GEOIP_SCHEMA)."""
+    @pandas_udf(GEOIP_SCHEMA)
+    def geoip_lookup(ip_addresses: pd.Series) -> pd.DataFrame:
+        return get_index(file_name, cache_size).lookup(ip_addresses)
+
+    return geoip_lookup
+
+
+def enrich_with_geoip(spark, events_df, geoip_config: dict, file_name: Optional[str] = None):
+    """
+    Derive geo_data from ip_address.
+
+    The range table is distributed to the executors with addFile. With
+    `override` enabled, looked-up values replace the producer's geo_data
+    fields (producer values are kept where no range matches); in both modes
+    a geo_mismatch flag marks events whose producer country disagrees.
+
+    Args:
+        spark: Active Spark session
+        events_df: User activity events
+        geoip_config: The processing.enrichment.geoip section of sources.yaml
+        file_name: Name of the distributed file (defaults to the path's file name)
+
+    Returns:
+        DataFrame: The events with derived geo_data and geo_mismatch, or
+        unchanged events if disabled or the range table is not available
+    """
+    if not geoip_config.get("enabled", False):
+        return events_df
+
+    ranges_path = geoip_config["ranges_path"]
+    try:
+        spark.sparkContext.addFile(ranges_path)
+    except Py4JJavaError as e:
+        logger.warning(f"GeoIP ranges not available at {ranges_path}, skipping geo enrichment: {e}")
+        return events_df
+    lookup = geoip_udf(file_name or os.path.basename(ranges_path.rstrip("/")), geoip_config.get("cache_size", 100000))
+
+    enriched_df = events_df.withColumn("geoip", lookup(col("geo_data.ip_address")))
+    enriched_df = enriched_df.withColumn(
+        "geo_mismatch",
+        col("geoip.country").isNotNull() & col("geo_data.country").isNotNull()
+        & (col("geoip.country") != col("geo_data.country"))
+    )
+
+    if geoip_config.get("override", True):
+        enriched_df = enriched_df.withColumn("geo_data", struct(
+            col("geo_data.ip_address").alias("ip_address"),
+            coalesce(col("geoip.country"), col("geo_data.country")).alias("country"),
+            when(col("geoip.country").isNotNull(), col("geoip.city")).otherwise(col("geo_data.city")).alias("city"),
+            when(col("geoip.country").isNotNull(), col("geoip.latitude")).otherwise(col("geo_data.latitude")).alias("latitude"),
+            when(col("geoip.country").isNotNull(), col("geoip.longitude")).otherwise(col("geo_data.longitude")).alias("longitude"),
+        ))
+
+    return enriched_df.drop("geoip")
\ No newline at end of file
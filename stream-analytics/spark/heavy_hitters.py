@@ -0,0 +1,194 @@
+"""
+Heavy Hitters
+
+This module tracks the most frequent values of high-cardinality dimensions
+(city, product, page URL) per event-time window with bounded state. Each
+window keeps a count-min sketch of all values plus a small heap of candidate
+heavy hitters, so its state does not grow with the number of distinct values.
+When the watermark passes the end of a window, only the top N values are
+emitted, each with its estimated count and the sketch's error bound.
+
+Count-min estimates never undercount; with probability 1 - delta the
+overcount is at most epsilon * total_count, which is reported as error_bound.
+"""
+
+import json
+import math
+import heapq
+import logging
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+from pyspark.sql.functions import array, col, explode, expr, lit, struct, window
+from pyspark.sql.streaming.state import GroupStateTimeout
+
+logger = logging.getLogger(__name__)
+
+# Schema of the emitted heavy hitters
+HEAVY_HITTERS_SCHEMA = (
+    "dimension string, window_start timestamp, window_end timestamp, rank int, "
+    "item string, estimated_count long, error_bound long, total_count long"
+)
+
+# Schema of the per-window state
+HEAVY_HITTERS_STATE_SCHEMA = "counts binary, candidates string, total_count long"
+
+
+class CountMinTopK:
+    """Count-min sketch with a bounded set of top-K candidates."""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01, capacity: int = 200):
+        """
+        Initialize an empty sketch.
+
+        Args:
+            epsilon: Relative overcount bound (as a fraction of the total count)
+            delta: Probability that an estimate exceeds the bound
+            capacity: Maximum number of candidates kept
+        """
+        self.epsilon = epsilon
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1.0 / delta)))
+        self.capacity = capacity
+        self.counts = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.candidates: Dict[str, int] = {}
+        self.total_count = 0
+
+    def _columns(self, items: pd.Series) -> np.ndarray:
+        """Hash the items into one sketch column per row (depth x len(items))."""
+        return np.vstack([
+            pd.util.hash_pandas_object(items, index=False, hash_key=f"heavyhitters{row:04d}").to_numpy()
+            % np.uint64(self.width)
+            for row in range(self.depth)
+        ]).astype(np.int64)
+
+    def update(self, items: pd.Series) -> None:
+        """Count a batch of items and refresh the candidates."""
+        items = items.dropna().astype(str)
+        if items.empty:
+            return
+
+        distinct = pd.Series(items.unique())
+        frequencies = items.value_counts().reindex(distinct).to_numpy()
+        columns = self._columns(distinct)
+
+        for row in range(self.depth):
+            np.add.at(self.counts[row], columns[row], frequencies)
+        self.total_count += len(items)
+
+        estimates = self.counts[np.arange(self.depth)[:, None], columns].min(axis=0)
+        self.candidates.update(zip(distinct, estimates.tolist()))
+        if len(self.candidates) > self.capacity:
+            self.candidates = dict(heapq.nlargest(self.capacity, self.candidates.items(), key=lambda c: c[1]))
+
+    def top(self, n: int) -> List[Tuple[str, int]]:
+        """The n candidates with the highest estimated counts."""
+        return heapq.nlargest(n, self.candidates.items(), key=lambda c: c[1])
+
+    def error_bound(self) -> int:
+        """Maximum overcount of any estimate (with probability 1 - delta)."""
+        return int(math.ceil(self.epsilon * self.total_count))
+
+    def to_state(self) -> Tuple[bytes, str, int]:
+        """Serialize the sketch into a state row."""
+        return self.counts.tobytes(), json.dumps(self.candidates), self.total_count
+
+    def load_state(self, state: Tuple[bytes, str, int]) -> "CountMinTopK":
+        """Restore the sketch from a state row."""
+        counts, candidates, total_count = state
+        self.counts = np.frombuffer(counts, dtype=np.int64).reshape(self.depth, self.width).copy()
+        self.candidates = json.loads(candidates)
+        self.total_count = total_count
+        return self
+
+
+def heavy_hitters_state_func(top_n: int, epsilon: float, delta: float, capacity: int):
+    """
+    Build the applyInPandasWithState function tracking one dimension and window.
+
+    Args:
+        top_n: Number of heavy hitters emitted per window
+        epsilon: Relative overcount bound of the sketch
+        delta: Failure probability of the bound
+        capacity: Candidates kept per window
+
+    Returns:
+        Callable: Function of (key, pdf_iter, state) yielding heavy hitter rows
+    """
+    def update_window(key: Tuple, pdf_iter: Iterator[pd.DataFrame], state) -> Iterator[pd.DataFrame]:
+        dimension, window_start, window_end = key
+        sketch = CountMinTopK(epsilon, delta, capacity)
+        if state.exists:
+            sketch.load_state(state.get)
+
+        if state.hasTimedOut:
+            # The watermark passed the end of the window: emit its top N
+            top = sketch.top(top_n)
+            state.remove()
+            yield pd.DataFrame({
+                "dimension": [dimension] * len(top),
+                "window_start": [window_start] * len(top),
+                "window_end": [window_end] * len(top),
+                "rank": list(range(1, len(top) + 1)),
+                "item": [item for item, _ in top],
+                "estimated_count": [estimate for _, estimate in top],
+                "error_bound": [sketch.error_bound()] * len(top),
+                "total_count": [sketch.total_count] * len(top),
+            })
+            return
+
+        window_end_ms = None
+        for pdf in pdf_iter:
+            sketch.update(pdf["item"])
+            window_end_ms = int(pdf["window_end_ms"].iloc[0])
+
+        state.update(sketch.to_state())
+        if window_end_ms is not None:
+            state.setTimeoutTimestamp(window_end_ms)
+
+    return update_window
+
+
+def heavy_hitters(events_df, heavy_hitters_config: Dict[str, Any]):
+    """
+    Track the top values of each configured dimension per window.
+
+    Args:
+        events_df: Watermarked user activity events
+        heavy_hitters_config: The processing.heavy_hitters section of sources.yaml
+
+    Returns:
+        DataFrame: Streaming DataFrame of per-window heavy hitters (HEAVY_HITTERS_SCHEMA)
+    """
+    window_duration = heavy_hitters_config.get("window", "1 hour")
+
+    # One (dimension, item) row per event and tracked dimension, exploded from a
+    # single scan of the events (a union would plan the upstream once per dimension)
+    dimension_items = array(*[
+        struct(lit(name).alias("dimension"), col(path).cast("string").alias("item"))
+        for name, path in heavy_hitters_config["dimensions"].items()
+    ])
+    items_df = events_df.select(
+        explode(dimension_items).alias("dimension_item"),
+        window("timestamp", window_duration).alias("window"),
+        col("timestamp")
+    ).select(
+        "dimension_item.dimension", "dimension_item.item", "window", "timestamp",
+        expr("unix_millis(window.end)").alias("window_end_ms")
+    ).filter(col("item").isNotNull())
+
+    return items_df.groupBy(
+        "dimension", col("window.start").alias("window_start"), col("window.end").alias("window_end")
+    ).applyInPandasWithState(
+        heavy_hitters_state_func(
+            top_n=heavy_hitters_config.get("top_n", 20),
+            epsilon=heavy_hitters_config.get("epsilon", 0.001),
+            delta=heavy_hitters_config.get("delta", 0.01),
+            capacity=heavy_hitters_config.get("capacity", 200),
+        ),
+        outputStructType=HEAVY_HITTERS_SCHEMA,
+        stateStructType=HEAVY_HITTERS_STATE_SCHEMA,
+        outputMode="append",
+        timeoutConf=GroupStateTimeout.EventTimeTimeout,
+    )
\ No newline at end of file
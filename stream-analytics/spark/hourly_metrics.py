@@ -0,0 +1,146 @@
+"""
+Streaming Hourly Metrics
+
+This module keeps the PostgreSQL hourly_metrics table up to date from the
+stream. Each micro-batch is reduced to per-hour partial aggregates (event
+and purchase counts, revenue and an HLL sketch of user ids), which are then
+folded into the existing rows: counts are added and sketches are merged,
+so unique_users is maintained without rescanning user_activity.
+
+Rows the Airflow DAG backfilled from user_activity while the stream was
+behind are marked as such, and the stream replaces them instead of adding
+to them.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+import psycopg2
+from pyspark.sql.functions import col, count, date_trunc, expr, lit, sum, when, coalesce
+
+from postgres_sink import claim_batch, postgres_connection_args, streaming_query_id
+from sketches import DEFAULT_LG_CONFIG_K, estimate_distinct, merge_hll_sketches, user_sketch_agg
+
+logger = logging.getLogger(__name__)
+
+UPSERT_HOURLY_METRICS = """
+    INSERT INTO hourly_metrics (
+        hour_timestamp,
+        total_events,
+        unique_users,
+        purchase_count,
+        revenue,
+        user_sketch,
+        backfilled,
+        updated_at
+    ) VALUES (%s, %s, %s, %s, %s, %s, FALSE, NOW())
+    ON CONFLICT (hour_timestamp) DO UPDATE SET
+        total_events = EXCLUDED.total_events
+            + CASE WHEN hourly_metrics.backfilled THEN 0 ELSE hourly_metrics.total_events END,
+        unique_users = EXCLUDED.unique_users,
+        purchase_count = EXCLUDED.purchase_count
+            + CASE WHEN hourly_metrics.backfilled THEN 0 ELSE hourly_metrics.purchase_count END,
+        revenue = EXCLUDED.revenue
+            + CASE WHEN hourly_metrics.backfilled THEN 0 ELSE hourly_metrics.revenue END,
+        user_sketch = EXCLUDED.user_sketch,
+        backfilled = FALSE,
+        updated_at = NOW()
+"""
+
+
+def _utc_hour(epoch_seconds: int) -> datetime:
+    """Convert an epoch hour to the naive UTC timestamp stored in PostgreSQL."""
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+class HourlyMetricsSink:
+    """foreachBatch sink that folds per-batch hourly partial aggregates into hourly_metrics."""
+
+    def __init__(self, postgres_config: Dict[str, Any], sink_name: str = "hourly_metrics",
+                 lg_config_k: int = DEFAULT_LG_CONFIG_K):
+        """
+        Initialize the sink.
+
+        Args:
+            postgres_config: The sinks.postgres section of sources.yaml
+            sink_name: Name under which streaming_batch_commits records the last applied batch
+            lg_config_k: Precision of the user id HLL sketches
+        """
+        self.connection_args = postgres_connection_args(postgres_config)
+        self.sink_name = sink_name
+        self.lg_config_k = lg_config_k
+
+    def partial_aggregates(self, batch_df):
+        """Reduce a micro-batch to one partial aggregate row per event hour."""
+        is_purchase = col("event_type") == "purchase"
+        return batch_df.groupBy(
+            date_trunc("hour", col("timestamp")).alias("hour")
+        ).agg(
+            count(lit(1)).alias("total_events"),
+            count(when(is_purchase, True)).alias("purchase_count"),
+            coalesce(sum(when(is_purchase, col("quantity") * col("product_price"))), lit(0.0)).alias("revenue"),
+            user_sketch_agg(self.lg_config_k)
+        ).select(
+            expr("unix_seconds(hour)").alias("hour_epoch"),
+            "total_events", "purchase_count", "revenue", "user_sketch"
+        )
+
+    def __call__(self, batch_df, batch_id: int) -> None:
+        """Fold one micro-batch into hourly_metrics exactly once."""
+        partials = self.partial_aggregates(batch_df.filter(col("timestamp").isNotNull())).collect()
+        if not partials:
+            return
+        query_id = streaming_query_id(batch_df)
+
+        connection = psycopg2.connect(**self.connection_args)
+        try:
+            with connection.cursor() as cursor:
+                # Skip batches that were already applied before a restart
+                if not claim_batch(cursor, self.sink_name, query_id, batch_id):
+                    logger.info(f"Batch {batch_id} already applied to hourly_metrics, skipping")
+                    connection.rollback()
+                    return
+
+                # Backfilled rows are replaced, so their (absent) sketches are not merged
+                hours = [_utc_hour(row.hour_epoch) for row in partials]
+                cursor.execute(
+                    "SELECT hour_timestamp, user_sketch FROM hourly_metrics "
+                    "WHERE hour_timestamp = ANY(%s) AND NOT backfilled FOR UPDATE",
+                    (hours,)
+                )
+                existing_sketches = {row[0]: row[1] for row in cursor.fetchall()}
+
+                for hour, partial in zip(hours, partials):
+                    sketch = merge_hll_sketches(
+                        [existing_sketches.get(hour), partial.user_sketch],
+                        lg_max_k=self.lg_config_k
+                    )
+                    cursor.execute(UPSERT_HOURLY_METRICS, (
+                        hour,
+                        partial.total_events,
+                        estimate_distinct(sketch),
+                        partial.purchase_count,
+                        partial.revenue,
+                        psycopg2.Binary(sketch) if sketch is not None else None,
+                    ))
+
+            connection.commit()
+            logger.info(f"Folded batch {batch_id} into hourly_metrics for {len(hours)} hour(s)")
+
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+
+def create_hourly_metrics_sink(postgres_config: Dict[str, Any],
+                               lg_config_k: int = DEFAULT_LG_CONFIG_K) -> HourlyMetricsSink:
+    """Create the hourly_metrics sink from configuration."""
+    table_config = postgres_config["tables"]["hourly_metrics"]
+    return HourlyMetricsSink(
+        postgres_config,
+        sink_name=table_config.get("sink_name", "hourly_metrics"),
+        lg_config_k=lg_config_k,
+    )
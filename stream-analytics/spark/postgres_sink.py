@@ -0,0 +1,403 @@
+"""
+PostgreSQL Streaming Sink
+
+This module loads micro-batches into PostgreSQL using binary COPY. Each
+executor streams its partition into an unlogged staging table, then the
+driver merges the staged batch into the target table in one transaction.
+The merge is keyed on the table's primary key so replayed batches are
+idempotent.
+
+It also provides a sink that runs a configured SQL query over each
+micro-batch and accumulates the (small) result into a keyed table. Such
+non-idempotent sinks record the last batch they applied per streaming query
+in streaming_batch_commits, in the same transaction as their writes, and
+skip batches a restarted query replays.
+"""
+
+import io
+import re
+import struct
+import logging
+from functools import partial
+from typing import Any, Dict, Iterable, List, Tuple
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# PGCOPY binary format framing
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_HEADER = COPY_SIGNATURE + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+NULL_FIELD = struct.pack(">i", -1)
+
+# Microseconds between the Unix epoch and the PostgreSQL epoch (2000-01-01)
+POSTGRES_EPOCH_OFFSET_MICROS = 946684800 * 1000000
+
+# Local property Spark sets to the id of the streaming query running a micro-batch
+QUERY_ID_PROPERTY = "sql.streaming.queryId"
+
+# Days the last applied batch of a query that no longer runs is kept
+BATCH_COMMIT_RETENTION_DAYS = 7
+
+# Record a batch as applied, unless the query already applied it or a later batch
+CLAIM_BATCH = """
+    INSERT INTO streaming_batch_commits (sink_name, query_id, batch_id, committed_at)
+    VALUES (%s, %s, %s, NOW())
+    ON CONFLICT (sink_name, query_id) DO UPDATE SET
+        batch_id = EXCLUDED.batch_id,
+        committed_at = NOW()
+    WHERE streaming_batch_commits.batch_id < EXCLUDED.batch_id
+"""
+
+PRUNE_BATCH_COMMITS = """
+    DELETE FROM streaming_batch_commits
+    WHERE sink_name = %s AND query_id <> %s AND committed_at < NOW() - %s * INTERVAL '1 day'
+"""
+
+# Columns staged for user_activity, in COPY order, with their binary encoding.
+# Timestamps are staged as epoch microseconds and custom_attributes as JSON text.
+USER_ACTIVITY_COLUMNS = [
+    ("event_id", "text"),
+    ("user_id", "text"),
+    ("session_id", "text"),
+    ("timestamp", "timestamp"),
+    ("event_type", "text"),
+    ("page_url", "text"),
+    ("referrer_url", "text"),
+    ("device_type", "text"),
+    ("browser", "text"),
+    ("os", "text"),
+    ("screen_resolution", "text"),
+    ("ip_address", "text"),
+    ("country", "text"),
+    ("city", "text"),
+    ("latitude", "float8"),
+    ("longitude", "float8"),
+    ("product_id", "text"),
+    ("product_category", "text"),
+    ("product_price", "float8"),
+    ("quantity", "int4"),
+    ("custom_attributes", "text"),
+]
+
+# Spark expressions producing the staged user_activity columns
+USER_ACTIVITY_SELECT = [
+    "event_id",
+    "user_id",
+    "session_id",
+    "unix_micros(timestamp) AS timestamp",
+    "event_type",
+    "page_url",
+    "referrer_url",
+    "device_info.device_type AS device_type",
+    "device_info.browser AS browser",
+    "device_info.os AS os",
+    "device_info.screen_resolution AS screen_resolution",
+    "geo_data.ip_address AS ip_address",
+    "geo_data.country AS country",
+    "geo_data.city AS city",
+    "geo_data.latitude AS latitude",
+    "geo_data.longitude AS longitude",
+    "product_id",
+    "product_category",
+    "product_price",
+    "quantity",
+    "to_json(custom_attributes) AS custom_attributes",
+]
+
+
+def _encode_field(value: Any, field_type: str) -> bytes:
+    """Encode a single value in PostgreSQL binary COPY format."""
+    if value is None:
+        return NULL_FIELD
+
+    if field_type == "text":
+        data = str(value).encode("utf-8")
+    elif field_type == "timestamp":
+        data = struct.pack(">q", int(value) - POSTGRES_EPOCH_OFFSET_MICROS)
+    elif field_type == "float8":
+        data = struct.pack(">d", float(value))
+    elif field_type == "int4":
+        data = struct.pack(">i", int(value))
+    elif field_type == "int8":
+        data = struct.pack(">q", int(value))
+    else:
+        raise ValueError(f"Unsupported binary COPY type: {field_type}")
+
+    return struct.pack(">i", len(data)) + data
+
+
+def encode_copy_binary(rows: Iterable[Tuple], field_types: List[str]) -> bytes:
+    """
+    Encode rows as a complete PostgreSQL binary COPY payload.
+
+    Args:
+        rows: Tuples of values, in column order
+        field_types: Binary encoding of each column
+
+    Returns:
+        bytes: Payload for COPY ... FROM STDIN WITH (FORMAT binary)
+    """
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    field_count = struct.pack(">h", len(field_types))
+
+    for row in rows:
+        buffer.write(field_count)
+        for value, field_type in zip(row, field_types):
+            buffer.write(_encode_field(value, field_type))
+
+    buffer.write(COPY_TRAILER)
+    return buffer.getvalue()
+
+
+def parse_jdbc_url(jdbc_url: str) -> Dict[str, Any]:
+    """Convert a jdbc:postgresql:// URL into psycopg2 connection arguments."""
+    match = re.match(r"jdbc:postgresql://([^:/]+)(?::(\d+))?/([^?]+)", jdbc_url)
+    if not match:
+        raise ValueError(f"Invalid PostgreSQL JDBC URL: {jdbc_url}")
+
+    host, port, dbname = match.groups()
+    return {"host": host, "port": int(port or 5432), "dbname": dbname}
+
+
+def postgres_connection_args(postgres_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Build psycopg2 connection arguments from the sinks.postgres configuration."""
+    connection_args = parse_jdbc_url(postgres_config["jdbc_url"])
+    connection_args.update({
+        "user": postgres_config["user"],
+        "password": postgres_config["password"],
+    })
+    return connection_args
+
+
+def _copy_partition(rows: Iterable, connection_args: Dict[str, Any], staging_table: str,
+                    columns: List[str], field_types: List[str], batch_id: int,
+                    rows_per_copy: int) -> None:
+    """Stream one partition into the staging table with binary COPY (runs on executors)."""
+    column_list = ", ".join(f'"{name}"' for name in columns)
+    copy_sql = f"COPY {staging_table} (batch_id, {column_list}) FROM STDIN WITH (FORMAT binary)"
+    types = ["int8"] + field_types
+
+    connection = psycopg2.connect(**connection_args)
+    try:
+        with connection.cursor() as cursor:
+            chunk = []
+            for row in rows:
+                chunk.append((batch_id,) + tuple(row))
+                if len(chunk) >= rows_per_copy:
+                    cursor.copy_expert(copy_sql, io.BytesIO(encode_copy_binary(chunk, types)))
+                    chunk = []
+            if chunk:
+                cursor.copy_expert(copy_sql, io.BytesIO(encode_copy_binary(chunk, types)))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+class PostgresCopySink:
+    """foreachBatch sink that bulk loads micro-batches via binary COPY and merges on a key."""
+
+    def __init__(self, postgres_config: Dict[str, Any], table: str, staging_table: str,
+                 key: str, columns: List[Tuple[str, str]], select_exprs: List[str],
+                 json_columns: Tuple[str, ...] = (), rows_per_copy: int = 50000):
+        """
+        Initialize the sink.
+
+        Args:
+            postgres_config: The sinks.postgres section of sources.yaml
+            table: Target table
+            staging_table: Unlogged staging table with a batch_id column
+            key: Column the merge deduplicates on
+            columns: (name, binary type) of each staged column, in COPY order
+            select_exprs: Spark SQL expressions producing the staged columns
+            json_columns: Columns staged as text and cast to JSONB on merge
+            rows_per_copy: Maximum rows per COPY statement on an executor
+        """
+        self.connection_args = postgres_connection_args(postgres_config)
+        self.table = table
+        self.staging_table = staging_table
+        self.key = key
+        self.columns = [name for name, _ in columns]
+        self.field_types = [field_type for _, field_type in columns]
+        self.select_exprs = select_exprs
+        self.json_columns = json_columns
+        self.rows_per_copy = rows_per_copy
+
+    def _merge_sql(self) -> str:
+        """Build the idempotent merge from the staging table into the target table."""
+        column_list = ", ".join(f'"{name}"' for name in self.columns)
+        select_list = ", ".join(
+            f'"{name}"::jsonb' if name in self.json_columns else f'"{name}"'
+            for name in self.columns
+        )
+        return f"""
+            INSERT INTO {self.table} ({column_list})
+            SELECT DISTINCT ON ("{self.key}") {select_list}
+            FROM {self.staging_table}
+            WHERE batch_id = %s
+            ORDER BY "{self.key}"
+            ON CONFLICT ("{self.key}") DO NOTHING
+        """
+
+    def __call__(self, batch_df, batch_id: int) -> None:
+        """Load one micro-batch into PostgreSQL."""
+        staged_df = batch_df.filter(f"{self.key} IS NOT NULL").selectExpr(*self.select_exprs)
+
+        connection = psycopg2.connect(**self.connection_args)
+        try:
+            # Clear anything left behind by a failed attempt at this batch
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.staging_table} WHERE batch_id = %s", (batch_id,))
+            connection.commit()
+
+            staged_df.foreachPartition(partial(
+                _copy_partition,
+                connection_args=self.connection_args,
+                staging_table=self.staging_table,
+                columns=self.columns,
+                field_types=self.field_types,
+                batch_id=batch_id,
+                rows_per_copy=self.rows_per_copy,
+            ))
+
+            with connection.cursor() as cursor:
+                cursor.execute(self._merge_sql(), (batch_id,))
+                inserted = cursor.rowcount
+                cursor.execute(f"DELETE FROM {self.staging_table} WHERE batch_id = %s", (batch_id,))
+            connection.commit()
+
+            logger.info(f"Merged batch {batch_id} into {self.table}: {inserted} new rows")
+
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+
+def create_user_activity_sink(postgres_config: Dict[str, Any]) -> PostgresCopySink:
+    """Create the COPY sink for the user_activity table from configuration."""
+    table_config = postgres_config["tables"]["user_activity"]
+    return PostgresCopySink(
+        postgres_config,
+        table="user_activity",
+        staging_table=table_config.get("staging_table", "user_activity_staging"),
+        key=table_config.get("keys", ["event_id"])[0],
+        columns=USER_ACTIVITY_COLUMNS,
+        select_exprs=USER_ACTIVITY_SELECT,
+        json_columns=("custom_attributes",),
+        rows_per_copy=table_config.get("rows_per_copy", 50000),
+    )
+
+
+def streaming_query_id(batch_df) -> str:
+    """
+    Id of the streaming query a micro-batch belongs to.
+
+    The id is stored in the query's checkpoint: it survives restarts, and a
+    reset or moved checkpoint starts a query with a new id whose batch ids
+    start again at 0.
+    """
+    query_id = batch_df.sparkSession.sparkContext.getLocalProperty(QUERY_ID_PROPERTY)
+    if query_id is None:
+        raise RuntimeError("Micro-batch sinks must run in foreachBatch of a streaming query")
+    return query_id
+
+
+def claim_batch(cursor, sink_name: str, query_id: str, batch_id: int) -> bool:
+    """
+    Record a micro-batch as applied by a sink, in the sink's transaction.
+
+    Only the last applied batch id is kept per sink and query, and rows of
+    queries that stopped committing batches are pruned.
+
+    Args:
+        cursor: Cursor of the transaction that applies the batch
+        sink_name: Name of the sink
+        query_id: Id of the streaming query, from streaming_query_id
+        batch_id: Id of the micro-batch
+
+    Returns:
+        bool: False if the query already applied this batch (or a later one)
+    """
+    cursor.execute(CLAIM_BATCH, (sink_name, query_id, batch_id))
+    if cursor.rowcount == 0:
+        return False
+
+    cursor.execute(PRUNE_BATCH_COMMITS, (sink_name, query_id, BATCH_COMMIT_RETENTION_DAYS))
+    return True
+
+
+class PostgresQuerySink:
+    """foreachBatch sink that runs a SQL query over each micro-batch and upserts the result."""
+
+    def __init__(self, postgres_config: Dict[str, Any], table: str, query: str, view_name: str,
+                 keys: List[str], write_mode: str = "upsert"):
+        """
+        Initialize the sink.
+
+        Args:
+            postgres_config: The sinks.postgres section of sources.yaml
+            table: Target table
+            query: Spark SQL query over the micro-batch, registered as view_name
+            view_name: Temporary view name the query reads the micro-batch from
+            keys: Key columns of the target table
+            write_mode: 'upsert' adds each batch's values to the existing row for
+                the same keys; 'append' inserts the rows as they are
+        """
+        if write_mode not in ("upsert", "append"):
+            raise ValueError(f"Unsupported write mode for {table}: {write_mode}")
+
+        self.connection_args = postgres_connection_args(postgres_config)
+        self.table = table
+        self.query = query
+        self.view_name = view_name
+        self.keys = keys
+        self.write_mode = write_mode
+
+    def _insert_sql(self, columns: List[str]) -> str:
+        """Build the insert (or additive upsert) statement for the query result."""
+        column_list = ", ".join(f'"{name}"' for name in columns)
+        sql = f"INSERT INTO {self.table} ({column_list}) VALUES %s"
+
+        if self.write_mode == "upsert":
+            key_list = ", ".join(f'"{name}"' for name in self.keys)
+            updates = ", ".join(
+                f'"{name}" = {self.table}."{name}" + EXCLUDED."{name}"'
+                for name in columns if name not in self.keys
+            )
+            sql += f" ON CONFLICT ({key_list}) DO UPDATE SET {updates}"
+
+        return sql
+
+    def __call__(self, batch_df, batch_id: int) -> None:
+        """Run the query over one micro-batch and write the result exactly once."""
+        batch_df.createOrReplaceTempView(self.view_name)
+        result_df = batch_df.sparkSession.sql(self.query)
+        rows = [tuple(row) for row in result_df.collect()]
+        if not rows:
+            return
+        query_id = streaming_query_id(batch_df)
+
+        connection = psycopg2.connect(**self.connection_args)
+        try:
+            with connection.cursor() as cursor:
+                # Skip batches that were already applied before a restart
+                if not claim_batch(cursor, self.table, query_id, batch_id):
+                    logger.info(f"Batch {batch_id} already applied to {self.table}, skipping")
+                    connection.rollback()
+                    return
+
+                execute_values(cursor, self._insert_sql(result_df.columns), rows)
+
+            connection.commit()
+            logger.info(f"Wrote {len(rows)} rows from batch {batch_id} into {self.table}")
+
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
@@ -0,0 +1,210 @@
+"""
+Cascading Rollup Tiers
+
+This module maintains time-bucketed rollups of the user activity stream in
+tiers of increasing grain (by default 1 minute, 1 hour and 1 day). Only the
+finest tier aggregates raw events; every coarser tier is fed incrementally
+from the Delta change data feed of the tier below it, so raw events are
+aggregated once and dashboards can query the coarsest tier that covers the
+requested range.
+
+All tiers of a family share one schema: the family's dimensions, the
+`window` struct and mergeable measures (counts, sums and an HLL sketch of
+user ids), so any tier can be rolled up into the next one.
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, List
+
+from delta.tables import DeltaTable
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import coalesce, col, count, expr, lit, sum, when, window
+
+from sketches import DEFAULT_LG_CONFIG_K, user_sketch_agg
+from checkpoints import configure_query
+
+logger = logging.getLogger(__name__)
+
+# Additive measures of every tier
+ROLLUP_MEASURES = [
+    "event_count", "view_count", "add_to_cart_count", "purchase_count", "revenue", "purchase_value_sum"
+]
+
+# Change data feed rows that retract a previously written row
+RETRACTING_CHANGES = ("delete", "update_preimage")
+
+DEFAULT_TIERS = [
+    {"name": "1m", "window": "1 minute"},
+    {"name": "1h", "window": "1 hour", "watermark_delay": "10 minutes"},
+    {"name": "1d", "window": "1 day", "watermark_delay": "1 hour"},
+]
+
+# Seconds per unit of a window duration such as '1 hour'
+DURATION_UNITS = {"minute": 60, "hour": 3600, "day": 86400}
+
+
+def tier_seconds(window_duration: str) -> int:
+    """Length in seconds of a window duration such as '1 minute' or '1 day'."""
+    amount, unit = window_duration.split()
+    return int(amount) * DURATION_UNITS[unit.rstrip("s")]
+
+
+def coarsest_tier(tiers: List[Dict[str, Any]], start: datetime, end: datetime) -> Dict[str, Any]:
+    """
+    Pick the coarsest tier whose windows exactly cover a time range.
+
+    Args:
+        tiers: Configured tiers, finest first
+        start: Start of the range (inclusive, UTC)
+        end: End of the range (exclusive, UTC)
+
+    Returns:
+        Dict[str, Any]: The tier to query; the finest tier if none aligns
+    """
+    for tier in reversed(tiers):
+        seconds = tier_seconds(tier["window"])
+        bounds = [int((t - datetime(1970, 1, 1, tzinfo=t.tzinfo)).total_seconds()) for t in (start, end)]
+        if all(bound % seconds == 0 for bound in bounds):
+            return tier
+    return tiers[0]
+
+
+def dimension_columns(dimensions: List[str]) -> List:
+    """Columns for the configured dimension paths, named after their last field."""
+    return [col(dimension).alias(dimension.split(".")[-1]) for dimension in dimensions]
+
+
+def minute_tier(events_df: DataFrame, dimensions: List[str], window_duration: str,
+                lg_config_k: int = DEFAULT_LG_CONFIG_K) -> DataFrame:
+    """
+    Aggregate watermarked events into the finest tier of a family.
+
+    Args:
+        events_df: Deduplicated, watermarked user activity events
+        dimensions: Dimension column paths; events without the first one are skipped
+        window_duration: Grain of the tier, e.g. '1 minute'
+        lg_config_k: Precision of the user id HLL sketches
+
+    Returns:
+        DataFrame: One row per dimension combination and window
+    """
+    is_purchase = col("event_type") == "purchase"
+    return events_df.filter(
+        col(dimensions[0]).isNotNull()
+    ).groupBy(
+        *dimension_columns(dimensions),
+        window("timestamp", window_duration)
+    ).agg(
+        count("event_id").alias("event_count"),
+        count(when(col("event_type") == "view", True)).alias("view_count"),
+        count(when(col("event_type") == "add_to_cart", True)).alias("add_to_cart_count"),
+        count(when(is_purchase, True)).alias("purchase_count"),
+        coalesce(sum(when(is_purchase, col("quantity") * col("product_price"))), lit(0.0)).alias("revenue"),
+        coalesce(sum(when(is_purchase, col("product_price"))), lit(0.0)).alias("purchase_value_sum"),
+        user_sketch_agg(lg_config_k)
+    )
+
+
+def coarser_tier(changes_df: DataFrame, dimensions: List[str], window_duration: str,
+                 watermark_delay: str) -> DataFrame:
+    """
+    Roll the change feed of a finer tier up into a coarser window.
+
+    Inserted and post-update rows add to the measures, deleted and pre-update
+    rows subtract from them, so corrections to the finer tier that arrive
+    within the watermark are reconciled. Sketches can only be merged, so
+    retracted rows do not shrink the distinct user estimate.
+
+    Args:
+        changes_df: Change data feed of the finer tier
+        dimensions: Dimension column names of the family
+        window_duration: Grain of this tier, e.g. '1 hour'
+        watermark_delay: How late finer-tier rows may arrive
+
+    Returns:
+        DataFrame: One row per dimension combination and window of this tier
+    """
+    retracted = col("_change_type").isin(*RETRACTING_CHANGES)
+    sign = when(retracted, lit(-1)).otherwise(lit(1))
+
+    return changes_df.withColumn(
+        "window_start", col("window.start")
+    ).withWatermark(
+        "window_start", watermark_delay
+    ).groupBy(
+        *[col(name) for name in dimensions],
+        window("window_start", window_duration)
+    ).agg(
+        *[sum(col(measure) * sign).alias(measure) for measure in ROLLUP_MEASURES],
+        expr(f"hll_union_agg(CASE WHEN _change_type IN {RETRACTING_CHANGES} "
+             f"THEN NULL ELSE user_sketch END, true)").alias("user_sketch")
+    )
+
+
+def ensure_tier_table(spark, path: str, schema) -> None:
+    """Create an empty tier table with the change data feed enabled if it does not exist yet."""
+    (
+        DeltaTable.createIfNotExists(spark)
+        .location(path)
+        .addColumns(schema)
+        .property("delta.enableChangeDataFeed", "true")
+        .execute()
+    )
+
+
+def start_rollup_queries(spark, events_df: DataFrame, config: Dict[str, Any]) -> List:
+    """
+    Start the streaming queries maintaining every configured rollup family and tier.
+
+    Args:
+        spark: Active Spark session
+        events_df: Deduplicated, watermarked user activity events
+        config: The full sources.yaml configuration
+
+    Returns:
+        List: The started streaming queries
+    """
+    processing_config = config.get("processing", {})
+    rollup_config = processing_config.get("rollups", {})
+    lg_config_k = processing_config.get("sketches", {}).get("lg_config_k", DEFAULT_LG_CONFIG_K)
+    base_path = rollup_config["base_path"].rstrip("/")
+    checkpoint_base = rollup_config["checkpoint_base"].rstrip("/")
+    tiers = rollup_config.get("tiers", DEFAULT_TIERS)
+
+    queries = []
+    for family, family_config in rollup_config.get("families", {}).items():
+        dimensions = family_config["dimensions"]
+        dimension_names = [dimension.split(".")[-1] for dimension in dimensions]
+
+        tier_df = minute_tier(events_df, dimensions, tiers[0]["window"], lg_config_k)
+        previous_path = None
+
+        for tier in tiers:
+            path = f"{base_path}/{family}/{tier['name']}"
+            if previous_path is not None:
+                changes_df = (
+                    spark.readStream
+                    .format("delta")
+                    .option("readChangeFeed", "true")
+                    .load(previous_path)
+                )
+                tier_df = coarser_tier(
+                    changes_df, dimension_names, tier["window"], tier.get("watermark_delay", "10 minutes")
+                )
+
+            # The next tier reads this table's change feed, so it must exist first
+            ensure_tier_table(spark, path, tier_df.schema)
+
+            query_name = f"rollup_{family}_{tier['name']}"
+            queries.append(configure_query(
+                tier_df.writeStream
+                .queryName(query_name)
+                .format("delta")
+                .outputMode("append"),
+                config, query_name, f"{checkpoint_base}/{family}/{tier['name']}", sink_format="delta"
+            ).start(path))
+            logger.info(f"Started rollup tier {tier['name']} of {family} at {path}")
+            previous_path = path
+
+    return queries
\ No newline at end of file
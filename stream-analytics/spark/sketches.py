@@ -0,0 +1,73 @@
+"""
+Distinct-Count Sketches
+
+Helpers for the HyperLogLog sketches stored alongside aggregated outputs.
+Sketches use the Apache DataSketches HLL binary format, which is what
+Spark's hll_sketch_agg produces, so sketches built by the stream can be
+merged on the driver or in any other DataSketches client.
+
+Distinct counts over coarser periods or fewer dimensions are rolled up by
+merging the stored sketches, e.g. daily unique users per country from the
+hourly geo output:
+
+    rollup_by_period(spark.read.format("delta").load(geo_path), "day", ["country"])
+
+Sketches are merged on the driver with merge_hll_sketches and
+estimate_distinct from utils/sketches.py, which also serve the PostgreSQL
+rollups. The utils package must be importable: the deployments put the
+project root on the driver's PYTHONPATH, and ship_executor_modules ships the
+package to the executors.
+"""
+
+from typing import Iterable, List
+
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import col, date_trunc, expr
+
+from utils.sketches import DEFAULT_LG_CONFIG_K, estimate_distinct, merge_hll_sketches
+
+
+def user_sketch_agg(lg_config_k: int = DEFAULT_LG_CONFIG_K, column: str = "user_id"):
+    """Aggregate expression building the HLL sketch of a column, named user_sketch."""
+    return expr(f"hll_sketch_agg({column}, {lg_config_k})").alias("user_sketch")
+
+
+def rollup_distinct(df: DataFrame, group_cols: List[str], sketch_col: str = "user_sketch",
+                    estimate_col: str = "unique_users") -> DataFrame:
+    """
+    Merge stored sketches over the given grouping and estimate distinct counts.
+
+    Args:
+        df: DataFrame with a sketch column
+        group_cols: Columns to keep; all other dimensions are merged away
+        sketch_col: Column holding the serialized sketches
+        estimate_col: Name of the distinct count estimate column
+
+    Returns:
+        DataFrame: One row per group with the merged sketch and its estimate
+    """
+    return df.groupBy(*group_cols).agg(
+        expr(f"hll_union_agg({sketch_col}, true)").alias(sketch_col)
+    ).withColumn(estimate_col, expr(f"hll_sketch_estimate({sketch_col})"))
+
+
+def rollup_by_period(df: DataFrame, period: str, dimensions: Iterable[str] = (),
+                     time_col: str = "window.start", sketch_col: str = "user_sketch") -> DataFrame:
+    """
+    Roll windowed sketches up to a coarser period.
+
+    Args:
+        df: Windowed output with a sketch column (sessions, user behavior, geo)
+        period: Truncation unit understood by date_trunc ('hour', 'day', 'week', 'month')
+        dimensions: Dimensions to keep alongside the period
+        time_col: Column holding the start of each window
+        sketch_col: Column holding the serialized sketches
+
+    Returns:
+        DataFrame: period_start, the dimensions, the merged sketch and unique_users
+    """
+    return rollup_distinct(
+        df.withColumn("period_start", date_trunc(period, col(time_col))),
+        ["period_start", *dimensions],
+        sketch_col=sketch_col
+    )
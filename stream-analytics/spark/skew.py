@@ -0,0 +1,244 @@
+"""
+Skew-Aware Aggregation
+
+A few very hot keys (popular products, bot users) can put most of a windowed
+aggregation's rows into one shuffle partition, and that one task then sets
+the duration of every micro-batch. This module spreads hot keys with a
+two-phase aggregation:
+
+1. A detector query counts keys in each micro-batch and keeps the keys whose
+   share of recent batches exceeds a threshold in a small Delta table,
+   together with the number of salt buckets each one needs. The table is
+   rewritten only when the hot keys or their buckets change.
+2. Salted aggregations join the stream with that table (re-read every
+   micro-batch), add a salt to rows of hot keys only, pre-aggregate by
+   (key, window, salt) and merge the partial aggregates by (key, window).
+
+The detector also reports how unevenly rows fall into shuffle partitions,
+the load of the aggregation tasks, before salting: rows are assigned to
+partitions by the aggregation's own grouping keys (key columns and window)
+with Spark's hash partitioning.
+"""
+
+import math
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+from delta.tables import DeltaTable
+from pyspark.sql import DataFrame
+from pyspark.sql.functions import (
+    broadcast, col, count, desc, hash, lit, pmod, when, window, window_time, xxhash64
+)
+from pyspark.sql.types import DoubleType, IntegerType, LongType, StringType, StructField, StructType, TimestampType
+
+from streaming_metrics import HOT_KEY_ROW_SHARE, HOT_KEYS, SHUFFLE_SKEW_RATIO
+from checkpoints import configure_query
+
+logger = logging.getLogger(__name__)
+
+HOT_KEYS_SCHEMA = StructType([
+    StructField("query", StringType(), False),
+    StructField("key", StringType(), False),
+    StructField("salt_buckets", IntegerType(), False),
+    StructField("share", DoubleType(), False),
+    StructField("last_seen_batch", LongType(), False),
+    StructField("updated_at", TimestampType(), False),
+])
+
+
+def salted_queries(skew_config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """The per-query skew settings of the queries configured for salted aggregation."""
+    return {
+        query: query_config
+        for query, query_config in skew_config.get("queries", {}).items()
+        if query_config.get("mode", "standard") == "salted"
+    }
+
+
+def ensure_hot_keys_table(spark, path: str) -> None:
+    """Create the empty hot keys table if it does not exist yet."""
+    DeltaTable.createIfNotExists(spark).location(path).addColumns(HOT_KEYS_SCHEMA).execute()
+
+
+def salted_aggregate(events_df: DataFrame, query: str, key: str, group_cols: List[str],
+                     window_duration: str, partial_aggs: List, merge_aggs: List,
+                     hot_keys_path: str) -> DataFrame:
+    """
+    Aggregate per key and window in two phases, salting only the hot keys.
+
+    Args:
+        events_df: Watermarked user activity events
+        query: Name of the query in the hot keys table
+        key: Column whose hot values are salted
+        group_cols: Grouping column paths, including the key
+        window_duration: Window of the aggregation
+        partial_aggs: Aggregations computed per (group, window, salt)
+        merge_aggs: Aggregations merging the partials per (group, window)
+        hot_keys_path: Path of the hot keys table
+
+    Returns:
+        DataFrame: One row per group and window, as the single-phase aggregation
+    """
+    spark = events_df.sparkSession
+    hot_keys = spark.read.format("delta").load(hot_keys_path).filter(
+        col("query") == query
+    ).select(
+        col("key").alias("hot_key"), "salt_buckets"
+    )
+
+    # Rows of hot keys get a salt in [0, salt_buckets), all other rows salt 0
+    salted_df = events_df.join(
+        broadcast(hot_keys), col(key).cast("string") == col("hot_key"), "left"
+    ).withColumn(
+        "salt",
+        when(col("salt_buckets").isNotNull(), pmod(xxhash64("event_id"), col("salt_buckets"))).otherwise(lit(0))
+    )
+
+    group_names = [group_col.split(".")[-1] for group_col in group_cols]
+    partial_df = salted_df.groupBy(
+        *group_cols, window("timestamp", window_duration), "salt"
+    ).agg(*partial_aggs)
+
+    return partial_df.groupBy(
+        *group_names, window(window_time("window"), window_duration).alias("window")
+    ).agg(*merge_aggs)
+
+
+class HotKeyDetector:
+    """foreachBatch sink that maintains the hot keys table and reports shuffle skew."""
+
+    def __init__(self, skew_config: Dict[str, Any], groupings: Dict[str, Tuple[List[str], str]]):
+        """
+        Initialize the detector.
+
+        Args:
+            skew_config: The processing.skew section of sources.yaml
+            groupings: Grouping column paths and window duration of each salted query's aggregation
+        """
+        detection_config = skew_config.get("detection", {})
+        self.queries = salted_queries(skew_config)
+        self.groupings = groupings
+        self.hot_keys_path = skew_config["hot_keys_path"]
+        self.hot_key_share = detection_config.get("hot_key_share", 0.01)
+        self.max_hot_keys = detection_config.get("max_hot_keys", 100)
+        self.max_salt_buckets = detection_config.get("max_salt_buckets", 16)
+        self.ttl_batches = detection_config.get("ttl_batches", 20)
+
+        # Hot key rows by (query, key), loaded from the table on the first batch,
+        # and the (query, key, salt_buckets) last written to the table
+        self.hot_keys = None
+        self.written: Set[Tuple[str, str, int]] = set()
+
+    def _salt_buckets(self, share: float, shuffle_partitions: int) -> int:
+        """Buckets needed to bring a key's rows down to one shuffle partition's fair share."""
+        return max(2, min(self.max_salt_buckets, int(math.ceil(share * shuffle_partitions))))
+
+    def _hot_set(self) -> Set[Tuple[str, str, int]]:
+        """The hot keys and their salt buckets, which the salted aggregations read."""
+        return {(query, key, salt_buckets) for query, key, salt_buckets, *_ in self.hot_keys.values()}
+
+    def _partition_rows(self, batch_df, query: str, shuffle_partitions: int) -> List[int]:
+        """Rows per shuffle partition of the query's aggregation, i.e. the aggregation task input."""
+        group_cols, window_duration = self.groupings[query]
+        return [
+            row.rows for row in batch_df.filter(
+                col(self.queries[query]["key"]).isNotNull()
+            ).groupBy(
+                pmod(
+                    hash(*[col(group_col) for group_col in group_cols], window("timestamp", window_duration)),
+                    lit(shuffle_partitions)
+                ).alias("partition")
+            ).agg(count(lit(1)).alias("rows")).collect()
+        ]
+
+    def __call__(self, batch_df, batch_id: int) -> None:
+        """Detect hot keys in one micro-batch and update the hot keys table if they changed."""
+        spark = batch_df.sparkSession
+        shuffle_partitions = int(spark.conf.get("spark.sql.shuffle.partitions"))
+        batch_df = batch_df.persist()
+
+        try:
+            total = batch_df.count()
+            if total == 0:
+                return
+
+            if self.hot_keys is None:
+                self.hot_keys = {
+                    (row.query, row.key): tuple(row)
+                    for row in spark.read.format("delta").load(self.hot_keys_path).collect()
+                    if row.query in self.queries
+                }
+                self.written = self._hot_set()
+
+            # Expire keys not seen in the last ttl_batches batches (or seen by an earlier checkpoint)
+            self.hot_keys = {
+                hot_key: row for hot_key, row in self.hot_keys.items()
+                if batch_id - self.ttl_batches <= row[4] <= batch_id
+            }
+            now = datetime.utcnow()
+
+            for query, query_config in self.queries.items():
+                key_counts = batch_df.groupBy(
+                    col(query_config["key"]).cast("string").alias("key")
+                ).agg(count(lit(1)).alias("rows")).filter(col("key").isNotNull())
+
+                partition_rows = self._partition_rows(batch_df, query, shuffle_partitions)
+                mean_rows = sum(partition_rows) / float(shuffle_partitions)
+                SHUFFLE_SKEW_RATIO.labels(query=query).set(max(partition_rows) / mean_rows if partition_rows else 0.0)
+
+                hot_rows = key_counts.filter(
+                    col("rows") >= self.hot_key_share * total
+                ).orderBy(desc("rows")).limit(self.max_hot_keys).collect()
+
+                for row in hot_rows:
+                    # A key keeps its buckets while it stays hot, so small changes in
+                    # its share do not rewrite the table
+                    share = row.rows / float(total)
+                    salt_buckets = self._salt_buckets(share, shuffle_partitions)
+                    previous = self.hot_keys.get((query, row.key))
+                    if previous is not None:
+                        salt_buckets = max(salt_buckets, previous[2])
+                    self.hot_keys[(query, row.key)] = (query, row.key, salt_buckets, share, batch_id, now)
+
+                HOT_KEYS.labels(query=query).set(sum(1 for q, _ in self.hot_keys if q == query))
+                HOT_KEY_ROW_SHARE.labels(query=query).set(sum(row.rows for row in hot_rows) / float(total))
+
+            # Rewriting the table commits a Delta version and changes the salted joins,
+            # so it is only done when the hot keys or their buckets change
+            hot_set = self._hot_set()
+            if hot_set != self.written:
+                spark.createDataFrame(
+                    list(self.hot_keys.values()), HOT_KEYS_SCHEMA
+                ).write.format("delta").mode("overwrite").save(self.hot_keys_path)
+                self.written = hot_set
+                logger.info(f"Batch {batch_id}: {len(self.hot_keys)} hot keys across {len(self.queries)} queries")
+
+        finally:
+            batch_df.unpersist()
+
+
+def start_hot_key_detector(spark, events_df: DataFrame, config: Dict[str, Any],
+                           groupings: Dict[str, Tuple[List[str], str]]):
+    """
+    Start the query maintaining the hot keys table, if any query is salted.
+
+    Args:
+        spark: Active Spark session
+        events_df: Watermarked user activity events
+        config: The full sources.yaml configuration
+        groupings: Grouping column paths and window duration of each salted query's aggregation
+
+    Returns:
+        StreamingQuery: The detector query, or None if no query is salted
+    """
+    skew_config = config.get("processing", {}).get("skew", {})
+    if not salted_queries(skew_config):
+        return None
+
+    return configure_query(
+        events_df.writeStream
+        .queryName("hot_key_detector")
+        .foreachBatch(HotKeyDetector(skew_config, groupings)),
+        config, "hot_key_detector", skew_config["checkpoint_location"], stateful=False
+    ).start()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Multi-Source Stream Processor
+
+This Spark Streaming job builds the streaming queries for every Kafka
+source in sources.yaml (user_activity, iot_sensors, transactions) inside
+a single Spark application, so all sources share one Spark session and
+executor pool. Each source runs in its own FAIR scheduler pool.
+"""
+
+import os
+import sys
+
+from pyspark.sql.functions import col, from_json, year, month, day, hour
+from pyspark.sql.types import (
+    StructType, StructField, StringType, IntegerType,
+    DoubleType, BooleanType, TimestampType
+)
+
+from streaming_metrics import register_progress_listener
+from postgres_sink import PostgresQuerySink
+from attribution import start_attribution_query
+from user_features import start_user_features_query
+from checkpoints import apply_checkpoint_settings, configure_query
+from enrichment import stop_dimension_refresh
+from user_activity_processor import (
+    load_config, create_spark_session, ship_executor_modules, process_user_activity,
+    read_user_activity, parse_user_activity, deduplicate_events
+)
+
+# Define schema for IoT sensor data
+iot_sensor_schema = StructType([
+    StructField("sensor_id", StringType(), False),
+    StructField("timestamp", TimestampType(), False),
+    StructField("location", StringType(), False),
+    StructField("readings", StructType([
+        StructField("temperature", DoubleType(), True),
+        StructField("humidity", DoubleType(), True),
+        StructField("pressure", DoubleType(), True),
+        StructField("battery_level", DoubleType(), True)
+    ]), False),
+    StructField("status", StringType(), True),
+    StructField("maintenance_required", BooleanType(), True)
+])
+
+# Define schema for transaction data
+transaction_schema = StructType([
+    StructField("transaction_id", StringType(), False),
+    StructField("user_id", StringType(), False),
+    StructField("timestamp", TimestampType(), False),
+    StructField("product_id", StringType(), False),
+    StructField("product_name", StringType(), True),
+    StructField("product_category", StringType(), True),
+    StructField("quantity", IntegerType(), True),
+    StructField("amount", DoubleType(), False),
+    StructField("payment_method", StringType(), False),
+    StructField("status", StringType(), True),
+    StructField("store_id", StringType(), True),
+    StructField("is_online", BooleanType(), True)
+])
+
+# Time-derived partition columns that can appear in a table's partition_by
+TIME_PARTITION_COLUMNS = {
+    "year": year,
+    "month": month,
+    "day": day,
+    "hour": hour,
+}
+
+
+def table_path(delta_lake_config, table_config):
+    """Resolve a Delta table path relative to the configured base path."""
+    path = table_config["path"]
+    if "://" in path or path.startswith("/"):
+        return path
+    return delta_lake_config["base_path"].rstrip("/") + "/" + path
+
+
+def read_kafka_source(spark, source_config, schema):
+    """Read a Kafka topic and parse its JSON values with the given schema."""
+    kafka_bootstrap_servers = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
+
+    df = (
+        spark.readStream
+        .format("kafka")
+        .option("kafka.bootstrap.servers", kafka_bootstrap_servers)
+        .option("subscribe", source_config["topic"])
+        .option("startingOffsets", "latest")
+        .load()
+    )
+
+    return df.select(
+        col("key").cast("string"),
+        from_json(col("value").cast("string"), schema).alias("data"),
+        col("timestamp").alias("processing_time")
+    ).select("key", "data.*", "processing_time")
+
+
+def process_source(spark, config, source_name, schema):
+    """
+    Build the streaming queries of a source from its sink configuration.
+
+    Every Delta table and PostgreSQL table whose `source` is this source gets
+    one query: Delta tables receive the parsed events partitioned as
+    configured, PostgreSQL tables receive the result of their configured query.
+    """
+    source_config = config["sources"][source_name]
+    delta_lake_config = config["sinks"]["delta_lake"]
+    postgres_config = config["sinks"]["postgres"]
+
+    events_df = read_kafka_source(spark, source_config, schema)
+    queries = []
+
+    # Delta Lake tables
+    for table_name, table_config in delta_lake_config["tables"].items():
+        if table_config.get("source") != source_name:
+            continue
+
+        partition_columns = [c.strip() for c in table_config.get("partition_by", "").split(",") if c.strip()]
+        table_df = events_df
+        for partition_column in partition_columns:
+            if partition_column in TIME_PARTITION_COLUMNS:
+                table_df = table_df.withColumn(partition_column, TIME_PARTITION_COLUMNS[partition_column](col("timestamp")))
+
+        sink_format = table_config.get("format", "delta")
+        queries.append(configure_query(
+            table_df.writeStream
+            .queryName(table_name)
+            .format(sink_format)
+            .outputMode(table_config.get("mode", "append"))
+            .partitionBy(*partition_columns),
+            config, table_name, table_config["checkpoint_location"], sink_format=sink_format, stateful=False
+        ).start(table_path(delta_lake_config, table_config)))
+
+    # PostgreSQL tables fed by a per-batch query
+    for table_name, table_config in postgres_config["tables"].items():
+        if table_config.get("source") != source_name or "query" not in table_config:
+            continue
+
+        sink = PostgresQuerySink(
+            postgres_config,
+            table=table_name,
+            query=table_config["query"],
+            view_name=f"{source_name}_stream",
+            keys=table_config.get("keys", []),
+            write_mode=table_config.get("write_mode", "upsert"),
+        )
+        queries.append(configure_query(
+            events_df.writeStream
+            .queryName(f"postgres_{table_name}")
+            .foreachBatch(sink),
+            config, f"postgres_{table_name}", table_config["checkpoint_location"], stateful=False
+        ).start())
+
+    return queries
+
+
+# Builders for each supported source
+SOURCE_PROCESSORS = {
+    "user_activity": process_user_activity,
+    "iot_sensors": lambda spark, config: process_source(spark, config, "iot_sensors", iot_sensor_schema),
+    "transactions": lambda spark, config: process_source(spark, config, "transactions", transaction_schema),
+}
+
+
+def start_all_sources(spark, config):
+    """Start the streaming queries of every configured Kafka source."""
+    queries = []
+
+    for source_name, source_config in config["sources"].items():
+        if source_config.get("type") != "kafka" or not source_config.get("enabled", True):
+            continue
+
+        processor = SOURCE_PROCESSORS.get(source_name)
+        if processor is None:
+            print(f"No stream processor for source {source_name}, skipping")
+            continue
+
+        # Queries started from here are scheduled in the source's FAIR pool
+        spark.sparkContext.setLocalProperty("spark.scheduler.pool", source_name)
+        source_queries = processor(spark, config)
+        queries.extend(source_queries)
+        print(f"Started {len(source_queries)} streaming queries for source {source_name}")
+
+    # Attribution and user features combine two sources, so they run in their own pool
+    enabled_sources = {
+        name for name, source_config in config["sources"].items()
+        if source_config.get("type") == "kafka" and source_config.get("enabled", True)
+    }
+    if {"user_activity", "transactions"} <= enabled_sources:
+        spark.sparkContext.setLocalProperty("spark.scheduler.pool", "cross_source")
+        transactions_df = read_kafka_source(spark, config["sources"]["transactions"], transaction_schema)
+        attribution_query = start_attribution_query(spark, config, transactions_df)
+        if attribution_query is not None:
+            queries.append(attribution_query)
+            print("Started transaction attribution query")
+        
+        activity_df = deduplicate_events(
+            parse_user_activity(read_user_activity(spark, config)), config.get("processing", {})
+        )
+        features_query = start_user_features_query(spark, config, activity_df, transactions_df)
+        if features_query is not None:
+            queries.append(features_query)
+            print("Started user features query")
+
+    spark.sparkContext.setLocalProperty("spark.scheduler.pool", None)
+    return queries
+
+
+def main():
+    """Main function."""
+    try:
+        # Load configuration
+        config = load_config()
+
+        # Create one Spark session shared by all sources
+        spark = create_spark_session("StreamProcessor")
+        ship_executor_modules(spark)
+        apply_checkpoint_settings(spark, config)
+
+        # Export streaming query progress to Prometheus
+        metrics_config = config.get("monitoring", {}).get("streaming_metrics", {})
+        register_progress_listener(spark, port=metrics_config.get("port", 8000))
+
+        # Start the queries of every source
+        start_all_sources(spark, config)
+
+        # Wait for any query to terminate
+        spark.streams.awaitAnyTermination()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    finally:
+        # The dimension refresh threads outlive the queries otherwise
+        stop_dimension_refresh()
+
+
+if __name__ == "__main__":
+    main()
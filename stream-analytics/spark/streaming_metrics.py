@@ -0,0 +1,269 @@
+"""
+Streaming Query Metrics
+
+This module exports per-query Structured Streaming progress as Prometheus
+metrics. A StreamingQueryListener receives every micro-batch progress report
+on the driver and updates gauges that are served over HTTP for Prometheus
+(and MetricsCollector.collect_spark_metrics) to scrape.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from pyspark.sql.streaming import StreamingQueryListener
+
+logger = logging.getLogger(__name__)
+
+# Define Prometheus metrics
+INPUT_ROWS_PER_SECOND = Gauge(
+    'stream_analytics_streaming_input_rows_per_second',
+    'Rate at which rows arrived from the sources in the last micro-batch',
+    ['query']
+)
+
+PROCESSED_ROWS_PER_SECOND = Gauge(
+    'stream_analytics_streaming_processed_rows_per_second',
+    'Rate at which rows were processed in the last micro-batch',
+    ['query']
+)
+
+INPUT_ROWS = Counter(
+    'stream_analytics_streaming_input_rows_total',
+    'Total number of rows read by the query',
+    ['query']
+)
+
+BATCH_DURATION = Gauge(
+    'stream_analytics_streaming_batch_duration_seconds',
+    'Duration of each phase of the last micro-batch',
+    ['query', 'operation']
+)
+
+BATCH_ID = Gauge(
+    'stream_analytics_streaming_batch_id',
+    'Id of the last completed micro-batch',
+    ['query']
+)
+
+WATERMARK_DELAY = Gauge(
+    'stream_analytics_streaming_watermark_delay_seconds',
+    'Difference between the batch trigger time and the event-time watermark',
+    ['query']
+)
+
+STATE_ROWS = Gauge(
+    'stream_analytics_streaming_state_rows',
+    'Total number of rows held in the state store',
+    ['query']
+)
+
+STATE_MEMORY_BYTES = Gauge(
+    'stream_analytics_streaming_state_memory_bytes',
+    'Memory used by the state store',
+    ['query']
+)
+
+ROWS_DROPPED_BY_WATERMARK = Counter(
+    'stream_analytics_streaming_rows_dropped_by_watermark_total',
+    'Total number of late rows dropped by stateful operators',
+    ['query']
+)
+
+DUPLICATES_DROPPED = Counter(
+    'stream_analytics_streaming_duplicates_dropped_total',
+    'Total number of duplicate rows dropped by streaming deduplication',
+    ['query']
+)
+
+OFFSETS_BEHIND_LATEST = Gauge(
+    'stream_analytics_streaming_offsets_behind_latest',
+    'Number of Kafka offsets between the last processed and the latest available offset',
+    ['query', 'topic']
+)
+
+SHUFFLE_SKEW_RATIO = Gauge(
+    'stream_analytics_streaming_shuffle_skew_ratio',
+    'Rows in the largest shuffle partition over the mean, per aggregation task in the last batch',
+    ['query']
+)
+
+HOT_KEYS = Gauge(
+    'stream_analytics_streaming_hot_keys',
+    'Number of hot keys currently salted',
+    ['query']
+)
+
+HOT_KEY_ROW_SHARE = Gauge(
+    'stream_analytics_streaming_hot_key_row_share',
+    'Fraction of the last batch\'s rows carried by hot keys',
+    ['query']
+)
+
+DIMENSION_ROWS = Gauge(
+    'stream_analytics_streaming_dimension_rows',
+    'Number of rows in the cached dimension table used for enrichment',
+    ['dimension']
+)
+
+DIMENSION_REFRESH_TIMESTAMP = Gauge(
+    'stream_analytics_streaming_dimension_refresh_timestamp_seconds',
+    'Unix time of the last successful dimension refresh',
+    ['dimension']
+)
+
+DEAD_LETTER_RECORDS = Counter(
+    'stream_analytics_streaming_dead_letter_records_total',
+    'Total number of invalid records written to the dead-letter table',
+    ['source', 'reason']
+)
+
+CHECKPOINT_COMMIT_SECONDS = Histogram(
+    'stream_analytics_streaming_checkpoint_commit_seconds',
+    'Time per micro-batch spent writing the offset log (walCommit) and commit log (commitOffsets)',
+    ['query'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+QUERY_ACTIVE = Gauge(
+    'stream_analytics_streaming_query_active',
+    'Whether the query is currently running (1) or terminated (0)',
+    ['query']
+)
+
+
+def _parse_timestamp(value: str) -> datetime:
+    """Parse an ISO-8601 timestamp as reported in query progress."""
+    return datetime.strptime(value.replace('Z', '+0000'), '%Y-%m-%dT%H:%M:%S.%f%z')
+
+
+def offsets_behind_latest(source: Any) -> Dict[str, int]:
+    """
+    Compute how far a Kafka source is behind the latest offsets, per topic.
+
+    Args:
+        source: SourceProgress of a Kafka source
+
+    Returns:
+        Dict[str, int]: Offsets behind latest summed over the partitions of each topic
+    """
+    if not source.latestOffset or not source.endOffset:
+        return {}
+
+    try:
+        latest = json.loads(source.latestOffset)
+        end = json.loads(source.endOffset)
+    except (TypeError, ValueError):
+        # Not a Kafka source (e.g. rate or file source)
+        return {}
+
+    lag = {}
+    for topic, partitions in latest.items():
+        if not isinstance(partitions, dict):
+            continue
+        consumed = end.get(topic, {})
+        lag[topic] = int(sum(
+            max(0, offset - consumed.get(partition, offset))
+            for partition, offset in partitions.items()
+        ))
+    return lag
+
+
+class PrometheusProgressListener(StreamingQueryListener):
+    """Listener that exports streaming query progress as Prometheus metrics."""
+
+    def __init__(self):
+        super().__init__()
+        self.query_names: Dict[str, str] = {}
+
+    def _query_name(self, query_id: Any, name: Optional[str] = None) -> str:
+        """Resolve a stable label for a query, falling back to its id."""
+        query_id = str(query_id)
+        if name:
+            self.query_names[query_id] = name
+        return self.query_names.get(query_id, query_id)
+
+    def onQueryStarted(self, event):
+        """Mark the query as active."""
+        query = self._query_name(event.id, event.name)
+        QUERY_ACTIVE.labels(query=query).set(1)
+        logger.info(f"Streaming query started: {query} ({event.id})")
+
+    def onQueryProgress(self, event):
+        """Export the metrics of a completed micro-batch."""
+        progress = event.progress
+        query = self._query_name(progress.id, progress.name)
+
+        try:
+            BATCH_ID.labels(query=query).set(progress.batchId)
+            INPUT_ROWS.labels(query=query).inc(progress.numInputRows)
+            INPUT_ROWS_PER_SECOND.labels(query=query).set(progress.inputRowsPerSecond or 0.0)
+            PROCESSED_ROWS_PER_SECOND.labels(query=query).set(progress.processedRowsPerSecond or 0.0)
+
+            # Batch duration breakdown (addBatch, getBatch, latestOffset, queryPlanning, walCommit, ...)
+            durations = progress.durationMs or {}
+            for operation, duration_ms in durations.items():
+                BATCH_DURATION.labels(query=query, operation=operation).set(duration_ms / 1000.0)
+
+            # Checkpoint commit latency of every batch
+            commit_ms = durations.get('walCommit', 0) + durations.get('commitOffsets', 0)
+            CHECKPOINT_COMMIT_SECONDS.labels(query=query).observe(commit_ms / 1000.0)
+
+            # Watermark delay
+            watermark = (progress.eventTime or {}).get('watermark')
+            if watermark:
+                delay = _parse_timestamp(progress.timestamp) - _parse_timestamp(watermark)
+                WATERMARK_DELAY.labels(query=query).set(delay.total_seconds())
+
+            # State store size
+            state_operators = progress.stateOperators or []
+            STATE_ROWS.labels(query=query).set(sum(op.numRowsTotal for op in state_operators))
+            STATE_MEMORY_BYTES.labels(query=query).set(sum(op.memoryUsedBytes for op in state_operators))
+            ROWS_DROPPED_BY_WATERMARK.labels(query=query).inc(
+                sum(op.numRowsDroppedByWatermark for op in state_operators)
+            )
+            DUPLICATES_DROPPED.labels(query=query).inc(
+                sum((op.customMetrics or {}).get('numDroppedDuplicateRows', 0) for op in state_operators)
+            )
+
+            # Kafka consumer lag
+            for source in progress.sources or []:
+                for topic, lag in offsets_behind_latest(source).items():
+                    OFFSETS_BEHIND_LATEST.labels(query=query, topic=topic).set(lag)
+
+        except Exception as e:
+            # Never let a metrics failure take down the query
+            logger.error(f"Error exporting progress for query {query}: {e}")
+
+    def onQueryIdle(self, event):
+        """Idle triggers carry no new progress."""
+        pass
+
+    def onQueryTerminated(self, event):
+        """Mark the query as terminated."""
+        query = self._query_name(event.id)
+        QUERY_ACTIVE.labels(query=query).set(0)
+        if event.exception:
+            logger.error(f"Streaming query {query} terminated with exception: {event.exception}")
+        else:
+            logger.info(f"Streaming query terminated: {query}")
+
+
+def register_progress_listener(spark, port: int = 8000) -> PrometheusProgressListener:
+    """
+    Start the Prometheus endpoint and attach the progress listener to the session.
+
+    Args:
+        spark: Active Spark session
+        port: Port to serve the /metrics endpoint on
+
+    Returns:
+        PrometheusProgressListener: The registered listener
+    """
+    start_http_server(port)
+    listener = PrometheusProgressListener()
+    spark.streams.addListener(listener)
+    logger.info(f"Serving streaming query metrics on port {port}")
+    return listener
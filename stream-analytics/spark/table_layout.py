@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Raw Events Table Layout
+
+The raw events table was partitioned on four integer columns (event_year,
+event_month, event_day, event_hour) computed by the stream. Filters on
+`timestamp` cannot prune those partitions, and one directory per hour nested
+four levels deep leaves many small files. This module defines the supported
+layouts of the table, set with `partitioning` in its sink configuration:
+
+- date_hour: partitioned by event_date = CAST(timestamp AS DATE) and
+  event_hour = DATE_TRUNC('HOUR', timestamp)
+- date: partitioned by event_date only; files within a day are Z-ordered by
+  `zorder_by` (timestamp by default) with OPTIMIZE
+- legacy: the original layout, written by the stream
+
+The date layouts use Delta generated columns, so Delta computes the partition
+values on write and derives partition filters from predicates on
+`timestamp`. Generated columns can only be defined when a table is created,
+so an existing table is migrated by copying it into a new table, one day at
+a time:
+
+    python spark/table_layout.py migrate --target s3a://data-lake/user_activity/hourly_v2/
+    # stop the processor, copy the days written since the first pass
+    python spark/table_layout.py migrate --target s3a://data-lake/user_activity/hourly_v2/ --from-date 2024-05-01
+    # point the table's path at the target and restart with the same checkpoint
+    python spark/table_layout.py optimize --days 2
+"""
+
+import sys
+import logging
+import argparse
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from delta.tables import DeltaTable
+from pyspark.sql.functions import col, day, expr, hour, month, year
+
+logger = logging.getLogger(__name__)
+
+LEGACY_PARTITION_COLUMNS = ["event_year", "event_month", "event_day", "event_hour"]
+
+# Generated partition columns of each layout, as (name, type, expression)
+GENERATED_LAYOUTS = {
+    "date_hour": [
+        ("event_date", "DATE", "CAST(timestamp AS DATE)"),
+        ("event_hour", "TIMESTAMP", "DATE_TRUNC('HOUR', timestamp)"),
+    ],
+    "date": [
+        ("event_date", "DATE", "CAST(timestamp AS DATE)"),
+    ],
+}
+
+LAYOUTS = ["legacy", *GENERATED_LAYOUTS]
+
+
+def layout_strategy(table_config: Dict[str, Any]) -> str:
+    """The configured layout of a table; tables without one keep the legacy layout."""
+    strategy = table_config.get("partitioning", "legacy")
+    if strategy not in LAYOUTS:
+        raise ValueError(f"Unsupported partitioning: {strategy}")
+    return strategy
+
+
+def partition_columns(strategy: str) -> List[str]:
+    """Partition columns of a layout."""
+    if strategy == "legacy":
+        return LEGACY_PARTITION_COLUMNS
+    return [name for name, _, _ in GENERATED_LAYOUTS[strategy]]
+
+
+def range_condition(column: str, start: datetime, end: datetime) -> str:
+    """SQL condition selecting [start, end) of a timestamp column, independent of the session time zone."""
+    return (
+        f"{column} >= timestamp_seconds({int(start.timestamp())}) AND "
+        f"{column} < timestamp_seconds({int(end.timestamp())})"
+    )
+
+
+def add_legacy_partition_columns(df):
+    """Add the event time columns of the legacy layout."""
+    return df.withColumn(
+        "event_year", year(col("timestamp"))
+    ).withColumn(
+        "event_month", month(col("timestamp"))
+    ).withColumn(
+        "event_day", day(col("timestamp"))
+    ).withColumn(
+        "event_hour", hour(col("timestamp"))
+    )
+
+
+def existing_partition_columns(spark, path: str) -> Optional[List[str]]:
+    """Partition columns of the Delta table at path, or None if there is no table."""
+    if not DeltaTable.isDeltaTable(spark, path):
+        return None
+    return list(DeltaTable.forPath(spark, path).detail().collect()[0]["partitionColumns"])
+
+
+def prepare_table(spark, path: str, schema, strategy: str) -> List[str]:
+    """
+    Create the table with the layout's generated columns if it does not exist yet.
+
+    A table that already exists keeps its layout until it is migrated.
+
+    Args:
+        spark: Active Spark session
+        path: Path of the Delta table
+        schema: Schema of the rows written to the table, without partition columns
+        strategy: Configured layout
+
+    Returns:
+        List[str]: Partition columns the writer must add and pass to partitionBy
+        (those of the legacy layout, or none when Delta generates them)
+    """
+    existing = existing_partition_columns(spark, path)
+    if existing is not None:
+        if existing != partition_columns(strategy):
+            logger.warning(
+                f"Table at {path} is partitioned by {existing}, not the configured '{strategy}' layout; "
+                f"run the table_layout migration to switch"
+            )
+        return existing if existing == LEGACY_PARTITION_COLUMNS else []
+
+    if strategy == "legacy":
+        return LEGACY_PARTITION_COLUMNS
+
+    builder = DeltaTable.createIfNotExists(spark).location(path).addColumns(schema)
+    for name, data_type, expression in GENERATED_LAYOUTS[strategy]:
+        builder = builder.addColumn(name, data_type, generatedAlwaysAs=expression)
+    builder.partitionedBy(*partition_columns(strategy)).execute()
+    logger.info(f"Created table at {path} with the '{strategy}' layout")
+    return []
+
+
+def with_layout_columns(df, writer_columns: List[str]):
+    """Add the partition columns the writer provides itself (legacy layout only)."""
+    return add_legacy_partition_columns(df) if writer_columns else df
+
+
+def migrate(spark, source_path: str, target_path: str, strategy: str, from_date: Optional[date] = None) -> int:
+    """
+    Copy a table into a new table with the given layout, one UTC day per commit.
+
+    Each day replaces the same range of the target, so an interrupted
+    migration can be rerun, and a second pass with from_date copies the
+    days written since the first.
+
+    Returns:
+        int: Number of days copied
+    """
+    source = spark.read.format("delta").load(source_path)
+    derived = set(LEGACY_PARTITION_COLUMNS) | {name for layout in GENERATED_LAYOUTS.values() for name, _, _ in layout}
+    data_columns = [name for name in source.columns if name not in derived]
+    prepare_table(spark, target_path, source.select(*data_columns).schema, strategy)
+
+    bounds = source.agg(
+        expr("unix_seconds(min(timestamp))").alias("first"), expr("unix_seconds(max(timestamp))").alias("last")
+    ).collect()[0]
+    if bounds["first"] is None:
+        return 0
+
+    first_day = datetime.fromtimestamp(bounds["first"], tz=timezone.utc).date()
+    last_day = datetime.fromtimestamp(bounds["last"], tz=timezone.utc).date()
+    if from_date:
+        first_day = max(first_day, from_date)
+    days = max(0, (last_day - first_day).days + 1)
+    for offset in range(days):
+        start = datetime.combine(first_day + timedelta(days=offset), time(), tzinfo=timezone.utc)
+        end = start + timedelta(days=1)
+        condition = range_condition("timestamp", start, end)
+        (
+            source.filter(condition).select(*data_columns).write
+            .format("delta")
+            .mode("overwrite")
+            .option("replaceWhere", condition)
+            .save(target_path)
+        )
+        logger.info(f"Copied {start.date()} into {target_path}")
+
+    return days
+
+
+def optimize(spark, path: str, zorder_by: List[str], days: int) -> None:
+    """Compact the last days of a date-partitioned table and Z-order their files."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    DeltaTable.forPath(spark, path).optimize().where(f"event_date >= '{since.isoformat()}'").executeZOrderBy(*zorder_by)
+    logger.info(f"Optimized {path} since {since} by {', '.join(zorder_by)}")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Manage the partition layout of the raw events table")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Copy the table into a new table with the configured layout")
+    migrate_parser.add_argument("--target", required=True, help="Path of the new table")
+    migrate_parser.add_argument("--from-date", type=date.fromisoformat, help="First UTC day to copy (YYYY-MM-DD)")
+
+    optimize_parser = subparsers.add_parser("optimize", help="Compact and Z-order recent days")
+    optimize_parser.add_argument("--days", type=int, default=2, help="Number of most recent days to optimize")
+    return parser.parse_args()
+
+
+def main():
+    """Main function."""
+    from user_activity_processor import load_config, create_spark_session
+
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+
+    try:
+        config = load_config()
+        table_config = config["sinks"]["delta_lake"]["tables"]["user_activity_hourly"]
+        strategy = layout_strategy(table_config)
+        if strategy == "legacy":
+            print("Set a date_hour or date partitioning for the table first")
+            sys.exit(1)
+        spark = create_spark_session("RawEventsTableLayout")
+
+        if args.command == "migrate":
+            days = migrate(spark, table_config["path"], args.target, strategy, args.from_date)
+            print(f"Copied {days} days into {args.target}")
+        else:
+            optimize(spark, table_config["path"], table_config.get("zorder_by", ["timestamp"]), args.days)
+
+        spark.stop()
+
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
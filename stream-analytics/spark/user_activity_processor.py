@@ -10,13 +10,15 @@ import os
 import sys
 import json
 import yaml
+import shutil
+import tempfile
+import importlib
 from datetime import datetime
 
 from pyspark.sql import SparkSession
 from pyspark.sql.functions import (
-    col, from_json, window, count, sum, avg, explode, 
-    expr, when, lit, to_timestamp, hour, minute, second,
-    year, month, day, hour
+    col, from_json, window, session_window, count, sum, avg, explode, 
+    expr, when, lit, to_timestamp, coalesce
 )
 from pyspark.sql.types import (
     StructType, StructField, StringType, IntegerType,
@@ -24,6 +26,32 @@ from pyspark.sql.types import (
     ArrayType
 )
 
+from streaming_metrics import register_progress_listener
+from postgres_sink import create_user_activity_sink
+from hourly_metrics import create_hourly_metrics_sink
+from sketches import DEFAULT_LG_CONFIG_K, user_sketch_agg
+from rollups import start_rollup_queries
+from heavy_hitters import heavy_hitters
+from skew import ensure_hot_keys_table, salted_aggregate, salted_queries, start_hot_key_detector
+from enrichment import enrich_with_product_dimension, stop_dimension_refresh
+from geoip import enrich_with_geoip
+from dead_letter import start_dead_letter_query, valid_records, validate_records
+from table_layout import layout_strategy, prepare_table, with_layout_columns
+from attributes import promote_attributes, resolve_promotions
+from checkpoints import apply_checkpoint_settings, configure_query
+
+# Helper modules next to this script that run inside executor tasks
+EXECUTOR_MODULES = ["postgres_sink.py", "heavy_hitters.py", "geoip.py", "user_features.py"]
+
+# Project packages imported by those modules, shipped to the executors as zip archives
+EXECUTOR_PACKAGES = ["utils"]
+
+# Grouping columns and window of the aggregations that can be salted (see skew)
+SALTABLE_GROUPINGS = {
+    "products": (["product_id", "product_category"], "1 hour"),
+    "user_behavior": (["user_id", "device_info.device_type"], "1 hour"),
+}
+
 # Define schema for user activity data
 user_activity_schema = StructType([
     StructField("event_id", StringType(), False),
@@ -53,6 +81,12 @@ user_activity_schema = StructType([
     StructField("custom_attributes", MapType(StringType(), StringType()), False)
 ])
 
+# Checks beyond the schema, as (error reason, SQL condition of a failing record)
+user_activity_rules = [
+    ("negative_product_price", "product_price < 0"),
+    ("non_positive_quantity", "quantity <= 0"),
+]
+
 
 def load_config():
     """Load configuration from YAML file."""
@@ -67,11 +101,11 @@ def load_config():
         sys.exit(1)
 
 
-def create_spark_session():
+def create_spark_session(app_name="UserActivityProcessor"):
     """Create and configure a Spark session."""
     return (
         SparkSession.builder
-        .appName("UserActivityProcessor")
+        .appName(app_name)
         .config("spark.sql.extensions", "io.delta.sql.DeltaSparkSessionExtension")
         .config("spark.sql.catalog.spark_catalog", "org.apache.spark.sql.delta.catalog.DeltaCatalog")
         .config("spark.sql.streaming.checkpointLocation", "/tmp/checkpoints/user_activity")
@@ -81,19 +115,120 @@ def create_spark_session():
         .config("spark.hadoop.fs.s3a.path.style.access", "true")
         .config("spark.hadoop.fs.s3a.impl", "org.apache.hadoop.fs.s3a.S3AFileSystem")
         .config("spark.sql.shuffle.partitions", "10")
+        # Streaming queries of different sources share executors through FAIR pools
+        .config("spark.scheduler.mode", "FAIR")
         .getOrCreate()
     )
 
 
-def process_user_activity(spark, config):
-    """Process user activity data from Kafka."""
-    # Get Kafka topic and other configurations
+def ship_executor_modules(spark):
+    """Make the helper modules and packages used by executor tasks importable on the executors."""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in EXECUTOR_MODULES:
+        spark.sparkContext.addPyFile(os.path.join(module_dir, module))
+    
+    archive_dir = tempfile.mkdtemp(prefix="executor-packages-")
+    for package in EXECUTOR_PACKAGES:
+        package_dir = list(importlib.import_module(package).__path__)[0]
+        archive = shutil.make_archive(
+            os.path.join(archive_dir, package), "zip",
+            root_dir=os.path.dirname(package_dir), base_dir=os.path.basename(package_dir)
+        )
+        spark.sparkContext.addPyFile(archive)
+
+
+def deduplicate_events(df, processing_config):
+    """
+    Drop repeated deliveries of the same event.
+    
+    Kafka delivery is at-least-once and the generator retries, so the same
+    event_id can arrive more than once. Deduplication state is kept only
+    until the event-time watermark passes, which bounds its size.
+    """
+    watermarked_df = df.withWatermark("timestamp", processing_config.get("watermark_delay", "10 minutes"))
+    
+    dedup_config = processing_config.get("deduplication", {})
+    if not dedup_config.get("enabled", True):
+        return watermarked_df
+    
+    return watermarked_df.dropDuplicatesWithinWatermark(dedup_config.get("keys", ["event_id"]))
+
+
+def user_activity_events(spark, events_df, processing_config, refresh=True):
+    """
+    Enrich the valid user activity events and deduplicate them.
+    
+    Every sink, the raw events table and PostgreSQL included, reads the
+    events deduplicated within the watermark, so no table carries a
+    repeated delivery. Events later than the watermark are dropped. The
+    backfill runs the same function on batch input, without refreshing the
+    product dimension.
+    
+    Returns:
+        DataFrame: The watermarked, deduplicated, enriched events
+    """
+    enrichment_config = processing_config.get("enrichment", {})
+    
+    # Join in catalog attributes from the broadcast product dimension
+    events_df = enrich_with_product_dimension(spark, events_df, enrichment_config, refresh=refresh)
+    
+    # Derive geo_data from ip_address
+    events_df = enrich_with_geoip(spark, events_df, enrichment_config.get("geoip", {}))
+    
+    return deduplicate_events(events_df, processing_config)
+
+
+def session_aggregates(events_df, sessions_config, sketch_lg_k=DEFAULT_LG_CONFIG_K):
+    """
+    Aggregate events per user session.
+    
+    In 'session' mode a session closes after `gap` without events and is
+    emitted once, with its duration, funnel counts and revenue. In 'tumbling'
+    mode sessions are cut into fixed `window` slices.
+    """
+    mode = sessions_config.get("mode", "session")
+    
+    if mode == "tumbling":
+        return events_df.groupBy(
+            "session_id", "user_id", 
+            window("timestamp", sessions_config.get("window", "5 minutes"))
+        ).agg(
+            count("event_id").alias("event_count"),
+            count(when(col("event_type") == "view", True)).alias("page_views"),
+            count(when(col("event_type") == "click", True)).alias("clicks"),
+            count(when(col("event_type") == "purchase", True)).alias("purchases"),
+            user_sketch_agg(sketch_lg_k)
+        )
+    
+    if mode != "session":
+        raise ValueError(f"Unsupported session mode: {mode}")
+    
+    is_purchase = col("event_type") == "purchase"
+    return events_df.groupBy(
+        "session_id", "user_id",
+        session_window("timestamp", sessions_config.get("gap", "30 minutes")).alias("window")
+    ).agg(
+        expr("min(timestamp)").alias("session_start"),
+        expr("max(timestamp)").alias("session_end"),
+        count("event_id").alias("event_count"),
+        count(when(col("event_type") == "view", True)).alias("page_views"),
+        count(when(col("event_type") == "click", True)).alias("clicks"),
+        count(when(col("event_type") == "add_to_cart", True)).alias("add_to_cart"),
+        count(when(is_purchase, True)).alias("purchases"),
+        coalesce(sum(when(is_purchase, col("quantity") * col("product_price"))), lit(0.0)).alias("revenue"),
+        user_sketch_agg(sketch_lg_k)
+    ).withColumn(
+        "duration_seconds",
+        expr("unix_seconds(session_end) - unix_seconds(session_start)")
+    )
+
+
+def read_user_activity(spark, config):
+    """Read raw user activity records (key, value, timestamp) from Kafka."""
     kafka_bootstrap_servers = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", "kafka:9092")
     user_activity_topic = config["sources"]["user_activity"]["topic"]
-    delta_lake_config = config["sinks"]["delta_lake"]
     
-    # Read from Kafka
-    df = (
+    return (
         spark.readStream
         .format("kafka")
         .option("kafka.bootstrap.servers", kafka_bootstrap_servers)
@@ -101,121 +236,280 @@ def process_user_activity(spark, config):
         .option("startingOffsets", "latest")
         .load()
     )
+
+
+def validate_user_activity(df):
+    """Parse raw JSON records and flag the malformed or schema-violating ones (see dead_letter)."""
+    return validate_records(df, user_activity_schema, user_activity_rules)
+
+
+def parse_user_activity(df):
+    """Parse raw JSON records into valid user activity events."""
+    return valid_records(validate_user_activity(df))
+
+
+def user_activity_aggregates(events_df, processing_config):
+    """Build the windowed aggregations of the event stream, keyed by query name."""
+    sketch_lg_k = processing_config.get("sketches", {}).get("lg_config_k", DEFAULT_LG_CONFIG_K)
     
-    # Parse JSON data
-    parsed_df = df.select(
-        col("key").cast("string"),
-        from_json(col("value").cast("string"), user_activity_schema).alias("data"),
-        col("timestamp").alias("processing_time")
-    ).select("key", "data.*", "processing_time")
+    # Session Analysis - Track user sessions
+    session_df = session_aggregates(events_df, processing_config.get("sessions", {}), sketch_lg_k)
     
-    # Add timestamp columns for partitioning
-    df_with_time = parsed_df.withColumn(
-        "event_year", year(col("timestamp"))
-    ).withColumn(
-        "event_month", month(col("timestamp"))
-    ).withColumn(
-        "event_day", day(col("timestamp"))
-    ).withColumn(
-        "event_hour", hour(col("timestamp"))
+    # Queries aggregated in two phases with hot keys salted
+    skew_config = processing_config.get("skew", {})
+    salted = salted_queries(skew_config)
+    if salted:
+        ensure_hot_keys_table(events_df.sparkSession, skew_config["hot_keys_path"])
+    
+    # Catalog attributes added by the product dimension enrichment, if any
+    product_attributes = [
+        name for name in processing_config.get("enrichment", {}).get("product_dimension", {}).get("columns", {})
+        if name in events_df.columns
+    ]
+    
+    # Product Analysis - Track product interactions
+    if "products" in salted:
+        product_df = salted_aggregate(
+            events_df.filter(col("product_id").isNotNull()),
+            "products", salted["products"]["key"],
+            *SALTABLE_GROUPINGS["products"],
+            partial_aggs=[
+                count("event_id").alias("view_count"),
+                count(when(col("event_type") == "add_to_cart", True)).alias("add_to_cart_count"),
+                count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
+                sum(when(col("event_type") == "purchase", col("quantity") * col("product_price"))).alias("total_revenue"),
+                *[expr(f"max({name})").alias(name) for name in product_attributes]
+            ],
+            merge_aggs=[
+                sum("view_count").alias("view_count"),
+                sum("add_to_cart_count").alias("add_to_cart_count"),
+                sum("purchase_count").alias("purchase_count"),
+                sum("total_revenue").alias("total_revenue"),
+                *[expr(f"max({name})").alias(name) for name in product_attributes]
+            ],
+            hot_keys_path=skew_config["hot_keys_path"]
+        )
+    else:
+        product_df = events_df.filter(
+            col("product_id").isNotNull()
+        ).groupBy(
+            *SALTABLE_GROUPINGS["products"][0],
+            window("timestamp", SALTABLE_GROUPINGS["products"][1])
+        ).agg(
+            count("event_id").alias("view_count"),
+            count(when(col("event_type") == "add_to_cart", True)).alias("add_to_cart_count"),
+            count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
+            sum(when(col("event_type") == "purchase", col("quantity") * col("product_price"))).alias("total_revenue"),
+            *[expr(f"max({name})").alias(name) for name in product_attributes]
+        )
+    
+    # User Behavior Analysis
+    if "user_behavior" in salted:
+        user_behavior_df = salted_aggregate(
+            events_df,
+            "user_behavior", salted["user_behavior"]["key"],
+            *SALTABLE_GROUPINGS["user_behavior"],
+            partial_aggs=[
+                count("event_id").alias("total_events"),
+                sum(when(col("event_type") == "purchase", col("product_price"))).alias("purchase_value_sum"),
+                count(when(col("event_type") == "purchase", col("product_price"))).alias("purchase_value_count"),
+                count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
+                user_sketch_agg(sketch_lg_k)
+            ],
+            merge_aggs=[
+                sum("total_events").alias("total_events"),
+                sum("purchase_value_sum").alias("purchase_value_sum"),
+                sum("purchase_value_count").alias("purchase_value_count"),
+                sum("purchase_count").alias("purchase_count"),
+                expr("hll_union_agg(user_sketch, true)").alias("user_sketch")
+            ],
+            hot_keys_path=skew_config["hot_keys_path"]
+        ).select(
+            "user_id", "device_type", "window", "total_events",
+            (col("purchase_value_sum") / col("purchase_value_count")).alias("avg_purchase_value"),
+            "purchase_count", "user_sketch"
+        )
+    else:
+        user_behavior_df = events_df.groupBy(
+            *SALTABLE_GROUPINGS["user_behavior"][0],
+            window("timestamp", SALTABLE_GROUPINGS["user_behavior"][1])
+        ).agg(
+            count("event_id").alias("total_events"),
+            avg(when(col("event_type") == "purchase", col("product_price"))).alias("avg_purchase_value"),
+            count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
+            user_sketch_agg(sketch_lg_k)
+        )
+    
+    # Geo Analysis
+    geo_df = events_df.filter(
+        col("geo_data.country").isNotNull()
+    ).groupBy(
+        "geo_data.country", "geo_data.city",
+        window("timestamp", "1 hour")
+    ).agg(
+        count("event_id").alias("total_events"),
+        count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
+        sum(when(col("event_type") == "purchase", col("quantity") * col("product_price"))).alias("total_revenue"),
+        user_sketch_agg(sketch_lg_k)
     )
     
+    return {
+        "sessions": session_df,
+        "products": product_df,
+        "user_behavior": user_behavior_df,
+        "geo": geo_df,
+    }
+
+
+def aggregate_paths(processing_config):
+    """Delta paths of the windowed aggregation outputs, keyed like user_activity_aggregates."""
+    sessions_config = processing_config.get("sessions", {})
+    if sessions_config.get("mode", "session") == "session":
+        session_path = "s3a://data-lake/user_activity/session_windows/"
+    else:
+        session_path = "s3a://data-lake/user_activity/sessions/"
+    
+    return {
+        "sessions": sessions_config.get("path", session_path),
+        "products": "s3a://data-lake/user_activity/products/",
+        "user_behavior": "s3a://data-lake/user_activity/user_behavior/",
+        "geo": "s3a://data-lake/user_activity/geo/",
+    }
+
+
+def process_user_activity(spark, config):
+    """Process user activity data from Kafka and return the started queries."""
+    delta_lake_config = config["sinks"]["delta_lake"]
+    processing_config = config.get("processing", {})
+    sketch_lg_k = processing_config.get("sketches", {}).get("lg_config_k", DEFAULT_LG_CONFIG_K)
+    
+    # Read and validate the Kafka records; invalid ones go to the dead-letter
+    # table (query 11) and never reach deduplication or the aggregations
+    validated_df = validate_user_activity(read_user_activity(spark, config))
+    
+    # Enrich the valid events, and drop duplicate deliveries before every sink
+    events_df = user_activity_events(spark, valid_records(validated_df), processing_config)
+    aggregates = user_activity_aggregates(events_df, processing_config)
+    paths = aggregate_paths(processing_config)
+    
     # ------------ Stream Processing Operations ------------
     
-    # 1. Raw events - store all processed events
-    raw_events_query = (
-        df_with_time.writeStream
+    # 1. Raw events - store the deduplicated events in the configured partition layout,
+    # with the hot custom attributes promoted to typed columns
+    raw_table_config = delta_lake_config["tables"]["user_activity_hourly"]
+    raw_events_df = promote_attributes(
+        events_df, resolve_promotions(spark, raw_table_config["path"], processing_config.get("custom_attributes", {}))
+    )
+    raw_partition_columns = prepare_table(
+        spark, raw_table_config["path"], raw_events_df.schema, layout_strategy(raw_table_config)
+    )
+    # Checkpoint locations, triggers and progress tracking come from processing.checkpoints
+    raw_events_query = configure_query(
+        with_layout_columns(raw_events_df, raw_partition_columns).writeStream
+        .queryName("raw_events")
         .format("delta")
         .outputMode("append")
-        .option("checkpointLocation", delta_lake_config["tables"]["user_activity_hourly"]["checkpoint_location"])
-        .partitionBy("event_year", "event_month", "event_day", "event_hour")
-        .start(delta_lake_config["tables"]["user_activity_hourly"]["path"])
-    )
+        .option("mergeSchema", "true")
+        .partitionBy(*raw_partition_columns),
+        config, "user_activity_hourly", raw_table_config["checkpoint_location"], sink_format="delta"
+    ).start(raw_table_config["path"])
     
-    # 2. Session Analysis - Track user sessions
-    session_df = df_with_time.groupBy(
-        "session_id", "user_id", 
-        window("timestamp", "5 minutes")
-    ).agg(
-        count("event_id").alias("event_count"),
-        count(when(col("event_type") == "view", True)).alias("page_views"),
-        count(when(col("event_type") == "click", True)).alias("clicks"),
-        count(when(col("event_type") == "purchase", True)).alias("purchases")
-    )
+    # 2. Session Analysis - each mode keeps its own output and checkpoint
+    # because the two aggregations' state is not interchangeable
+    sessions_config = processing_config.get("sessions", {})
+    if sessions_config.get("mode", "session") == "session":
+        session_checkpoint = "user_activity_session_windows"
+    else:
+        session_checkpoint = "user_activity_sessions"
     
-    # Write session data
-    session_query = (
-        session_df.writeStream
+    session_query = configure_query(
+        aggregates["sessions"].writeStream
+        .queryName("sessions")
         .format("delta")
         .outputMode("append")
-        .option("checkpointLocation", "/tmp/checkpoints/user_activity_sessions")
-        .start("s3a://data-lake/user_activity/sessions/")
-    )
+        .option("mergeSchema", "true"),
+        config, session_checkpoint, sessions_config.get("checkpoint_location"), sink_format="delta"
+    ).start(paths["sessions"])
     
-    # 3. Product Analysis - Track product interactions
-    product_df = df_with_time.filter(
-        col("product_id").isNotNull()
-    ).groupBy(
-        "product_id", "product_category",
-        window("timestamp", "1 hour")
-    ).agg(
-        count("event_id").alias("view_count"),
-        count(when(col("event_type") == "add_to_cart", True)).alias("add_to_cart_count"),
-        count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
-        sum(when(col("event_type") == "purchase", col("quantity") * col("product_price"))).alias("total_revenue")
-    )
-    
-    # Write product data
-    product_query = (
-        product_df.writeStream
+    # 3. Product Analysis
+    product_query = configure_query(
+        aggregates["products"].writeStream
+        .queryName("products")
         .format("delta")
         .outputMode("append")
-        .option("checkpointLocation", "/tmp/checkpoints/user_activity_products")
-        .start("s3a://data-lake/user_activity/products/")
-    )
+        .option("mergeSchema", "true"),
+        config, "user_activity_products", sink_format="delta"
+    ).start(paths["products"])
     
     # 4. User Behavior Analysis
-    user_behavior_df = df_with_time.groupBy(
-        "user_id", "device_info.device_type",
-        window("timestamp", "1 hour")
-    ).agg(
-        count("event_id").alias("total_events"),
-        avg(when(col("event_type") == "purchase", col("product_price"))).alias("avg_purchase_value"),
-        count(when(col("event_type") == "purchase", True)).alias("purchase_count")
-    )
-    
-    # Write user behavior data
-    user_behavior_query = (
-        user_behavior_df.writeStream
+    user_behavior_query = configure_query(
+        aggregates["user_behavior"].writeStream
+        .queryName("user_behavior")
         .format("delta")
         .outputMode("append")
-        .option("checkpointLocation", "/tmp/checkpoints/user_activity_behavior")
-        .start("s3a://data-lake/user_activity/user_behavior/")
-    )
+        .option("mergeSchema", "true"),
+        config, "user_activity_behavior", sink_format="delta"
+    ).start(paths["user_behavior"])
     
     # 5. Geo Analysis
-    geo_df = df_with_time.filter(
-        col("geo_data.country").isNotNull()
-    ).groupBy(
-        "geo_data.country", "geo_data.city",
-        window("timestamp", "1 hour")
-    ).agg(
-        count("event_id").alias("total_events"),
-        count(when(col("event_type") == "purchase", True)).alias("purchase_count"),
-        sum(when(col("event_type") == "purchase", col("quantity") * col("product_price"))).alias("total_revenue")
-    )
-    
-    # Write geo data
-    geo_query = (
-        geo_df.writeStream
+    geo_query = configure_query(
+        aggregates["geo"].writeStream
+        .queryName("geo")
         .format("delta")
         .outputMode("append")
-        .option("checkpointLocation", "/tmp/checkpoints/user_activity_geo")
-        .start("s3a://data-lake/user_activity/geo/")
-    )
+        .option("mergeSchema", "true"),
+        config, "user_activity_geo", sink_format="delta"
+    ).start(paths["geo"])
+    
+    # 6. PostgreSQL - bulk load raw events into user_activity for the Airflow tasks
+    postgres_config = config["sinks"]["postgres"]
+    postgres_query = configure_query(
+        events_df.writeStream
+        .queryName("postgres_user_activity")
+        .foreachBatch(create_user_activity_sink(postgres_config)),
+        config, "postgres_user_activity", postgres_config["tables"]["user_activity"]["checkpoint_location"]
+    ).start()
+    
+    # 7. Hourly metrics - fold per-batch partial aggregates into hourly_metrics
+    hourly_metrics_query = configure_query(
+        events_df.writeStream
+        .queryName("hourly_metrics")
+        .foreachBatch(create_hourly_metrics_sink(postgres_config, sketch_lg_k)),
+        config, "postgres_hourly_metrics", postgres_config["tables"]["hourly_metrics"]["checkpoint_location"]
+    ).start()
+    
+    queries = [
+        raw_events_query, session_query, product_query, user_behavior_query,
+        geo_query, postgres_query, hourly_metrics_query
+    ]
+    
+    # 8. Heavy hitters - top N cities, products and pages per window
+    heavy_hitters_config = processing_config.get("heavy_hitters", {})
+    if heavy_hitters_config.get("enabled", False):
+        queries.append(configure_query(
+            heavy_hitters(events_df, heavy_hitters_config).writeStream
+            .queryName("heavy_hitters")
+            .format("delta")
+            .outputMode("append")
+            .partitionBy("dimension"),
+            config, "heavy_hitters", heavy_hitters_config["checkpoint_location"], sink_format="delta"
+        ).start(heavy_hitters_config["path"]))
     
-    # Wait for all queries to terminate
-    raw_events_query.awaitTermination()
+    # 9. Hot key detection for the salted aggregations
+    hot_key_query = start_hot_key_detector(spark, events_df, config, SALTABLE_GROUPINGS)
+    if hot_key_query is not None:
+        queries.append(hot_key_query)
+    
+    # 10. Rollup tiers - minute aggregates cascaded into hour and day tiers
+    if processing_config.get("rollups", {}).get("enabled", False):
+        queries.extend(start_rollup_queries(spark, events_df, config))
+    
+    # 11. Dead letters - malformed and schema-violating records with their Kafka coordinates
+    dead_letter_query = start_dead_letter_query(validated_df, config, "user_activity")
+    if dead_letter_query is not None:
+        queries.append(dead_letter_query)
+    
+    return queries
 
 
 def main():
@@ -226,13 +520,26 @@ def main():
         
         # Create Spark session
         spark = create_spark_session()
+        ship_executor_modules(spark)
+        apply_checkpoint_settings(spark, config)
+        
+        # Export streaming query progress to Prometheus
+        metrics_config = config.get("monitoring", {}).get("streaming_metrics", {})
+        register_progress_listener(spark, port=metrics_config.get("port", 8000))
         
         # Process user activity data
         process_user_activity(spark, config)
         
+        # Wait for any query to terminate
+        spark.streams.awaitAnyTermination()
+        
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
+    
+    finally:
+        # The dimension refresh threads outlive the queries otherwise
+        stop_dimension_refresh()
 
 
 if __name__ == "__main__":
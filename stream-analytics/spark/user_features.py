@@ -0,0 +1,279 @@
+"""
+Per-User Rolling Features
+
+This module maintains rolling per-user features from the user activity and
+transactions streams with applyInPandasWithState:
+
+- spend_24h: transaction amount over the last 24 hours
+- events_last_minute / events_per_minute_1h: activity rate
+- distinct_devices_24h: device types seen over the last 24 hours
+
+Each user's state is a fixed-size set of ring buffers (24 hourly spend
+buckets, 60 per-minute event counters and a few device slots) stored as
+packed NumPy arrays, so state size per user is constant (under 1KB)
+and total state grows only with the number of active users. Users idle for
+longer than the eviction timeout are emitted one last time with zeroed
+features and dropped from state.
+
+Feature rows are merged into a Delta feature table keyed on user_id.
+"""
+
+import logging
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+import pandas as pd
+from delta.tables import DeltaTable
+from pyspark.sql.functions import coalesce, col, expr, lit, xxhash64
+from pyspark.sql.streaming.state import GroupStateTimeout
+
+from checkpoints import configure_query
+
+logger = logging.getLogger(__name__)
+
+HOUR_MS = 3600 * 1000
+MINUTE_MS = 60 * 1000
+SPEND_BUCKETS = 24
+EVENT_BUCKETS = 60
+DEVICE_SLOTS = 8
+
+FEATURES_SCHEMA = (
+    "user_id string, feature_time timestamp, spend_24h double, events_last_minute int, "
+    "events_per_minute_1h double, distinct_devices_24h int, evicted boolean"
+)
+
+STATE_SCHEMA = "last_event_ms long, spend binary, events binary, devices binary"
+
+
+class UserFeatureState:
+    """Ring-buffer state of one user's rolling features."""
+
+    def __init__(self):
+        self.last_event_ms = 0
+        # Spend per hour, indexed by epoch hour % 24, with the hour each slot holds
+        self.spend = np.zeros(SPEND_BUCKETS, dtype=np.float64)
+        self.spend_hours = np.full(SPEND_BUCKETS, -1, dtype=np.int32)
+        # Events per minute, indexed by epoch minute % 60, with the minute each slot holds
+        self.events = np.zeros(EVENT_BUCKETS, dtype=np.int32)
+        self.event_minutes = np.full(EVENT_BUCKETS, -1, dtype=np.int32)
+        # Device hashes with the last hour each was seen
+        self.device_hashes = np.zeros(DEVICE_SLOTS, dtype=np.int64)
+        self.device_hours = np.full(DEVICE_SLOTS, -1, dtype=np.int32)
+
+    def to_state(self) -> Tuple[int, bytes, bytes, bytes]:
+        """Pack the buffers into a state row."""
+        return (
+            self.last_event_ms,
+            self.spend.tobytes() + self.spend_hours.tobytes(),
+            self.events.tobytes() + self.event_minutes.tobytes(),
+            self.device_hashes.tobytes() + self.device_hours.tobytes(),
+        )
+
+    def load_state(self, state: Tuple[int, bytes, bytes, bytes]) -> "UserFeatureState":
+        """Unpack the buffers from a state row."""
+        last_event_ms, spend, events, devices = state
+        self.last_event_ms = last_event_ms
+        self.spend, self.spend_hours = (
+            np.frombuffer(spend, dtype=np.float64, count=SPEND_BUCKETS).copy(),
+            np.frombuffer(spend, dtype=np.int32, offset=SPEND_BUCKETS * 8).copy(),
+        )
+        self.events, self.event_minutes = (
+            np.frombuffer(events, dtype=np.int32, count=EVENT_BUCKETS).copy(),
+            np.frombuffer(events, dtype=np.int32, offset=EVENT_BUCKETS * 4).copy(),
+        )
+        self.device_hashes, self.device_hours = (
+            np.frombuffer(devices, dtype=np.int64, count=DEVICE_SLOTS).copy(),
+            np.frombuffer(devices, dtype=np.int32, offset=DEVICE_SLOTS * 8).copy(),
+        )
+        return self
+
+    def update(self, events: pd.DataFrame) -> None:
+        """
+        Fold a batch of the user's events into the buffers.
+
+        Args:
+            events: event_ms, amount, is_activity and device_hash (0 for no device) columns
+        """
+        event_ms = events["event_ms"].to_numpy(np.int64)
+        self.last_event_ms = max(self.last_event_ms, int(event_ms.max()))
+
+        # Spend per hour; slots holding an older hour are reset before adding
+        hours = event_ms // HOUR_MS
+        keep = hours > self.last_event_ms // HOUR_MS - SPEND_BUCKETS
+        self._reset_stale(self.spend, self.spend_hours, hours[keep], SPEND_BUCKETS)
+        np.add.at(self.spend, hours[keep] % SPEND_BUCKETS, events["amount"].to_numpy(np.float64)[keep])
+
+        # Activity events per minute
+        minutes = event_ms // MINUTE_MS
+        keep = events["is_activity"].to_numpy(bool) & (minutes > self.last_event_ms // MINUTE_MS - EVENT_BUCKETS)
+        self._reset_stale(self.events, self.event_minutes, minutes[keep], EVENT_BUCKETS)
+        np.add.at(self.events, minutes[keep] % EVENT_BUCKETS, 1)
+
+        # Devices (hash 0 means none), replacing the least recently seen slot when full
+        device_hashes = events["device_hash"].to_numpy(np.int64)
+        devices = pd.Series(hours[device_hashes != 0]).groupby(device_hashes[device_hashes != 0]).max()
+        for device_hash, hour in devices.items():
+            matches = np.flatnonzero((self.device_hashes == device_hash) & (self.device_hours >= 0))
+            if len(matches):
+                self.device_hours[matches[0]] = max(self.device_hours[matches[0]], hour)
+            else:
+                slot = int(np.argmin(self.device_hours))
+                self.device_hashes[slot] = device_hash
+                self.device_hours[slot] = hour
+
+    @staticmethod
+    def _reset_stale(values: np.ndarray, periods: np.ndarray, new_periods: np.ndarray, size: int) -> None:
+        """Clear ring slots that will receive a newer period than they currently hold."""
+        if not len(new_periods):
+            return
+        latest = pd.Series(new_periods).groupby(new_periods % size).max()
+        slots = latest.index.to_numpy()
+        stale = periods[slots] < latest.to_numpy()
+        values[slots[stale]] = 0
+        periods[slots[stale]] = latest.to_numpy()[stale]
+
+    def features(self) -> Dict[str, Any]:
+        """Features as of the user's latest event."""
+        current_hour = self.last_event_ms // HOUR_MS
+        current_minute = self.last_event_ms // MINUTE_MS
+        recent_hours = self.spend_hours > current_hour - SPEND_BUCKETS
+        recent_minutes = self.event_minutes > current_minute - EVENT_BUCKETS
+
+        return {
+            "spend_24h": float(self.spend[recent_hours].sum()),
+            "events_last_minute": int(self.events[self.event_minutes == current_minute].sum()),
+            "events_per_minute_1h": float(self.events[recent_minutes].sum()) / EVENT_BUCKETS,
+            "distinct_devices_24h": int((self.device_hours > current_hour - SPEND_BUCKETS).sum()),
+        }
+
+
+def user_features_state_func(idle_timeout_ms: int):
+    """
+    Build the applyInPandasWithState function maintaining one user's features.
+
+    Args:
+        idle_timeout_ms: Event time without activity after which a user is evicted
+
+    Returns:
+        Callable: Function of (key, pdf_iter, state) yielding feature rows
+    """
+    def update_user(key: Tuple, pdf_iter: Iterator[pd.DataFrame], state) -> Iterator[pd.DataFrame]:
+        (user_id,) = key
+        user = UserFeatureState()
+        if state.exists:
+            user.load_state(state.get)
+
+        if state.hasTimedOut:
+            state.remove()
+            yield pd.DataFrame([{
+                "user_id": user_id,
+                "feature_time": pd.Timestamp(user.last_event_ms, unit="ms", tz="UTC"),
+                "spend_24h": 0.0,
+                "events_last_minute": 0,
+                "events_per_minute_1h": 0.0,
+                "distinct_devices_24h": 0,
+                "evicted": True,
+            }])
+            return
+
+        for pdf in pdf_iter:
+            user.update(pdf)
+
+        state.update(user.to_state())
+        state.setTimeoutTimestamp(user.last_event_ms + idle_timeout_ms)
+        yield pd.DataFrame([{
+            "user_id": user_id,
+            "feature_time": pd.Timestamp(user.last_event_ms, unit="ms", tz="UTC"),
+            **user.features(),
+            "evicted": False,
+        }])
+
+    return update_user
+
+
+def feature_events(activity_df, transactions_df):
+    """Union activity and transactions into the (user_id, timestamp, amount, ...) shape the state function reads."""
+    activity = activity_df.select(
+        "user_id",
+        "timestamp",
+        lit(0.0).alias("amount"),
+        lit(True).alias("is_activity"),
+        coalesce(xxhash64(col("device_info.device_type")), lit(0).cast("long")).alias("device_hash"),
+    )
+    transactions = transactions_df.filter(
+        col("status").isNull() | (col("status") != "failed")
+    ).select(
+        "user_id",
+        "timestamp",
+        col("amount").cast("double").alias("amount"),
+        lit(False).alias("is_activity"),
+        lit(0).cast("long").alias("device_hash"),
+    )
+    return activity.unionByName(transactions).withColumn(
+        "event_ms", expr("unix_millis(timestamp)")
+    ).filter(col("user_id").isNotNull() & col("timestamp").isNotNull())
+
+
+class FeatureTableSink:
+    """foreachBatch sink that merges the latest features of each user into a Delta table."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, batch_df, batch_id: int) -> None:
+        """Upsert one micro-batch of feature rows keyed on user_id."""
+        latest = batch_df.withColumn(
+            "rank", expr("row_number() OVER (PARTITION BY user_id ORDER BY feature_time DESC, evicted DESC)")
+        ).filter(col("rank") == 1).drop("rank")
+
+        spark = batch_df.sparkSession
+        if not DeltaTable.isDeltaTable(spark, self.path):
+            latest.write.format("delta").save(self.path)
+            return
+
+        (
+            DeltaTable.forPath(spark, self.path).alias("features")
+            .merge(latest.alias("batch"), "features.user_id = batch.user_id")
+            .whenMatchedUpdateAll(condition="batch.feature_time >= features.feature_time")
+            .whenNotMatchedInsertAll()
+            .execute()
+        )
+
+
+def start_user_features_query(spark, config: Dict[str, Any], activity_df, transactions_df):
+    """
+    Start the per-user feature query, if enabled.
+
+    Args:
+        spark: Active Spark session
+        config: The full sources.yaml configuration
+        activity_df: Parsed, deduplicated user activity stream (watermarked)
+        transactions_df: Parsed transactions stream
+
+    Returns:
+        StreamingQuery: The feature query, or None if disabled
+    """
+    features_config = config.get("processing", {}).get("user_features", {})
+    if not features_config.get("enabled", False):
+        return None
+
+    transactions_df = transactions_df.withWatermark(
+        "timestamp", features_config.get("transactions_watermark", "10 minutes")
+    )
+    idle_timeout_ms = int(features_config.get("idle_timeout_hours", 24)) * HOUR_MS
+
+    features_df = feature_events(activity_df, transactions_df).groupBy("user_id").applyInPandasWithState(
+        user_features_state_func(idle_timeout_ms),
+        outputStructType=FEATURES_SCHEMA,
+        stateStructType=STATE_SCHEMA,
+        outputMode="update",
+        timeoutConf=GroupStateTimeout.EventTimeTimeout,
+    )
+
+    return configure_query(
+        features_df.writeStream
+        .queryName("user_features")
+        .outputMode("update")
+        .foreachBatch(FeatureTableSink(features_config["path"])),
+        config, "user_features", features_config["checkpoint_location"]
+    ).start()
\ No newline at end of file
@@ -4,6 +4,8 @@ Unit tests for the data quality utilities.
 
 import os
 import json
+import pickle
+import numpy as np
 import pandas as pd
 import pytest
 import datetime
@@ -14,8 +16,10 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils.data_quality import (
     DataQualityCheck, NullCheck, ValueRangeCheck, UniquenessCheck,
-    SchemaCheck, AnomalyCheck, DataQualityChecker, load_checks_from_config
+    SchemaCheck, AnomalyCheck, CrossBatchUniquenessCheck, DataQualityChecker, load_checks_from_config,
+    ProfilePlan, StreamingProfiler, profile_column, profile_data, profile_data_parallel
 )
+from utils.uniqueness import KeyHistory
 
 
 # Sample test data
@@ -135,6 +139,20 @@ class TestDataQualityChecks:
         assert check.passed is False
         assert "duplicate values" in check.message.lower()
 
+    def test_uniqueness_check_distinguishes_types(self):
+        """Test that values of different types with the same text are not duplicates."""
+        # Setup: Values whose string forms collide
+        data = pd.DataFrame({'key': pd.Series([1, "1", None, "None"], dtype=object),
+                             'name': ['a', None, 'None', np.nan]})
+        check = UniquenessCheck("key_uniqueness_check", ["key", "name"], should_be_unique=True)
+        
+        # Execute: Run the check
+        result = check.run(data)
+        
+        # Verify: Check should pass, as duplicated() does
+        assert result is True
+        assert data['key'].duplicated().sum() == 0
+    
     def test_schema_check_pass(self, sample_data):
         """Test that the schema check passes when the schema matches."""
         # Setup: Create a schema check with the expected schema
@@ -201,6 +219,63 @@ class TestDataQualityChecks:
         assert check.passed is False
         assert "anomalies" in check.message.lower()
 
+    @pytest.mark.parametrize("backend", ["kll", "tdigest"])
+    def test_anomaly_check_sketch_backends(self, backend):
+        """Test that sketch backends count about as many anomalies as the exact computation."""
+        # Setup: Normal readings with 50 outliers
+        readings = pd.DataFrame({
+            "value": list(np.random.default_rng(7).normal(20.0, 2.0, 20000)) + [100.0] * 50
+        })
+        exact = AnomalyCheck("exact_check", "value", method="zscore", threshold=4.0)
+        sketched = AnomalyCheck("sketch_check", "value", method="zscore", threshold=4.0, quantile_backend=backend)
+        
+        # Execute: Run both checks
+        exact.run(readings)
+        sketched.run(readings)
+        
+        # Verify: Both fail with a count of anomalies instead of a list of values
+        assert sketched.passed is False
+        assert exact.get_result()["anomaly_count"] >= 50
+        assert sketched.get_result()["anomaly_count"] == pytest.approx(exact.anomaly_count, rel=0.1)
+        
+        with pytest.raises(ValueError):
+            AnomalyCheck("bad_backend_check", "value", quantile_backend="sorted")
+
+    def test_cross_batch_uniqueness_check(self, sample_data, tmp_path):
+        """Test that the cross-batch uniqueness check fails on ids of an earlier batch."""
+        # Setup: Two hourly batches sharing two ids
+        first_batch = sample_data.assign(timestamp=pd.Timestamp("2025-01-01 10:30"))
+        second_batch = pd.DataFrame({"id": [4, 5, 6, 7], "timestamp": pd.Timestamp("2025-01-01 11:30")})
+        history_path = str(tmp_path / "id_history.npz")
+        
+        # Execute: Check each batch with a new check, as separate runs would
+        first = CrossBatchUniquenessCheck("id_cross_batch_check", "id", history_path, mode="exact")
+        second = CrossBatchUniquenessCheck("id_cross_batch_check", "id", history_path, mode="exact")
+        
+        # Verify: Only the second batch has duplicates
+        assert first.run(first_batch) is True
+        assert second.run(second_batch) is False
+        assert "2 seen in earlier batches" in second.message
+
+    def test_cross_batch_uniqueness_check_rerun(self, sample_data, tmp_path):
+        """Test that running the check again on a batch reports the same result."""
+        # Setup: One batch with aware timestamps after one with naive timestamps of the same hour
+        history_path = str(tmp_path / "id_history.npz")
+        earlier = sample_data.assign(timestamp=pd.Timestamp("2025-01-01 10:05"))
+        batch = pd.DataFrame({"id": [10, 11], "timestamp": pd.Timestamp("2025-01-01 10:30", tz="UTC")})
+        check = CrossBatchUniquenessCheck("id_cross_batch_check", "id", history_path, mode="exact")
+        check.run(earlier)
+        
+        # Execute: Run the check on the batch twice, as a retried task would
+        first = check.run(batch)
+        first_message = check.message
+        retry = check.run(batch)
+        
+        # Verify: The retry reports the first result, and both batches share a partition
+        assert first is True and retry is True
+        assert check.message == first_message
+        assert list(KeyHistory.load(history_path).partitions) == ["2025-01-01T10:00:00"]
+
 
 class TestDataQualityChecker:
     """Test the data quality checker class."""
@@ -248,6 +323,191 @@ class TestDataQualityChecker:
         assert "Error" in results["results"][0]["message"]
 
 
+class TestFusedExecution:
+    """Test the shared column profiling of the data quality checker."""
+
+    @staticmethod
+    def build_checks():
+        """Create checks that overlap on columns."""
+        return [
+            NullCheck("null_check", ["name", "age"], threshold=0.1),
+            ValueRangeCheck("age_range_check", {"age": (20, 50), "score": (70, 100)}),
+            ValueRangeCheck("age_narrow_range_check", {"age": (26, 44)}),
+            UniquenessCheck("uniqueness_check", ["id", "active"]),
+            AnomalyCheck("score_zscore_check", "score", method="zscore", threshold=1.0),
+            AnomalyCheck("score_iqr_check", "score", method="iqr", threshold=0.5),
+            SchemaCheck("schema_check", {"id": "int"}),
+        ]
+
+    def test_checker_matches_checks_run_separately(self, sample_data):
+        """Test that checks evaluated from shared statistics give the same results as running them one by one."""
+        # Setup: Run each check on its own
+        separate = []
+        for check in self.build_checks():
+            check.run(sample_data)
+            separate.append((check.name, check.passed, check.message))
+        
+        checker = DataQualityChecker()
+        for check in self.build_checks():
+            checker.add_check(check)
+        
+        # Execute: Run the checks together
+        results = checker.run_checks(sample_data)
+        
+        # Verify: Results should be identical
+        fused = [(result["name"], result["passed"], result["message"]) for result in results["results"]]
+        assert fused == separate
+
+    def test_checker_profiles_each_column_once(self, sample_data):
+        """Test that every column read by several checks is profiled once."""
+        # Setup: Create a checker whose checks overlap on columns
+        checker = DataQualityChecker()
+        for check in self.build_checks():
+            checker.add_check(check)
+        
+        # Execute: Run the checks and count the profiled columns
+        with mock.patch("utils.data_quality.profile_column", wraps=profile_column) as profile:
+            checker.run_checks(sample_data)
+        
+        # Verify: One profile per distinct column
+        profiled = [call.args[0].name for call in profile.call_args_list]
+        assert sorted(profiled) == ["active", "age", "id", "name", "score"]
+
+    def test_plan_merges_statistics_per_column(self, sample_data):
+        """Test that the statistics requested by several checks are computed together."""
+        # Setup: Plan two range checks on the same column
+        plan = ProfilePlan()
+        ValueRangeCheck("wide", {"age": (20, 50)}).plan(plan)
+        ValueRangeCheck("narrow", {"age": (26, 44)}).plan(plan)
+        
+        # Execute: Profile the data
+        profiles = profile_data(sample_data, plan)
+        
+        # Verify: Both ranges are counted in one profile
+        assert list(profiles) == ["age"]
+        assert profiles["age"].nulls == 1
+        assert profiles["age"].range_counts == {(20, 50): (0, 0), (26, 44): (1, 1)}
+
+
+class TestParallelExecution:
+    """Test profiling columns across a process pool."""
+
+    def test_parallel_checks_match_serial_checks(self, sample_data):
+        """Test that the parallel checker gives the same results as the serial one."""
+        # Setup: Serial and parallel checkers with the same checks
+        serial, parallel = DataQualityChecker(), DataQualityChecker(workers=3)
+        for checker in (serial, parallel):
+            for check in TestFusedExecution.build_checks():
+                checker.add_check(check)
+        
+        # Execute: Run both checkers
+        serial_results = serial.run_checks(sample_data)
+        parallel_results = parallel.run_checks(sample_data)
+        
+        # Verify: Results should be identical and in the same order
+        assert [(r["name"], r["passed"], r["message"]) for r in parallel_results["results"]] == \
+            [(r["name"], r["passed"], r["message"]) for r in serial_results["results"]]
+
+    def test_parallel_profiles_match_serial_profiles(self, sample_data):
+        """Test that every column profiled by a worker matches its serial profile."""
+        # Setup: Plan the statistics of several checks
+        checker = DataQualityChecker()
+        for check in TestFusedExecution.build_checks():
+            checker.add_check(check)
+        plan = checker.plan()
+        
+        # Execute: Profile serially and with two workers
+        serial = profile_data(sample_data, plan)
+        parallel = profile_data_parallel(sample_data, plan, workers=2)
+        
+        # Verify: Same columns in the same order, with the same statistics
+        assert list(parallel) == list(serial)
+        for column in serial:
+            assert vars(parallel[column]) == vars(serial[column])
+
+
+class TestStreamingExecution:
+    """Test the chunked execution of the data quality checker."""
+
+    @staticmethod
+    def build_checker():
+        """Create a checker with one check of each profiled kind."""
+        checker = DataQualityChecker()
+        checker.add_check(NullCheck("value_null_check", ["value"], threshold=0.0))
+        checker.add_check(ValueRangeCheck("value_range_check", {"value": (0, 50)}))
+        checker.add_check(UniquenessCheck("id_uniqueness_check", ["id"]))
+        checker.add_check(AnomalyCheck("value_anomaly_check", "value", method="zscore", threshold=2.0))
+        checker.add_check(SchemaCheck("schema_check", {"id": "int", "value": "int"}))
+        return checker
+
+    def test_chunked_checks_match_in_memory_checks(self, sample_with_anomalies):
+        """Test that checking the data in chunks gives the same results as checking it at once."""
+        # Setup: Split the data into chunks
+        chunks = (sample_with_anomalies.iloc[start:start + 3] for start in range(0, 10, 3))
+        
+        # Execute: Run the checks at once and chunk by chunk
+        in_memory = self.build_checker().run_checks(sample_with_anomalies)
+        chunked = self.build_checker().run_checks_on_chunks(chunks)
+        
+        # Verify: Results should be identical
+        assert [(r["name"], r["passed"], r["message"]) for r in chunked["results"]] == \
+            [(r["name"], r["passed"], r["message"]) for r in in_memory["results"]]
+        assert chunked["summary"]["failed_checks"] == 2
+
+    def test_chunked_duplicates_are_exact(self):
+        """Test that a low rate of duplicates spread across chunks is counted exactly."""
+        # Setup: 20,000 ids of which 1% repeat an id of another chunk
+        ids = np.concatenate([np.arange(19800), np.arange(0, 19800, 99)])
+        data = pd.DataFrame({'id': ids})
+        chunks = (data.iloc[start:start + 3000] for start in range(0, len(data), 3000))
+        checker = DataQualityChecker()
+        checker.add_check(UniquenessCheck("id_uniqueness_check", ["id"]))
+        
+        # Execute: Run the check chunk by chunk
+        summary = checker.run_checks_on_chunks(chunks)
+        
+        # Verify: All 200 duplicates are reported
+        assert summary["results"][0]["passed"] is False
+        assert "{'id': 200}" in summary["results"][0]["message"]
+    
+    def test_chunked_duplicates_of_mixed_types_match(self):
+        """Test that both paths count duplicates of a mixed-type column as duplicated() does."""
+        # Setup: Equal numbers of different types, repeated strings and a null
+        data = pd.DataFrame({'key': pd.Series([1, 1.0, "a", "a", None, True, "1"], dtype=object)})
+        checker = DataQualityChecker()
+        checker.add_check(UniquenessCheck("key_uniqueness_check", ["key"]))
+        
+        # Execute: Run the check in memory and in chunks of two rows
+        in_memory = checker.run_checks(data)
+        chunked = checker.run_checks_on_chunks(data.iloc[start:start + 2] for start in range(0, len(data), 2))
+        
+        # Verify: Both report the three duplicates duplicated() finds
+        assert data['key'].duplicated().sum() == 3
+        assert in_memory["results"][0]["message"] == chunked["results"][0]["message"]
+        assert "{'key': 3}" in chunked["results"][0]["message"]
+    
+    def test_merged_profilers_match_single_profiler(self, sample_with_anomalies):
+        """Test that profilers of different chunks merge into the statistics of all the data."""
+        # Setup: Profile two halves separately, one of them sent through pickle
+        plan = self.build_checker().plan()
+        first, second = StreamingProfiler(plan), StreamingProfiler(plan)
+        first.update(sample_with_anomalies.iloc[:4])
+        second.update(sample_with_anomalies.iloc[4:])
+        
+        # Execute: Merge the profilers
+        first.merge(pickle.loads(pickle.dumps(second)))
+        merged = first.profiles()["value"]
+        
+        # Verify: Statistics should match the whole column
+        values = sample_with_anomalies["value"]
+        assert merged.rows == 10
+        assert merged.range_counts == {(0, 50): (0, 1)}
+        assert merged.mean == pytest.approx(values.mean())
+        assert merged.std == pytest.approx(values.std())
+        assert (merged.min, merged.max) == (9, 100)
+        assert merged.outliers == {("zscore", 2.0, "exact"): 1}
+
+
 class TestConfigLoading:
     """Test the configuration loading functions."""
 
@@ -0,0 +1,126 @@
+"""
+Unit tests for the GeoIP range index.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+# Import the geoip module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'spark')))
+from geoip import IpRangeIndex, ipv4_to_int
+
+
+def ip(a, b, c, d):
+    """Integer value of an IPv4 address."""
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+@pytest.fixture
+def ranges():
+    """Three non-overlapping ranges with a gap, out of order."""
+    return pd.DataFrame({
+        "start_ip": [ip(10, 0, 0, 0), ip(1, 0, 0, 0), ip(192, 168, 0, 0)],
+        "end_ip": [ip(10, 255, 255, 255), ip(1, 0, 0, 255), ip(192, 168, 255, 255)],
+        "country": ["US", "AU", "DE"],
+        "city": ["Chicago", "Sydney", "Berlin"],
+        "latitude": [41.9, -33.9, 52.5],
+        "longitude": [-87.6, 151.2, 13.4],
+    })
+
+
+class TestIpv4ToInt:
+    """Test converting dotted IPv4 strings to integers."""
+
+    def test_valid_addresses(self):
+        """Test that valid addresses convert to their integer value."""
+        ips = pd.Series(["0.0.0.0", "1.2.3.4", "10.0.0.1", "255.255.255.255"])
+        assert ipv4_to_int(ips).tolist() == [0, ip(1, 2, 3, 4), ip(10, 0, 0, 1), ip(255, 255, 255, 255)]
+
+    def test_invalid_addresses(self):
+        """Test that malformed or missing addresses become -1."""
+        ips = pd.Series(["256.0.0.1", "1.2.3", "1.2.3.4.5", "1..2.3", "a.b.c.d", "1234.1.1.1", "", None])
+        assert ipv4_to_int(ips).tolist() == [-1] * 8
+
+
+class TestIpRangeIndex:
+    """Test looking up IP addresses in the range table."""
+
+    def test_lookup_finds_containing_range(self, ranges):
+        """Test that addresses resolve to their range, and gaps and invalid addresses to nulls."""
+        # Setup: An index over the ranges
+        index = IpRangeIndex(ranges)
+        
+        # Execute: Look up addresses at range bounds, in gaps, invalid and missing
+        result = index.lookup(pd.Series([
+            "10.0.0.0", "10.255.255.255", "1.0.0.7", "192.168.10.20", "1.0.1.0", "0.0.0.1", "bad", None
+        ]))
+        
+        # Verify: Only the addresses inside a range are located
+        assert result["country"].tolist() == ["US", "US", "AU", "DE", None, None, None, None]
+        assert result["city"].tolist()[:4] == ["Chicago", "Chicago", "Sydney", "Berlin"]
+        assert result["latitude"].tolist()[2] == pytest.approx(-33.9)
+        assert result["longitude"].isna().tolist() == [False] * 4 + [True] * 4
+
+    def test_cache_returns_same_results(self, ranges):
+        """Test that cached lookups match searched ones across batches."""
+        # Setup: An index and addresses repeated across batches
+        index = IpRangeIndex(ranges)
+        ips = pd.Series(["10.1.2.3", "1.0.0.1", "8.8.8.8", "10.1.2.3"])
+        
+        # Execute: Look up the same batch twice
+        first = index.lookup(ips)
+        second = index.lookup(ips)
+        
+        # Verify: The distinct addresses are cached and results are unchanged
+        assert len(index.cache_keys) == 3
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_malformed_addresses_are_not_cached(self, ranges):
+        """Test that invalid and leading-zero addresses keep the cache keys unique."""
+        # Setup: An index over the ranges
+        index = IpRangeIndex(ranges)
+        
+        # Execute: Two malformed addresses and a leading-zero variant, then a second batch
+        first = index.lookup(pd.Series(["bad", "::1", "10.0.0.1", "010.0.0.1"]))
+        second = index.lookup(pd.Series(["10.0.0.1", "1.0.0.5", "bad", "::1"]))
+        
+        # Verify: Each valid address is cached once and lookups still resolve
+        assert sorted(index.cache_keys.tolist()) == [ip(1, 0, 0, 5), ip(10, 0, 0, 1)]
+        assert index.cache_index.is_unique
+        assert first["country"].tolist() == [None, None, "US", "US"]
+        assert second["country"].tolist() == ["US", "AU", None, None]
+
+    def test_cache_evicts_least_recently_used(self, ranges):
+        """Test that the cache keeps only the most recently used addresses."""
+        # Setup: An index caching two addresses
+        index = IpRangeIndex(ranges, cache_size=2)
+        
+        # Execute: Use three addresses in separate batches, then reuse the first
+        for batch in [["10.0.0.1"], ["10.0.0.2"], ["10.0.0.1"], ["10.0.0.3"]]:
+            index.lookup(pd.Series(batch))
+        
+        # Verify: The address unused for longest was evicted
+        cached = set(index.cache_keys.tolist())
+        assert cached == {ip(10, 0, 0, 1), ip(10, 0, 0, 3)}
+        assert len(index.cache_values) == len(index.cache_last_used) == 2
+
+    def test_search_matches_brute_force(self, ranges):
+        """Test the vectorized search against a scan of the ranges."""
+        # Setup: Random addresses, many of them inside the ranges
+        rng = np.random.default_rng(7)
+        ips = np.concatenate([
+            rng.integers(0, 1 << 32, 1000),
+            rng.integers(ip(10, 0, 0, 0), ip(11, 0, 0, 0), 500),
+        ]).astype(np.int64)
+        index = IpRangeIndex(ranges)
+        
+        # Execute: Search all addresses
+        found = index.search(ips)
+        
+        # Verify: Each address maps to the range that contains it, or -1
+        for value, position in zip(ips, found):
+            inside = np.flatnonzero((index.starts <= value) & (value <= index.ends))
+            assert position == (inside[0] if len(inside) else -1)
\ No newline at end of file
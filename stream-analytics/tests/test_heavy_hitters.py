@@ -0,0 +1,89 @@
+"""
+Unit tests for the heavy hitters sketch.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+# Import the heavy hitters module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'spark')))
+from heavy_hitters import CountMinTopK
+
+
+@pytest.fixture
+def zipf_items():
+    """Items with a skewed (Zipf) frequency distribution."""
+    rng = np.random.default_rng(42)
+    return pd.Series([f"item-{value}" for value in rng.zipf(1.3, 50000) % 5000])
+
+
+class TestCountMinTopK:
+    """Test the count-min sketch with top-K candidates."""
+
+    def test_estimates_are_within_error_bound(self, zipf_items):
+        """Test that estimates never undercount and overcount by at most the error bound."""
+        # Setup: A sketch and the exact counts
+        sketch = CountMinTopK(epsilon=0.001, delta=0.01, capacity=200)
+        exact = zipf_items.value_counts()
+        
+        # Execute: Count the items in batches
+        for start in range(0, len(zipf_items), 10000):
+            sketch.update(zipf_items.iloc[start:start + 10000])
+        
+        # Verify: Each top estimate is within [exact, exact + error bound]
+        assert sketch.total_count == len(zipf_items)
+        for item, estimate in sketch.top(20):
+            assert exact[item] <= estimate <= exact[item] + sketch.error_bound()
+
+    def test_top_items_match_exact_top_items(self, zipf_items):
+        """Test that the top items are the most frequent items."""
+        # Setup: A sketch of all items
+        sketch = CountMinTopK(capacity=200)
+        
+        # Execute: Count the items
+        sketch.update(zipf_items)
+        
+        # Verify: The top 10 items are the exact top 10
+        assert [item for item, _ in sketch.top(10)] == list(zipf_items.value_counts().index[:10])
+
+    def test_candidates_are_bounded(self, zipf_items):
+        """Test that the number of candidates does not exceed the capacity."""
+        # Setup: A sketch keeping 50 candidates
+        sketch = CountMinTopK(capacity=50)
+        
+        # Execute: Count thousands of distinct items
+        sketch.update(zipf_items)
+        
+        # Verify: Only 50 candidates are kept
+        assert len(sketch.candidates) == 50
+
+    def test_nulls_are_ignored(self):
+        """Test that missing items are not counted."""
+        # Setup: A sketch
+        sketch = CountMinTopK()
+        
+        # Execute: Count items with nulls
+        sketch.update(pd.Series(["a", None, "a", np.nan, "b"]))
+        
+        # Verify: Only the present items are counted
+        assert sketch.total_count == 3
+        assert sketch.top(2) == [("a", 2), ("b", 1)]
+
+    def test_state_round_trip(self, zipf_items):
+        """Test that a sketch restored from its state continues counting."""
+        # Setup: Count half of the items and save the state
+        sketch = CountMinTopK()
+        sketch.update(zipf_items.iloc[:25000])
+        
+        # Execute: Restore the state and count the other half
+        restored = CountMinTopK().load_state(sketch.to_state())
+        restored.update(zipf_items.iloc[25000:])
+        sketch.update(zipf_items.iloc[25000:])
+        
+        # Verify: Both sketches agree
+        assert restored.total_count == sketch.total_count
+        assert np.array_equal(restored.counts, sketch.counts)
+        assert restored.top(10) == sketch.top(10)
\ No newline at end of file
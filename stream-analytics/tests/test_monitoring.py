@@ -0,0 +1,115 @@
+"""
+Unit tests for parsing the streaming query metrics.
+"""
+
+import os
+import pytest
+
+# Import the monitoring module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.monitoring import MetricsCollector, parse_streaming_metrics
+
+
+# Metrics of two queries, as exposed by spark/streaming_metrics.py
+METRICS_TEXT = """\
+# HELP stream_analytics_streaming_input_rows_total Total number of rows read by the query
+# TYPE stream_analytics_streaming_input_rows_total counter
+stream_analytics_streaming_input_rows_total{query="raw_events"} 1500.0
+stream_analytics_streaming_input_rows_total{query="sessions"} 1200.0
+# HELP stream_analytics_streaming_input_rows_created Creation time of the counter
+# TYPE stream_analytics_streaming_input_rows_created gauge
+stream_analytics_streaming_input_rows_created{query="raw_events"} 1.7e+09
+# HELP stream_analytics_streaming_processed_rows_per_second Rate at which rows were processed
+# TYPE stream_analytics_streaming_processed_rows_per_second gauge
+stream_analytics_streaming_processed_rows_per_second{query="raw_events"} 250.5
+# HELP stream_analytics_streaming_batch_duration_seconds Duration of each phase of the last micro-batch
+# TYPE stream_analytics_streaming_batch_duration_seconds gauge
+stream_analytics_streaming_batch_duration_seconds{operation="addBatch",query="raw_events"} 1.25
+stream_analytics_streaming_batch_duration_seconds{operation="triggerExecution",query="raw_events"} 2.5
+# HELP stream_analytics_streaming_offsets_behind_latest Offsets between the last processed and the latest
+# TYPE stream_analytics_streaming_offsets_behind_latest gauge
+stream_analytics_streaming_offsets_behind_latest{query="raw_events",topic="user-activity"} 42.0
+# HELP stream_analytics_streaming_batch_id Id of the last completed micro-batch
+# TYPE stream_analytics_streaming_batch_id gauge
+stream_analytics_streaming_batch_id{query="raw_events"} 17.0
+# HELP stream_analytics_streaming_state_rows Total number of rows held in the state store
+# TYPE stream_analytics_streaming_state_rows gauge
+stream_analytics_streaming_state_rows{query="sessions"} 3000.0
+# HELP stream_analytics_streaming_query_active Whether the query is running
+# TYPE stream_analytics_streaming_query_active gauge
+stream_analytics_streaming_query_active{query="raw_events"} 1.0
+stream_analytics_streaming_query_active{query="sessions"} 0.0
+# HELP process_cpu_seconds_total Total user and system CPU time spent in seconds
+# TYPE process_cpu_seconds_total counter
+process_cpu_seconds_total 12.0
+"""
+
+
+class TestParseStreamingMetrics:
+    """Test parsing the Prometheus exposition of the processor."""
+
+    def test_metrics_are_grouped_by_query(self):
+        """Test that each sample is stored under its query with the expected type."""
+        # Execute: Parse the metrics of two queries
+        queries = parse_streaming_metrics(METRICS_TEXT)
+        
+        # Verify: Values are keyed by query and converted
+        assert set(queries) == {"raw_events", "sessions"}
+        raw_events = queries["raw_events"]
+        assert raw_events["records_processed"] == 1500
+        assert raw_events["batch_id"] == 17
+        assert raw_events["active"] is True
+        assert raw_events["processed_rows_per_second"] == pytest.approx(250.5)
+        assert queries["sessions"] == {"records_processed": 1200, "state_rows": 3000, "active": False}
+
+    def test_labelled_metrics_are_nested(self):
+        """Test that per-operation and per-topic metrics become nested dictionaries."""
+        # Execute: Parse the metrics
+        raw_events = parse_streaming_metrics(METRICS_TEXT)["raw_events"]
+        
+        # Verify: Durations are keyed by operation and lag by topic
+        assert raw_events["batch_duration_seconds"] == {"addBatch": 1.25, "triggerExecution": 2.5}
+        assert raw_events["offsets_behind_latest"] == {"user-activity": 42}
+        assert isinstance(raw_events["offsets_behind_latest"]["user-activity"], int)
+
+    def test_other_metrics_are_ignored(self):
+        """Test that process metrics and counter creation times are skipped."""
+        # Execute: Parse only metrics outside the streaming prefix
+        queries = parse_streaming_metrics(
+            "# TYPE process_cpu_seconds_total counter\nprocess_cpu_seconds_total 12.0\n"
+        )
+        
+        # Verify: Nothing is parsed, and created samples never appear
+        assert queries == {}
+        assert "input_rows_created" not in parse_streaming_metrics(METRICS_TEXT)["raw_events"]
+
+class FakeResponse:
+    """Response of a successful scrape."""
+
+    text = METRICS_TEXT
+
+    def raise_for_status(self):
+        pass
+
+
+class TestCollectSparkMetrics:
+    """Test summarizing the scraped streaming metrics."""
+
+    def test_summary_keeps_cluster_metrics(self, tmp_path, monkeypatch):
+        """Test that the summary has application and cluster metrics."""
+        # Setup: A collector whose endpoint returns the metrics of two queries
+        config_path = tmp_path / "monitoring.yaml"
+        config_path.write_text("metrics:\n  spark:\n    applications: [stream_processor]\n")
+        collector = MetricsCollector(str(config_path))
+        monkeypatch.setattr("utils.monitoring.requests.get", lambda endpoint, timeout: FakeResponse())
+        
+        # Execute: Collect the Spark metrics
+        metrics = collector.collect_spark_metrics()
+        
+        # Verify: Totals are summed over queries and cluster_metrics is still returned
+        application = metrics["application_metrics"]["stream_processor"]
+        assert application["status"] == "running"
+        assert application["active_queries"] == 1
+        assert application["records_processed"] == 2700
+        assert metrics["cluster_metrics"] == {"active_applications": 1}
\ No newline at end of file
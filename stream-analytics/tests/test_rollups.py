@@ -0,0 +1,67 @@
+"""
+Unit tests for choosing rollup tiers.
+"""
+
+import os
+from datetime import datetime, timezone
+import pytest
+
+# Import the rollups module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'spark')))
+from rollups import DEFAULT_TIERS, coarsest_tier, tier_seconds
+
+
+def utc(*args):
+    """A UTC datetime."""
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestTierSeconds:
+    """Test the length of window durations."""
+
+    @pytest.mark.parametrize("duration, seconds", [
+        ("1 minute", 60),
+        ("5 minutes", 300),
+        ("1 hour", 3600),
+        ("2 hours", 7200),
+        ("1 day", 86400),
+    ])
+    def test_durations(self, duration, seconds):
+        """Test singular and plural units."""
+        assert tier_seconds(duration) == seconds
+
+    def test_unknown_unit(self):
+        """Test that unsupported units are rejected."""
+        with pytest.raises(KeyError):
+            tier_seconds("1 week")
+
+
+class TestCoarsestTier:
+    """Test picking the tier to query for a time range."""
+
+    def test_day_aligned_range_uses_daily_tier(self):
+        """Test that a range of whole days is served by the daily tier."""
+        tier = coarsest_tier(DEFAULT_TIERS, utc(2025, 1, 1), utc(2025, 1, 8))
+        assert tier["name"] == "1d"
+
+    def test_hour_aligned_range_uses_hourly_tier(self):
+        """Test that a range of whole hours not aligned to days is served by the hourly tier."""
+        tier = coarsest_tier(DEFAULT_TIERS, utc(2025, 1, 1, 6), utc(2025, 1, 2))
+        assert tier["name"] == "1h"
+
+    def test_minute_aligned_range_uses_minute_tier(self):
+        """Test that a range cutting an hour falls back to the minute tier."""
+        tier = coarsest_tier(DEFAULT_TIERS, utc(2025, 1, 1, 6, 30), utc(2025, 1, 1, 8))
+        assert tier["name"] == "1m"
+
+    def test_unaligned_range_uses_finest_tier(self):
+        """Test that a range no tier aligns to is served by the finest tier."""
+        tier = coarsest_tier(DEFAULT_TIERS, utc(2025, 1, 1, 6, 30, 15), utc(2025, 1, 1, 8))
+        assert tier["name"] == "1m"
+
+    def test_naive_datetimes_are_utc(self):
+        """Test that naive datetimes are read as UTC."""
+        tier = coarsest_tier(DEFAULT_TIERS, datetime(2025, 1, 1), datetime(2025, 1, 2))
+        assert tier["name"] == "1d"
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Unit tests for the distinct-count sketch utilities.
+"""
+
+import os
+import datetime
+import pytest
+from datasketches import hll_sketch
+
+# Import the sketch module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.sketches import (
+    merge_hll_sketches, estimate_distinct, truncate_timestamp, rollup_sketches
+)
+
+
+def build_sketch(values):
+    """Build a serialized HLL sketch of the given values."""
+    sketch = hll_sketch(12)
+    for value in values:
+        sketch.update(value)
+    return sketch.serialize_compact()
+
+
+@pytest.fixture
+def hourly_sketches():
+    """Create hourly sketches spanning two days with overlapping users."""
+    return [
+        (datetime.datetime(2025, 1, 1, 10), build_sketch([f"user_{i}" for i in range(0, 1000)])),
+        (datetime.datetime(2025, 1, 1, 11), build_sketch([f"user_{i}" for i in range(500, 1500)])),
+        (datetime.datetime(2025, 1, 2, 10), build_sketch([f"user_{i}" for i in range(0, 200)])),
+    ]
+
+
+class TestSketchMerging:
+    """Test merging and estimating sketches."""
+
+    def test_merge_overlapping_sketches(self):
+        """Test that merging sketches counts overlapping values once."""
+        # Setup: Two sketches sharing half their users
+        first = build_sketch([f"user_{i}" for i in range(0, 1000)])
+        second = build_sketch([f"user_{i}" for i in range(500, 1500)])
+        
+        # Execute: Merge and estimate
+        merged = merge_hll_sketches([first, second])
+        
+        # Verify: Estimate is close to the 1500 distinct users
+        assert abs(estimate_distinct(merged) - 1500) < 1500 * 0.05
+
+    def test_merge_skips_missing_sketches(self):
+        """Test that missing sketches are ignored."""
+        sketch = build_sketch(["a", "b", "c"])
+        
+        assert estimate_distinct(merge_hll_sketches([None, sketch, None])) == 3
+        assert merge_hll_sketches([None]) is None
+        assert estimate_distinct(None) == 0
+
+
+class TestSketchRollups:
+    """Test rolling sketches up to coarser periods."""
+
+    def test_truncate_timestamp(self):
+        """Test truncating timestamps to each supported period."""
+        timestamp = datetime.datetime(2025, 1, 8, 13, 45, 12)
+        
+        assert truncate_timestamp(timestamp, "hour") == datetime.datetime(2025, 1, 8, 13)
+        assert truncate_timestamp(timestamp, "day") == datetime.datetime(2025, 1, 8)
+        assert truncate_timestamp(timestamp, "week") == datetime.datetime(2025, 1, 6)
+        assert truncate_timestamp(timestamp, "month") == datetime.datetime(2025, 1, 1)
+        
+        with pytest.raises(ValueError):
+            truncate_timestamp(timestamp, "year")
+
+    def test_daily_rollup(self, hourly_sketches):
+        """Test that hourly sketches roll up to daily unique counts."""
+        # Execute: Roll up to days
+        rollup = rollup_sketches(hourly_sketches, period="day")
+        
+        # Verify: One group per day with de-duplicated counts
+        first_day = rollup[(datetime.datetime(2025, 1, 1),)]
+        second_day = rollup[(datetime.datetime(2025, 1, 2),)]
+        assert first_day["merged_sketches"] == 2
+        assert abs(first_day["unique_count"] - 1500) < 1500 * 0.05
+        assert abs(second_day["unique_count"] - 200) < 200 * 0.05
+
+    def test_rollup_keeps_dimensions(self):
+        """Test that dimensions between the timestamp and the sketch are kept."""
+        rows = [
+            (datetime.datetime(2025, 1, 1, 10), "US", build_sketch(["a", "b"])),
+            (datetime.datetime(2025, 1, 1, 11), "US", build_sketch(["b", "c"])),
+            (datetime.datetime(2025, 1, 1, 11), "DE", build_sketch(["a"])),
+        ]
+        
+        rollup = rollup_sketches(rows, period="week")
+        
+        assert rollup[(datetime.datetime(2024, 12, 30), "US")]["unique_count"] == 3
+        assert rollup[(datetime.datetime(2024, 12, 30), "DE")]["unique_count"] == 1
+
+
+if __name__ == "__main__":
+    pytest.main(["-xvs", __file__])
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""
+Unit tests for the cross-batch uniqueness utilities.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+# Import the uniqueness module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.uniqueness import BloomFilter, KeyHistory, SortedHashSet, hash_keys
+
+
+def event_ids(start, stop):
+    """Hashes of a range of string event ids."""
+    return hash_keys(pd.Series([f"evt-{i}" for i in range(start, stop)]))
+
+
+class TestBloomFilter:
+    """Test the Bloom filter of key hashes."""
+
+    def test_added_keys_are_found(self):
+        """Test that the filter has no false negatives and few false positives."""
+        # Setup: A filter sized for 10,000 keys
+        bloom = BloomFilter(num_bits=1 << 17, num_hashes=9)
+        
+        # Execute: Add 10,000 keys
+        bloom.add(event_ids(0, 10000))
+        
+        # Verify: Added keys are found, others rarely
+        assert bloom.contains(event_ids(0, 10000)).all()
+        assert bloom.contains(event_ids(10000, 20000)).mean() < 0.01
+        assert bloom.false_positive_rate() < 0.01
+
+    def test_keys_of_different_types_hash_differently(self):
+        """Test that keys with the same text but different types are different keys."""
+        # Execute: Hash an int, a string, a null and the null's text
+        hashes = hash_keys(pd.Series([1, "1", None, "None", np.nan, "nan"], dtype=object))
+        
+        # Verify: All hashes differ
+        assert len(set(hashes.tolist())) == 6
+    
+    def test_size_must_be_power_of_two(self):
+        """Test that filter sizes are validated."""
+        with pytest.raises(ValueError):
+            BloomFilter(num_bits=1000, num_hashes=3)
+
+
+class TestSortedHashSet:
+    """Test the exact set of key hashes."""
+
+    def test_chunks_are_merged_into_few_runs(self):
+        """Test that overlapping chunks are counted once and kept in few sorted runs."""
+        # Setup: An empty set
+        hashes = SortedHashSet()
+        
+        # Execute: Add 100 chunks of 1,000 keys, each overlapping the previous one by half
+        for chunk in range(100):
+            hashes.add(event_ids(chunk * 500, chunk * 500 + 1000))
+        
+        # Verify: Every key is counted once, found, and the runs stay logarithmic
+        assert hashes.keys == 50500
+        assert len(hashes.runs) <= 8
+        assert hashes.contains(event_ids(0, 50500)).all()
+        assert not hashes.contains(event_ids(50500, 51500)).any()
+        merged = hashes.hashes
+        assert (merged[1:] > merged[:-1]).all()
+        assert len(hashes.runs) == 1
+
+
+class TestKeyHistory:
+    """Test counting duplicates across batches."""
+
+    @pytest.mark.parametrize("mode", ["bloom", "exact"])
+    def test_cross_batch_duplicates(self, mode):
+        """Test that keys of earlier batches and repeated keys of the batch are counted."""
+        # Setup: A history holding one batch
+        history = KeyHistory(mode=mode, retention=24, memory_budget_bytes=1 << 20, expected_keys=10000)
+        first = history.check_batch(event_ids(0, 1000), "2025-01-01T10:00:00")
+        
+        # Execute: A batch overlapping the first by 100 keys, with 10 keys repeated
+        batch = np.concatenate([event_ids(900, 1900), event_ids(1000, 1010)])
+        result = history.check_batch(batch, "2025-01-01T11:00:00")
+        
+        # Verify: Duplicates are counted exactly
+        assert first["cross_batch_duplicates"] == 0
+        assert result["keys"] == 1010
+        assert result["batch_duplicates"] == 10
+        assert result["cross_batch_duplicates"] == 100
+        assert result["duplicate_rate"] == pytest.approx(110 / 1010)
+
+    def test_oldest_partitions_are_dropped(self):
+        """Test that only the most recent partitions are kept."""
+        # Setup: A history keeping two hours of keys
+        history = KeyHistory(mode="exact", retention=2)
+        
+        # Execute: Record three hours, then check the first hour's keys
+        history.check_batch(event_ids(0, 100), "2025-01-01T10:00:00")
+        history.check_batch(event_ids(100, 200), "2025-01-01T11:00:00")
+        history.check_batch(event_ids(200, 300), "2025-01-01T12:00:00")
+        result = history.check_batch(event_ids(0, 200), "2025-01-01T12:00:00", record=False)
+        
+        # Verify: The first hour is forgotten
+        assert list(history.partitions) == ["2025-01-01T11:00:00", "2025-01-01T12:00:00"]
+        assert result["cross_batch_duplicates"] == 100
+
+    @pytest.mark.parametrize("mode", ["bloom", "exact"])
+    def test_history_persists_between_runs(self, tmp_path, mode):
+        """Test that a saved history detects keys of batches from earlier runs."""
+        # Setup: Record a batch and save the history
+        path = str(tmp_path / "history.npz")
+        history = KeyHistory.open(path, mode=mode, memory_budget_bytes=1 << 20, expected_keys=10000)
+        history.check_batch(event_ids(0, 1000), "2025-01-01T10:00:00")
+        history.save(path)
+        
+        # Execute: Load the history in a new run
+        loaded = KeyHistory.open(path)
+        result = loaded.check_batch(event_ids(500, 1500), "2025-01-01T11:00:00")
+        
+        # Verify: The keys of the earlier run are found
+        assert loaded.mode == mode
+        assert result["cross_batch_duplicates"] == 500
+        assert loaded.nbytes <= 1 << 20
+
+    def test_recording_a_batch_again_is_idempotent(self):
+        """Test that a batch recorded before gets its original result."""
+        # Setup: A history holding one hour, and a batch overlapping it
+        history = KeyHistory(mode="exact")
+        history.check_batch(event_ids(0, 100), "2025-01-01T10:00:00")
+        batch = event_ids(50, 150)
+        
+        # Execute: Record the batch twice, as a retried task would
+        first = history.check_batch(batch, "2025-01-01T11:00:00")
+        retry = history.check_batch(batch[::-1], "2025-01-01T11:00:00")
+        
+        # Verify: The retry reports the first result
+        assert first["cross_batch_duplicates"] == 50
+        assert retry == first
+
+    def test_open_applies_changed_settings(self, tmp_path):
+        """Test that a saved history is adapted to the configured settings."""
+        # Setup: Save an exact history of three hours
+        path = str(tmp_path / "history.npz")
+        history = KeyHistory(mode="exact", retention=24)
+        for hour in range(3):
+            history.check_batch(event_ids(hour * 100, hour * 100 + 100), f"2025-01-01T1{hour}:00:00")
+        history.save(path)
+        
+        # Execute: Open it as a bloom history of two hours, and that as exact again
+        bloom = KeyHistory.open(path, mode="bloom", retention=2, memory_budget_bytes=1 << 20, expected_keys=1000)
+        bloom.save(path)
+        exact = KeyHistory.open(path, mode="exact", retention=2)
+        
+        # Verify: The newest keys are carried over to the bloom history, then forgotten
+        assert (bloom.mode, bloom.retention) == ("bloom", 2)
+        assert list(bloom.partitions) == ["2025-01-01T11:00:00", "2025-01-01T12:00:00"]
+        assert bloom.check_batch(event_ids(100, 300), "2025-01-01T13:00:00", record=False)["cross_batch_duplicates"] == 200
+        assert exact.mode == "exact"
+        assert exact.partitions == {}
\ No newline at end of file
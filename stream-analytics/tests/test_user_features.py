@@ -0,0 +1,171 @@
+"""
+Unit tests for the per-user rolling feature state.
+"""
+
+import os
+import pandas as pd
+import pytest
+
+# Import the user features module
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'spark')))
+from user_features import (
+    DEVICE_SLOTS, HOUR_MS, MINUTE_MS, UserFeatureState, user_features_state_func
+)
+
+# Start of an hour, in epoch milliseconds
+T0 = 1735725600000
+
+
+def events(rows):
+    """Event rows of (event_ms, amount, is_activity, device_hash)."""
+    return pd.DataFrame(rows, columns=["event_ms", "amount", "is_activity", "device_hash"])
+
+
+class FakeGroupState:
+    """Minimal GroupState holding one state row."""
+
+    def __init__(self, state=None, timed_out=False):
+        self.state = state
+        self.hasTimedOut = timed_out
+        self.timeout_ms = None
+
+    @property
+    def exists(self):
+        return self.state is not None
+
+    @property
+    def get(self):
+        return self.state
+
+    def update(self, state):
+        self.state = state
+
+    def remove(self):
+        self.state = None
+
+    def setTimeoutTimestamp(self, timeout_ms):
+        self.timeout_ms = timeout_ms
+
+
+class TestUserFeatureState:
+    """Test the ring-buffer state of one user."""
+
+    def test_features_of_one_batch(self):
+        """Test spend, activity rate and devices of a single batch."""
+        # Setup: Two purchases, three activity events in the last minute and one earlier
+        state = UserFeatureState()
+        batch = events([
+            (T0, 10.0, False, 0),
+            (T0 + 30 * MINUTE_MS, 5.5, False, 0),
+            (T0 + 10 * MINUTE_MS, 0.0, True, 11),
+            (T0 + 59 * MINUTE_MS, 0.0, True, 11),
+            (T0 + 59 * MINUTE_MS + 1000, 0.0, True, 22),
+            (T0 + 59 * MINUTE_MS + 2000, 0.0, True, 0),
+        ])
+        
+        # Execute: Fold the batch into the state
+        state.update(batch)
+        features = state.features()
+        
+        # Verify: All events fall inside the windows
+        assert state.last_event_ms == T0 + 59 * MINUTE_MS + 2000
+        assert features["spend_24h"] == pytest.approx(15.5)
+        assert features["events_last_minute"] == 3
+        assert features["events_per_minute_1h"] == pytest.approx(4 / 60)
+        assert features["distinct_devices_24h"] == 2
+
+    def test_old_buckets_leave_the_window(self):
+        """Test that spend and events older than their window no longer count."""
+        # Setup: Spend and activity at the start of the day
+        state = UserFeatureState()
+        state.update(events([(T0, 100.0, False, 0), (T0, 0.0, True, 7)]))
+        
+        # Execute: A batch 24 hours later that reuses the same ring slots
+        state.update(events([(T0 + 24 * HOUR_MS, 1.0, False, 0), (T0 + 24 * HOUR_MS, 0.0, True, 0)]))
+        features = state.features()
+        
+        # Verify: Only the new hour and minute are counted
+        assert features["spend_24h"] == pytest.approx(1.0)
+        assert features["events_last_minute"] == 1
+        assert features["events_per_minute_1h"] == pytest.approx(1 / 60)
+        assert features["distinct_devices_24h"] == 0
+
+    def test_late_events_outside_the_window_are_dropped(self):
+        """Test that events older than the window are not added to a ring slot."""
+        # Setup: A user whose latest event is 30 hours after T0
+        state = UserFeatureState()
+        state.update(events([(T0 + 30 * HOUR_MS, 2.0, False, 0)]))
+        
+        # Execute: A late transaction from T0
+        state.update(events([(T0, 50.0, False, 0)]))
+        
+        # Verify: The late spend does not overwrite the slot it maps to
+        assert state.features()["spend_24h"] == pytest.approx(2.0)
+
+    def test_least_recently_seen_device_is_replaced(self):
+        """Test that a new device takes the slot of the device seen longest ago."""
+        # Setup: Fill every device slot, one device per hour
+        state = UserFeatureState()
+        state.update(events([(T0 + hour * HOUR_MS, 0.0, True, hour + 1) for hour in range(DEVICE_SLOTS)]))
+        
+        # Execute: See the first device again, then a new device
+        state.update(events([(T0 + DEVICE_SLOTS * HOUR_MS, 0.0, True, 1)]))
+        state.update(events([(T0 + (DEVICE_SLOTS + 1) * HOUR_MS, 0.0, True, 100)]))
+        
+        # Verify: The second device was evicted
+        assert set(state.device_hashes.tolist()) == {1, 100} | set(range(3, DEVICE_SLOTS + 1))
+        assert state.features()["distinct_devices_24h"] == DEVICE_SLOTS
+
+    def test_state_round_trip(self):
+        """Test that packing and unpacking the buffers preserves the features."""
+        # Setup: A state with spend, activity and devices
+        state = UserFeatureState()
+        state.update(events([(T0, 12.5, False, 0), (T0 + MINUTE_MS, 0.0, True, 3), (T0 + HOUR_MS, 0.0, True, 4)]))
+        
+        # Execute: Pack the state and load it into a new object
+        loaded = UserFeatureState().load_state(state.to_state())
+        
+        # Verify: The buffers and features are unchanged
+        assert loaded.last_event_ms == state.last_event_ms
+        assert (loaded.spend_hours == state.spend_hours).all()
+        assert (loaded.event_minutes == state.event_minutes).all()
+        assert loaded.features() == state.features()
+
+
+class TestUserFeaturesStateFunc:
+    """Test the applyInPandasWithState function."""
+
+    def test_updates_state_and_timeout(self):
+        """Test that a batch updates the state, the timeout and the emitted features."""
+        # Setup: A new user and a one hour idle timeout
+        update_user = user_features_state_func(HOUR_MS)
+        group_state = FakeGroupState()
+        
+        # Execute: Process one batch in two chunks
+        chunks = [events([(T0, 20.0, False, 0)]), events([(T0 + MINUTE_MS, 0.0, True, 5)])]
+        (row,) = list(update_user(("user_1",), iter(chunks), group_state))
+        
+        # Verify: The features cover both chunks and the timeout follows the last event
+        assert row.loc[0, "user_id"] == "user_1"
+        assert row.loc[0, "spend_24h"] == pytest.approx(20.0)
+        assert row.loc[0, "feature_time"] == pd.Timestamp(T0 + MINUTE_MS, unit="ms", tz="UTC")
+        assert not row.loc[0, "evicted"]
+        assert group_state.exists
+        assert group_state.timeout_ms == T0 + MINUTE_MS + HOUR_MS
+
+    def test_timed_out_user_is_evicted(self):
+        """Test that an idle user is emitted with zeroed features and removed."""
+        # Setup: A stored user whose timeout has fired
+        user = UserFeatureState()
+        user.update(events([(T0, 20.0, False, 0)]))
+        group_state = FakeGroupState(user.to_state(), timed_out=True)
+        
+        # Execute: Call the function on the timeout
+        (row,) = list(user_features_state_func(HOUR_MS)(("user_1",), iter([]), group_state))
+        
+        # Verify: The eviction row is zeroed and the state is removed
+        assert row.loc[0, "evicted"]
+        assert row.loc[0, "spend_24h"] == 0.0
+        assert row.loc[0, "feature_time"] == pd.Timestamp(T0, unit="ms", tz="UTC")
+        assert not group_state.exists
\ No newline at end of file
@@ -3,6 +3,20 @@ Data Quality Monitoring Utilities
 
 This module provides utilities for monitoring and validating data quality
 in the streaming analytics pipeline.
+
+Checks that read column statistics (nulls, ranges, duplicates, anomalies)
+request them in a ProfilePlan. DataQualityChecker merges the plans of all
+its checks and profiles each column once, however many checks read it.
+Data that does not fit in memory is checked chunk by chunk with a
+StreamingProfiler, whose per-column state is mergeable: sketches of a few
+kilobytes, plus 8 bytes per distinct key for duplicate counts. Duplicate
+counts are exact, so unlike the rest of the state their memory is not
+constant: it grows with the number of distinct values of each checked
+column (16 MB per 2 million distinct keys).
+Duplicates across batches are counted against a persisted key history
+(see utils.uniqueness). With several workers, the columns are profiled in
+parallel by forked processes that read the DataFrame from the parent's
+memory instead of receiving a copy.
 """
 
 import os
@@ -11,9 +25,15 @@ import json
 import yaml
 import logging
 import datetime
+import multiprocessing
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Any, Optional, Tuple, Union
+from datasketches import kll_doubles_sketch, tdigest_double
+
+from utils.sketches import truncate_timestamp
+from utils.uniqueness import KeyHistory, SortedHashSet, hash_keys
 
 # Configure logging
 logging.basicConfig(
@@ -22,6 +42,19 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Sketch sizes of the streaming column state (a few KB per column)
+DEFAULT_KLL_K = 200
+DEFAULT_TDIGEST_K = 200
+
+# Quantile backends of the anomaly checks: exact sorts the column, the
+# sketches read it once in bounded memory. KLL has a uniform rank error and
+# suits the quartiles of IQR; t-digest is most accurate in the tails and
+# suits z-score bounds. Streaming profiles use KLL for 'exact'.
+QUANTILE_BACKENDS = ("exact", "kll", "tdigest")
+
+# DataFrame being profiled by forked workers, which inherit it copy-on-write
+_shared_data: Optional[pd.DataFrame] = None
+
 
 class DataQualityCheck:
     """Base class for data quality checks."""
@@ -48,7 +81,453 @@ class DataQualityCheck:
         }
 
 
-class NullCheck(DataQualityCheck):
+class ProfilePlan:
+    """Column statistics requested by a set of checks, merged per column."""
+    
+    def __init__(self):
+        # Column -> statistic -> set of parameter tuples
+        self.columns: Dict[str, Dict[str, set]] = {}
+    
+    def require(self, column: str, statistic: str, *params: Any) -> None:
+        """
+        Request a statistic of a column.
+        
+        Args:
+            column: Column the statistic is computed on
+            statistic: 'nulls', 'range', 'duplicates', 'moments', 'zscore' or 'iqr'
+            params: Parameters of the statistic (the bounds of a range, the threshold and
+                quantile backend of an outlier count)
+        """
+        self.columns.setdefault(column, {}).setdefault(statistic, set()).add(params)
+
+
+class ColumnProfile:
+    """Statistics of one column, shared by every check that reads the column."""
+    
+    def __init__(self, column: str):
+        self.column = column
+        self.rows = 0
+        self.nulls = 0
+        # (min, max) -> (below_min, above_max) among the non-null values
+        self.range_counts = {}
+        self.duplicates = 0
+        # Moments of the values that convert to numbers
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        # Quantile backend -> {0.25: q1, 0.75: q3}
+        self.quantiles = {}
+        # (method, threshold, quantile backend) -> number of outliers
+        self.outliers = {}
+    
+    @property
+    def std(self) -> float:
+        """Sample standard deviation of the numeric values (NaN for fewer than two values)."""
+        if self.numeric_count < 2:
+            return float("nan")
+        return float(np.sqrt(self.m2 / (self.numeric_count - 1)))
+
+
+def numeric_values(series: pd.Series) -> np.ndarray:
+    """The values of a column that convert to numbers, as float64."""
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    missing = np.isnan(values)
+    return values[~missing] if missing.any() else values
+
+
+def count_out_of_range(series: pd.Series, ranges: Iterable[Tuple[Any, Any]]) -> Dict[Tuple[Any, Any], Tuple[int, int]]:
+    """Count the non-null values below the minimum and above the maximum of each (min, max) range."""
+    # NaN compares false, so numeric arrays are compared without dropping nulls
+    compared = series.to_numpy() if series.dtype.kind in "biuf" else series.dropna()
+    return {
+        (min_val, max_val): ((compared < min_val).sum(), (compared > max_val).sum())
+        for min_val, max_val in ranges
+    }
+
+
+def new_quantile_sketch(backend: str, kll_k: int = DEFAULT_KLL_K, tdigest_k: int = DEFAULT_TDIGEST_K):
+    """Empty quantile sketch of a backend ('kll' or 'tdigest'; 'exact' streams through KLL)."""
+    if backend == "tdigest":
+        return tdigest_double(tdigest_k)
+    return kll_doubles_sketch(kll_k)
+
+
+def sketch_backend(backend: str) -> str:
+    """Sketch standing in for a quantile backend when the values are not kept."""
+    return "kll" if backend == "exact" else backend
+
+
+def count_outside(sketch, count: int, lower_bound: float, upper_bound: float) -> int:
+    """Estimated number of the sketched values below lower_bound or above upper_bound."""
+    if isinstance(sketch, tdigest_double):
+        below = sketch.get_rank(lower_bound)
+        above = 1.0 - sketch.get_rank(upper_bound)
+    else:
+        below = sketch.get_rank(lower_bound, inclusive=False)
+        above = 1.0 - sketch.get_rank(upper_bound, inclusive=True)
+    return int(round((below + above) * count))
+
+
+def estimate_outliers(profile: ColumnProfile, statistics: Dict[str, set], sketches: Dict[str, Any]) -> None:
+    """
+    Estimate the outlier counts of a profile from quantile sketches of its numeric values.
+    
+    Args:
+        profile: Profile with the moments of the values, updated in place
+        statistics: Requested zscore and iqr outlier counts, as (threshold, backend)
+        sketches: Quantile sketches of the values by backend
+    """
+    std = profile.std
+    for threshold, backend in statistics.get("zscore", ()):
+        sketch = sketches[sketch_backend(backend)]
+        outliers = count_outside(
+            sketch, profile.numeric_count, profile.mean - threshold * std, profile.mean + threshold * std
+        ) if std > 0 else 0
+        profile.outliers[("zscore", threshold, backend)] = outliers
+    
+    for threshold, backend in statistics.get("iqr", ()):
+        sketch = sketches[sketch_backend(backend)]
+        q1, q3 = sketch.get_quantile(0.25), sketch.get_quantile(0.75)
+        profile.quantiles[backend] = {0.25: q1, 0.75: q3}
+        profile.outliers[("iqr", threshold, backend)] = count_outside(
+            sketch, profile.numeric_count, q1 - threshold * (q3 - q1), q3 + threshold * (q3 - q1)
+        )
+
+
+def profile_column(series: pd.Series, statistics: Dict[str, set]) -> ColumnProfile:
+    """
+    Compute the requested statistics of a column from a single read of its values.
+    
+    Args:
+        series: Column to profile
+        statistics: Requested statistics and their parameters, from a ProfilePlan
+        
+    Returns:
+        ColumnProfile: The column's statistics
+    """
+    profile = ColumnProfile(series.name)
+    profile.rows = len(series)
+    profile.nulls = int(series.isnull().sum())
+    
+    if "range" in statistics:
+        profile.range_counts = count_out_of_range(series, statistics["range"])
+    
+    if "duplicates" in statistics:
+        # The same hashes as ColumnState, so both paths count the same duplicates
+        hashes = hash_keys(series)
+        profile.duplicates = len(hashes) - len(pd.unique(hashes))
+    
+    if statistics.keys() & {"moments", "zscore", "iqr"}:
+        values = numeric_values(series)
+        profile.numeric_count = len(values)
+        if profile.numeric_count:
+            profile.mean = values.mean()
+            deviations = values - profile.mean
+            profile.m2 = float(np.dot(deviations, deviations))
+            profile.min, profile.max = values.min(), values.max()
+            
+            std = profile.std
+            for threshold, backend in statistics.get("zscore", ()):
+                if backend == "exact":
+                    outliers = (np.abs(deviations / std) > threshold).sum() if std > 0 else 0
+                    profile.outliers[("zscore", threshold, backend)] = int(outliers)
+            
+            exact_iqr = [threshold for threshold, backend in statistics.get("iqr", ()) if backend == "exact"]
+            if exact_iqr:
+                q1, q3 = np.quantile(values, [0.25, 0.75])
+                profile.quantiles["exact"] = {0.25: q1, 0.75: q3}
+                for threshold in exact_iqr:
+                    lower_bound = q1 - threshold * (q3 - q1)
+                    upper_bound = q3 + threshold * (q3 - q1)
+                    profile.outliers[("iqr", threshold, "exact")] = int(((values < lower_bound) | (values > upper_bound)).sum())
+            
+            # Sketch backends read the values once instead of sorting them
+            sketched = {
+                method: {params for params in statistics.get(method, ()) if params[1] != "exact"}
+                for method in ("zscore", "iqr")
+            }
+            backends = {backend for requests in sketched.values() for _, backend in requests}
+            if backends:
+                sketches = {backend: new_quantile_sketch(backend) for backend in backends}
+                for sketch in sketches.values():
+                    sketch.update(values)
+                estimate_outliers(profile, sketched, sketches)
+    
+    return profile
+
+
+def profile_data(data: pd.DataFrame, plan: ProfilePlan) -> Dict[str, ColumnProfile]:
+    """
+    Profile the planned columns of a DataFrame.
+    
+    Args:
+        data: Pandas DataFrame to profile
+        plan: Statistics to compute per column
+        
+    Returns:
+        Dict[str, ColumnProfile]: Profiles by column; planned columns missing from the data have none
+    """
+    return {
+        column: profile_column(data[column], statistics)
+        for column, statistics in plan.columns.items() if column in data.columns
+    }
+
+
+def _profile_shared_columns(columns: List[Tuple[str, Dict[str, set]]]) -> Dict[str, ColumnProfile]:
+    """Profile columns of the DataFrame inherited from the parent process."""
+    return {column: profile_column(_shared_data[column], statistics) for column, statistics in columns}
+
+
+def profile_data_parallel(data: pd.DataFrame, plan: ProfilePlan, workers: int) -> Dict[str, ColumnProfile]:
+    """
+    Profile the planned columns of a DataFrame across a pool of processes.
+    
+    Columns are split into groups of similar size, largest first, and each
+    group is profiled by one forked worker. Workers read the column buffers
+    the parent already holds (copy-on-write), so only the profiles are sent
+    back. Each column is profiled whole by the same function as in
+    profile_data, so the profiles are identical to the serial ones.
+    
+    Args:
+        data: Pandas DataFrame to profile
+        plan: Statistics to compute per column
+        workers: Number of worker processes
+        
+    Returns:
+        Dict[str, ColumnProfile]: Profiles by column, in plan order
+    """
+    global _shared_data
+    
+    columns = [(column, statistics) for column, statistics in plan.columns.items() if column in data.columns]
+    if workers <= 1 or len(columns) <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return profile_data(data, plan)
+    
+    # Longest-processing-time assignment of columns to groups, by memory and number of statistics
+    groups = [[] for _ in range(min(workers, len(columns)))]
+    loads = [0] * len(groups)
+    costs = {
+        column: int(data[column].memory_usage(index=False, deep=False)) * len(statistics)
+        for column, statistics in columns
+    }
+    for column, statistics in sorted(columns, key=lambda item: costs[item[0]], reverse=True):
+        group = loads.index(min(loads))
+        groups[group].append((column, statistics))
+        loads[group] += costs[column]
+    
+    _shared_data = data
+    try:
+        with ProcessPoolExecutor(max_workers=len(groups), mp_context=multiprocessing.get_context("fork")) as pool:
+            partials = list(pool.map(_profile_shared_columns, groups))
+    finally:
+        _shared_data = None
+    
+    profiles = {}
+    for partial in partials:
+        profiles.update(partial)
+    return {column: profiles[column] for column, _ in columns}
+
+
+class ColumnState:
+    """
+    Mergeable statistics of one column, updated chunk by chunk.
+    
+    Counts, out-of-range counts, min/max and the mean and variance (merged
+    with Chan's parallel form of Welford's algorithm) are exact. Duplicates
+    are counted exactly from a sorted set of the value hashes (8 bytes per
+    distinct value), and quantiles are estimated with KLL or t-digest
+    sketches of a few kilobytes however many rows they have seen.
+    """
+    
+    def __init__(self, column: str, statistics: Dict[str, set], kll_k: int = DEFAULT_KLL_K):
+        self.column = column
+        self.statistics = statistics
+        self.rows = 0
+        self.nulls = 0
+        self.range_counts = {bounds: (0, 0) for bounds in statistics.get("range", ())}
+        self.numeric_count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.distinct = SortedHashSet() if "duplicates" in statistics else None
+        # Quantile sketches by backend
+        self.quantiles = {
+            sketch_backend(backend): new_quantile_sketch(sketch_backend(backend), kll_k)
+            for method in ("zscore", "iqr") for _, backend in statistics.get(method, ())
+        }
+    
+    def update(self, series: pd.Series) -> None:
+        """Add a chunk of the column's values."""
+        self.rows += len(series)
+        self.nulls += int(series.isnull().sum())
+        
+        if self.range_counts:
+            self._add_range_counts(count_out_of_range(series, self.range_counts))
+        
+        if self.distinct is not None:
+            self.distinct.add(pd.unique(hash_keys(series)))
+        
+        if self.statistics.keys() & {"moments", "zscore", "iqr"}:
+            values = numeric_values(series)
+            if len(values):
+                mean = values.mean()
+                deviations = values - mean
+                self._add_moments(len(values), mean, float(np.dot(deviations, deviations)), values.min(), values.max())
+                for sketch in self.quantiles.values():
+                    sketch.update(values)
+    
+    def merge(self, other: "ColumnState") -> None:
+        """Add the statistics of the same column from other chunks."""
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self._add_range_counts(other.range_counts)
+        self._add_moments(other.numeric_count, other.mean, other.m2, other.min, other.max)
+        
+        if self.distinct is not None and other.distinct is not None:
+            self.distinct.add(other.distinct.hashes)
+        for backend, sketch in other.quantiles.items():
+            if backend in self.quantiles:
+                self.quantiles[backend].merge(sketch)
+    
+    def _add_range_counts(self, range_counts: Dict[Tuple[Any, Any], Tuple[int, int]]) -> None:
+        """Add below/above counts per range."""
+        for bounds, (below_min, above_max) in range_counts.items():
+            current_below, current_above = self.range_counts.get(bounds, (0, 0))
+            self.range_counts[bounds] = (current_below + int(below_min), current_above + int(above_max))
+    
+    def _add_moments(self, count: int, mean: float, m2: float, min_val: Optional[float], max_val: Optional[float]) -> None:
+        """Add the count, mean, sum of squared deviations and extremes of other values."""
+        if count == 0:
+            return
+        total = self.numeric_count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.numeric_count * count / total
+        self.numeric_count = total
+        self.min = min_val if self.min is None else min(self.min, min_val)
+        self.max = max_val if self.max is None else max(self.max, max_val)
+    
+    def profile(self) -> ColumnProfile:
+        """The column's statistics so far."""
+        profile = ColumnProfile(self.column)
+        profile.rows = self.rows
+        profile.nulls = self.nulls
+        profile.range_counts = dict(self.range_counts)
+        profile.numeric_count = self.numeric_count
+        profile.mean = self.mean
+        profile.m2 = self.m2
+        profile.min = self.min
+        profile.max = self.max
+        
+        if self.distinct is not None:
+            profile.duplicates = self.rows - self.distinct.keys
+        
+        if self.quantiles and self.numeric_count:
+            estimate_outliers(profile, self.statistics, self.quantiles)
+        
+        return profile
+    
+    def __getstate__(self) -> Dict[str, Any]:
+        # Quantile sketches are pickled in their serialized form
+        state = dict(self.__dict__)
+        state["quantiles"] = {backend: sketch.serialize() for backend, sketch in self.quantiles.items()}
+        return state
+    
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        state["quantiles"] = {
+            backend: (tdigest_double if backend == "tdigest" else kll_doubles_sketch).deserialize(serialized)
+            for backend, serialized in state["quantiles"].items()
+        }
+        self.__dict__.update(state)
+
+
+class StreamingProfiler:
+    """
+    Column statistics of data arriving in chunks.
+    
+    Chunks can be Parquet row groups, Kafka batches or pages of a query
+    result. Memory is bounded except for the distinct value hashes of
+    columns with duplicate checks. Profiles are available at any point, and
+    profilers of different chunks or workers are combined with merge() (they
+    pickle, so they can be sent between processes).
+    """
+    
+    def __init__(self, plan: ProfilePlan, kll_k: int = DEFAULT_KLL_K):
+        """
+        Initialize the streaming profiler.
+        
+        Args:
+            plan: Statistics to compute per column
+            kll_k: Size parameter of the KLL quantile sketches
+        """
+        self.plan = plan
+        self.kll_k = kll_k
+        self.states: Dict[str, ColumnState] = {}
+    
+    def _state(self, column: str) -> ColumnState:
+        if column not in self.states:
+            self.states[column] = ColumnState(column, self.plan.columns[column], self.kll_k)
+        return self.states[column]
+    
+    def update(self, chunk: pd.DataFrame) -> None:
+        """Add a chunk of rows."""
+        for column in self.plan.columns:
+            if column in chunk.columns:
+                self._state(column).update(chunk[column])
+    
+    def merge(self, other: "StreamingProfiler") -> None:
+        """Add the statistics of another profiler with the same plan."""
+        for column, state in other.states.items():
+            self._state(column).merge(state)
+    
+    def profiles(self) -> Dict[str, ColumnProfile]:
+        """Profiles of the columns seen so far."""
+        return {column: state.profile() for column, state in self.states.items()}
+
+
+class ProfiledCheck(DataQualityCheck):
+    """
+    Base class for checks evaluated from column statistics.
+    
+    A check requests the statistics it needs in plan() and reads them in
+    evaluate(), so DataQualityChecker can compute the statistics of all its
+    checks together.
+    """
+    
+    def plan(self, plan: ProfilePlan) -> None:
+        """Request the column statistics the check needs."""
+        raise NotImplementedError("Subclasses must implement this method")
+    
+    def evaluate(self, profiles: Dict[str, ColumnProfile]) -> bool:
+        """
+        Evaluate the check from column statistics.
+        
+        Args:
+            profiles: Profiles of the data's columns, including the ones the check requested
+            
+        Returns:
+            bool: True if the check passed, False otherwise
+        """
+        raise NotImplementedError("Subclasses must implement this method")
+    
+    def run(self, data: pd.DataFrame) -> bool:
+        """
+        Run the check on the provided data.
+        
+        Args:
+            data: Pandas DataFrame to check
+            
+        Returns:
+            bool: True if the check passed, False otherwise
+        """
+        plan = ProfilePlan()
+        self.plan(plan)
+        return self.evaluate(profile_data(data, plan))
+
+
+class NullCheck(ProfiledCheck):
     """Check for null values in specified columns."""
     
     def __init__(self, name: str, columns: List[str], threshold: float = 0.0):
@@ -64,12 +543,17 @@ class NullCheck(DataQualityCheck):
         self.columns = columns
         self.threshold = threshold
     
-    def run(self, data: pd.DataFrame) -> bool:
+    def plan(self, plan: ProfilePlan) -> None:
+        """Request the null counts of the columns."""
+        for col in self.columns:
+            plan.require(col, "nulls")
+    
+    def evaluate(self, profiles: Dict[str, ColumnProfile]) -> bool:
         """
-        Run the null check on the provided data.
+        Evaluate the null check from column statistics.
         
         Args:
-            data: Pandas DataFrame to check
+            profiles: Profiles of the data's columns
             
         Returns:
             bool: True if the check passed, False otherwise
@@ -77,7 +561,7 @@ class NullCheck(DataQualityCheck):
         self.timestamp = datetime.datetime.now()
         
         # Check if all specified columns exist in the data
-        missing_columns = [col for col in self.columns if col not in data.columns]
+        missing_columns = [col for col in self.columns if col not in profiles]
         if missing_columns:
             self.passed = False
             self.message = f"Columns not found in data: {', '.join(missing_columns)}"
@@ -86,8 +570,8 @@ class NullCheck(DataQualityCheck):
         # Calculate the percentage of null values for each column
         null_percentages = {}
         for col in self.columns:
-            null_count = data[col].isnull().sum()
-            total_count = len(data)
+            null_count = profiles[col].nulls
+            total_count = profiles[col].rows
             null_percentage = null_count / total_count if total_count > 0 else 0.0
             null_percentages[col] = null_percentage
         
@@ -104,7 +588,7 @@ class NullCheck(DataQualityCheck):
             return True
 
 
-class ValueRangeCheck(DataQualityCheck):
+class ValueRangeCheck(ProfiledCheck):
     """Check if values in specified columns are within expected ranges."""
     
     def __init__(self, name: str, column_ranges: Dict[str, Tuple[Union[int, float], Union[int, float]]]):
@@ -118,12 +602,17 @@ class ValueRangeCheck(DataQualityCheck):
         super().__init__(name, f"Check if values are within expected ranges for columns: {', '.join(column_ranges.keys())}")
         self.column_ranges = column_ranges
     
-    def run(self, data: pd.DataFrame) -> bool:
+    def plan(self, plan: ProfilePlan) -> None:
+        """Request the out-of-range counts of the columns."""
+        for col, (min_val, max_val) in self.column_ranges.items():
+            plan.require(col, "range", min_val, max_val)
+    
+    def evaluate(self, profiles: Dict[str, ColumnProfile]) -> bool:
         """
-        Run the value range check on the provided data.
+        Evaluate the value range check from column statistics.
         
         Args:
-            data: Pandas DataFrame to check
+            profiles: Profiles of the data's columns
             
         Returns:
             bool: True if the check passed, False otherwise
@@ -131,7 +620,7 @@ class ValueRangeCheck(DataQualityCheck):
         self.timestamp = datetime.datetime.now()
         
         # Check if all specified columns exist in the data
-        missing_columns = [col for col in self.column_ranges.keys() if col not in data.columns]
+        missing_columns = [col for col in self.column_ranges.keys() if col not in profiles]
         if missing_columns:
             self.passed = False
             self.message = f"Columns not found in data: {', '.join(missing_columns)}"
@@ -140,16 +629,14 @@ class ValueRangeCheck(DataQualityCheck):
         # Check if values are within the expected range for each column
         out_of_range = {}
         for col, (min_val, max_val) in self.column_ranges.items():
-            # Filter out null values before checking the range
-            valid_data = data[col].dropna()
-            
-            # Count values outside the expected range
-            below_min = (valid_data < min_val).sum()
-            above_max = (valid_data > max_val).sum()
+            # Values outside the expected range, among the non-null values
+            profile = profiles[col]
+            below_min, above_max = profile.range_counts[(min_val, max_val)]
             total_out_of_range = below_min + above_max
+            valid_count = profile.rows - profile.nulls
             
             if total_out_of_range > 0:
-                percentage = total_out_of_range / len(valid_data) if len(valid_data) > 0 else 0.0
+                percentage = total_out_of_range / valid_count if valid_count > 0 else 0.0
                 out_of_range[col] = {
                     "below_min": int(below_min),
                     "above_max": int(above_max),
@@ -167,7 +654,7 @@ class ValueRangeCheck(DataQualityCheck):
             return True
 
 
-class UniquenessCheck(DataQualityCheck):
+class UniquenessCheck(ProfiledCheck):
     """Check if values in specified columns are unique."""
     
     def __init__(self, name: str, columns: List[str], should_be_unique: bool = True):
@@ -186,12 +673,17 @@ class UniquenessCheck(DataQualityCheck):
         self.columns = columns
         self.should_be_unique = should_be_unique
     
-    def run(self, data: pd.DataFrame) -> bool:
+    def plan(self, plan: ProfilePlan) -> None:
+        """Request the duplicate counts of the columns."""
+        for col in self.columns:
+            plan.require(col, "duplicates")
+    
+    def evaluate(self, profiles: Dict[str, ColumnProfile]) -> bool:
         """
-        Run the uniqueness check on the provided data.
+        Evaluate the uniqueness check from column statistics.
         
         Args:
-            data: Pandas DataFrame to check
+            profiles: Profiles of the data's columns
             
         Returns:
             bool: True if the check passed, False otherwise
@@ -199,7 +691,7 @@ class UniquenessCheck(DataQualityCheck):
         self.timestamp = datetime.datetime.now()
         
         # Check if all specified columns exist in the data
-        missing_columns = [col for col in self.columns if col not in data.columns]
+        missing_columns = [col for col in self.columns if col not in profiles]
         if missing_columns:
             self.passed = False
             self.message = f"Columns not found in data: {', '.join(missing_columns)}"
@@ -209,7 +701,7 @@ class UniquenessCheck(DataQualityCheck):
         non_unique_columns = {}
         for col in self.columns:
             # Count duplicates
-            duplicate_count = data[col].duplicated().sum()
+            duplicate_count = profiles[col].duplicates
             
             # Check if the result matches the expected uniqueness
             if self.should_be_unique and duplicate_count > 0:
@@ -233,6 +725,88 @@ class UniquenessCheck(DataQualityCheck):
             return True
 
 
+class CrossBatchUniquenessCheck(DataQualityCheck):
+    """Check that the keys of a batch do not repeat, within the batch or across earlier batches."""
+    
+    def __init__(self, name: str, column: str, history_path: str, max_duplicate_rate: float = 0.0,
+                 period_column: str = "timestamp", period: str = "hour", mode: str = "bloom",
+                 retention: int = 24, memory_budget_mb: int = 64, expected_keys: int = 1_000_000):
+        """
+        Initialize the cross-batch uniqueness check.
+        
+        Args:
+            name: Name of the check
+            column: Key column (e.g. event_id)
+            history_path: File the key history is kept in between runs
+            max_duplicate_rate: Maximum allowed fraction of duplicate keys
+            period_column: Time column whose latest value assigns the batch to a history partition
+            period: Period of the history partitions ('hour' or 'day')
+            mode: 'bloom' for a fixed memory budget, 'exact' for sorted key hashes
+            retention: Number of periods of keys kept
+            memory_budget_mb: Memory of the whole history in bloom mode
+            expected_keys: Expected number of distinct keys per period in bloom mode
+        """
+        super().__init__(name, f"Check if values are unique across batches in column: {column}")
+        self.column = column
+        self.history_path = history_path
+        self.max_duplicate_rate = max_duplicate_rate
+        self.period_column = period_column
+        self.period = period
+        self.history_settings = {
+            "mode": mode,
+            "retention": retention,
+            "memory_budget_bytes": memory_budget_mb * 1024 * 1024,
+            "expected_keys": expected_keys,
+        }
+    
+    def _batch_period(self, data: pd.DataFrame) -> str:
+        """
+        History partition of the batch: the UTC period of its latest event, or of now without one.
+        
+        Naive timestamps are taken as UTC, so aware and naive timestamps of
+        the same hour fall in the same partition.
+        """
+        latest = None
+        if self.period_column in data.columns:
+            latest = pd.to_datetime(data[self.period_column], utc=True).max()
+        if latest is None or pd.isnull(latest):
+            latest = pd.Timestamp.now(tz="UTC")
+        return truncate_timestamp(latest.tz_localize(None).to_pydatetime(), self.period).isoformat()
+    
+    def run(self, data: pd.DataFrame) -> bool:
+        """
+        Run the cross-batch uniqueness check and record the batch's keys.
+        
+        Running the check again on the same batch (e.g. on a task retry)
+        reports the result of the first run.
+        
+        Args:
+            data: Pandas DataFrame with one batch of data
+            
+        Returns:
+            bool: True if the check passed, False otherwise
+        """
+        self.timestamp = datetime.datetime.now()
+        
+        if self.column not in data.columns:
+            self.passed = False
+            self.message = f"Column not found in data: {self.column}"
+            return False
+        
+        history = KeyHistory.open(self.history_path, **self.history_settings)
+        result = history.check_batch(hash_keys(data[self.column].dropna()), self._batch_period(data))
+        history.save(self.history_path)
+        
+        # A Bloom filter history reports unseen keys as seen at its false positive rate
+        self.passed = result["duplicate_rate"] <= self.max_duplicate_rate + result["false_positive_rate"]
+        self.message = (
+            f"Duplicate rate in column {self.column}: {result['duplicate_rate']:.4%} "
+            f"({result['batch_duplicates']} within the batch, {result['cross_batch_duplicates']} seen in earlier "
+            f"batches, false positive rate {result['false_positive_rate']:.4%})"
+        )
+        return self.passed
+
+
 class SchemaCheck(DataQualityCheck):
     """Check if the data schema matches the expected schema."""
     
@@ -293,10 +867,11 @@ class SchemaCheck(DataQualityCheck):
             return True
 
 
-class AnomalyCheck(DataQualityCheck):
+class AnomalyCheck(ProfiledCheck):
     """Check for anomalies in the data using simple statistical methods."""
     
-    def __init__(self, name: str, column: str, method: str = "zscore", threshold: float = 3.0):
+    def __init__(self, name: str, column: str, method: str = "zscore", threshold: float = 3.0,
+                 quantile_backend: str = "exact"):
         """
         Initialize the anomaly check.
         
@@ -305,86 +880,105 @@ class AnomalyCheck(DataQualityCheck):
             column: Column to check for anomalies
             method: Method to use for anomaly detection ('zscore' or 'iqr')
             threshold: Threshold for anomaly detection
+            quantile_backend: 'exact', or 'kll' or 'tdigest' to count anomalies from a
+                quantile sketch in one pass with bounded memory
         """
-        super().__init__(name, f"Check for anomalies in column: {column} using {method} method")
+        if quantile_backend not in QUANTILE_BACKENDS:
+            raise ValueError(f"Unsupported quantile backend: {quantile_backend}")
+        description = f"Check for anomalies in column: {column} using {method} method"
+        if quantile_backend != "exact":
+            description += f" ({quantile_backend} estimate)"
+        super().__init__(name, description)
         self.column = column
         self.method = method
         self.threshold = threshold
+        self.quantile_backend = quantile_backend
+        self.anomaly_count = None
     
-    def run(self, data: pd.DataFrame) -> bool:
+    def plan(self, plan: ProfilePlan) -> None:
+        """Request the moments and outlier count of the column."""
+        plan.require(self.column, "moments")
+        plan.require(self.column, self.method, self.threshold, self.quantile_backend)
+    
+    def evaluate(self, profiles: Dict[str, ColumnProfile]) -> bool:
         """
-        Run the anomaly check on the provided data.
+        Evaluate the anomaly check from column statistics.
         
         Args:
-            data: Pandas DataFrame to check
+            profiles: Profiles of the data's columns
             
         Returns:
             bool: True if the check passed, False otherwise
         """
         self.timestamp = datetime.datetime.now()
+        self.anomaly_count = None
         
         # Check if the specified column exists in the data
-        if self.column not in data.columns:
+        if self.column not in profiles:
             self.passed = False
             self.message = f"Column not found in data: {self.column}"
             return False
         
-        # Get the numeric values from the column
-        values = pd.to_numeric(data[self.column], errors='coerce').dropna()
+        # Statistics of the numeric values of the column
+        profile = profiles[self.column]
         
-        if len(values) == 0:
+        if profile.numeric_count == 0:
             self.passed = False
             self.message = f"No valid numeric values in column: {self.column}"
             return False
         
-        # Detect anomalies using the specified method
-        anomalies = []
+        if self.method == "zscore" and profile.std == 0:
+            self.anomaly_count = 0
+            self.passed = True
+            self.message = f"No variation in column: {self.column}, all values are the same"
+            return True
         
-        if self.method == "zscore":
-            # Z-score method
-            mean = values.mean()
-            std = values.std()
-            
-            if std == 0:
-                self.passed = True
-                self.message = f"No variation in column: {self.column}, all values are the same"
-                return True
-            
-            zscores = np.abs((values - mean) / std)
-            anomalies = values[zscores > self.threshold].tolist()
-            
-        elif self.method == "iqr":
-            # IQR method
-            q1 = values.quantile(0.25)
-            q3 = values.quantile(0.75)
-            iqr = q3 - q1
-            
-            lower_bound = q1 - self.threshold * iqr
-            upper_bound = q3 + self.threshold * iqr
-            
-            anomalies = values[(values < lower_bound) | (values > upper_bound)].tolist()
+        # Anomalies found by the specified method (z-score or IQR)
+        anomalies = profile.outliers.get((self.method, self.threshold, self.quantile_backend), 0)
+        self.anomaly_count = anomalies
         
         if anomalies:
             self.passed = False
-            self.message = f"Found {len(anomalies)} anomalies in column: {self.column}"
+            self.message = f"Found {anomalies} anomalies in column: {self.column}"
             return False
         else:
             self.passed = True
             self.message = f"No anomalies found in column: {self.column}"
             return True
+    
+    def get_result(self) -> Dict[str, Any]:
+        """Get the result of the anomaly check, with the number of anomalies found."""
+        result = super().get_result()
+        result["anomaly_count"] = self.anomaly_count
+        return result
 
 
 class DataQualityChecker:
     """Class to run multiple data quality checks on a dataset."""
     
-    def __init__(self):
+    def __init__(self, workers: int = 1):
+        """
+        Initialize the checker.
+        
+        Args:
+            workers: Number of processes profiling columns in parallel (1 profiles them serially)
+        """
         self.checks = []
         self.results = []
+        self.workers = workers
     
     def add_check(self, check: DataQualityCheck) -> None:
         """Add a data quality check to the checker."""
         self.checks.append(check)
     
+    def plan(self) -> ProfilePlan:
+        """Merge the column statistics requested by the profiled checks."""
+        plan = ProfilePlan()
+        for check in self.checks:
+            if isinstance(check, ProfiledCheck):
+                check.plan(plan)
+        return plan
+    
     def run_checks(self, data: pd.DataFrame) -> Dict[str, Any]:
         """
         Run all data quality checks on the provided data.
@@ -392,6 +986,53 @@ class DataQualityChecker:
         Args:
             data: Pandas DataFrame to check
             
+        Returns:
+            Dict[str, Any]: Results of all checks
+        """
+        # Statistics of every profiled check, computed once per column
+        try:
+            profiles = profile_data_parallel(data, self.plan(), self.workers)
+        except Exception as e:
+            # Run the checks one by one so a failure is reported by the checks it affects
+            logger.warning(f"Profiling failed, running checks separately: {e}")
+            profiles = None
+        
+        return self.evaluate_profiles(profiles, data)
+    
+    def run_checks_on_chunks(self, chunks: Iterable[pd.DataFrame],
+                             profiler: Optional[StreamingProfiler] = None) -> Dict[str, Any]:
+        """
+        Run all data quality checks on data arriving in chunks.
+        
+        Profiled checks are evaluated from the statistics of all chunks;
+        other checks (such as SchemaCheck) run on the first chunk.
+        
+        Args:
+            chunks: DataFrames with the same columns
+            profiler: Profiler to add the chunks to, e.g. one merged from other workers
+            
+        Returns:
+            Dict[str, Any]: Results of all checks
+        """
+        profiler = profiler or StreamingProfiler(self.plan())
+        first_chunk = None
+        
+        for chunk in chunks:
+            profiler.update(chunk)
+            if first_chunk is None:
+                first_chunk = chunk
+        
+        return self.evaluate_profiles(profiler.profiles(), first_chunk)
+    
+    def evaluate_profiles(self, profiles: Optional[Dict[str, ColumnProfile]],
+                          data: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
+        """
+        Evaluate all data quality checks from column statistics.
+        
+        Args:
+            profiles: Profiles of the data's columns, or None to run the profiled checks on the data
+            data: Pandas DataFrame the checks that are not profiled run on
+            
         Returns:
             Dict[str, Any]: Results of all checks
         """
@@ -399,7 +1040,10 @@ class DataQualityChecker:
         
         for check in self.checks:
             try:
-                check.run(data)
+                if isinstance(check, ProfiledCheck) and profiles is not None:
+                    check.evaluate(profiles)
+                else:
+                    check.run(data)
                 self.results.append(check.get_result())
             except Exception as e:
                 logger.error(f"Error running check {check.name}: {e}")
@@ -476,6 +1120,21 @@ def load_checks_from_config(config_path: str) -> List[DataQualityCheck]:
             )
             checks.append(check)
             
+        elif check_type == "cross_batch_uniqueness_check":
+            check = CrossBatchUniquenessCheck(
+                name=check_config.get("name"),
+                column=check_config.get("column"),
+                history_path=check_config.get("history_path"),
+                max_duplicate_rate=check_config.get("max_duplicate_rate", 0.0),
+                period_column=check_config.get("period_column", "timestamp"),
+                period=check_config.get("period", "hour"),
+                mode=check_config.get("mode", "bloom"),
+                retention=check_config.get("retention", 24),
+                memory_budget_mb=check_config.get("memory_budget_mb", 64),
+                expected_keys=check_config.get("expected_keys", 1_000_000)
+            )
+            checks.append(check)
+            
         elif check_type == "schema_check":
             check = SchemaCheck(
                 name=check_config.get("name"),
@@ -488,25 +1147,28 @@ def load_checks_from_config(config_path: str) -> List[DataQualityCheck]:
                 name=check_config.get("name"),
                 column=check_config.get("column"),
                 method=check_config.get("method", "zscore"),
-                threshold=check_config.get("threshold", 3.0)
+                threshold=check_config.get("threshold", 3.0),
+                quantile_backend=check_config.get("quantile_backend", "exact")
             )
             checks.append(check)
     
     return checks
 
 
-def run_quality_checks_on_dataframe(df: pd.DataFrame, checks: List[DataQualityCheck]) -> Dict[str, Any]:
+def run_quality_checks_on_dataframe(df: pd.DataFrame, checks: List[DataQualityCheck],
+                                    workers: int = 1) -> Dict[str, Any]:
     """
     Run data quality checks on a DataFrame.
     
     Args:
         df: Pandas DataFrame to check
         checks: List of data quality checks to run
+        workers: Number of processes profiling columns in parallel
         
     Returns:
         Dict[str, Any]: Results of all checks
     """
-    checker = DataQualityChecker()
+    checker = DataQualityChecker(workers=workers)
     
     for check in checks:
         checker.add_check(check)
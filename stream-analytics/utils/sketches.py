@@ -0,0 +1,128 @@
+"""
+Distinct-Count Sketch Utilities
+
+This module provides utilities for merging the HyperLogLog sketches stored
+by the streaming pipeline (e.g. hourly_metrics.user_sketch) so that daily,
+weekly or any-dimension distinct counts can be computed from stored sketches
+instead of rescanning raw events.
+"""
+
+import logging
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from datasketches import hll_sketch, hll_union, tgt_hll_type
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# log2 of the number of HLL buckets used by the pipeline
+DEFAULT_LG_CONFIG_K = 12
+
+# Periods supported by the rollup helpers
+ROLLUP_PERIODS = ("hour", "day", "week", "month")
+
+
+def merge_hll_sketches(sketches: Iterable[Optional[bytes]], lg_max_k: int = DEFAULT_LG_CONFIG_K) -> Optional[bytes]:
+    """
+    Merge serialized HLL sketches into one.
+    
+    Args:
+        sketches: Serialized sketches; missing (None) sketches are skipped
+        lg_max_k: Maximum precision of the merged sketch
+        
+    Returns:
+        Optional[bytes]: The merged sketch, or None if there was nothing to merge
+    """
+    union = hll_union(lg_max_k)
+    merged = False
+    
+    for sketch in sketches:
+        if sketch is None:
+            continue
+        union.update(hll_sketch.deserialize(bytes(sketch)))
+        merged = True
+    
+    if not merged:
+        return None
+    return union.get_result(tgt_hll_type.HLL_8).serialize_compact()
+
+
+def estimate_distinct(sketch: Optional[bytes]) -> int:
+    """
+    Estimate the number of distinct values in a serialized HLL sketch.
+    
+    Args:
+        sketch: Serialized sketch
+        
+    Returns:
+        int: Estimated distinct count (0 for a missing sketch)
+    """
+    if sketch is None:
+        return 0
+    return int(round(hll_sketch.deserialize(bytes(sketch)).get_estimate()))
+
+
+def truncate_timestamp(timestamp: datetime.datetime, period: str) -> datetime.datetime:
+    """
+    Truncate a timestamp to the start of its period.
+    
+    Args:
+        timestamp: Timestamp to truncate
+        period: One of 'hour', 'day', 'week' (weeks start on Monday) or 'month'
+        
+    Returns:
+        datetime.datetime: Start of the period containing the timestamp
+    """
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unsupported rollup period: {period}")
+    
+    start = timestamp.replace(minute=0, second=0, microsecond=0)
+    if period == "hour":
+        return start
+    
+    start = start.replace(hour=0)
+    if period == "week":
+        return start - datetime.timedelta(days=start.weekday())
+    if period == "month":
+        return start.replace(day=1)
+    return start
+
+
+def rollup_sketches(rows: Iterable[Tuple], period: str = "day",
+                    lg_max_k: int = DEFAULT_LG_CONFIG_K) -> Dict[Tuple, Dict]:
+    """
+    Roll stored sketches up to a coarser period and/or fewer dimensions.
+    
+    Args:
+        rows: Tuples of (timestamp, *dimensions, sketch), e.g. the result of
+            SELECT hour_timestamp, user_sketch FROM hourly_metrics
+        period: Period to roll up to ('hour', 'day', 'week' or 'month')
+        lg_max_k: Maximum precision of the merged sketches
+        
+    Returns:
+        Dict[Tuple, Dict]: For each (period_start, *dimensions) key, the merged
+            sketch and its unique count estimate
+    """
+    groups: Dict[Tuple, List[Optional[bytes]]] = {}
+    
+    for row in rows:
+        timestamp, dimensions, sketch = row[0], tuple(row[1:-1]), row[-1]
+        key = (truncate_timestamp(timestamp, period),) + dimensions
+        groups.setdefault(key, []).append(sketch)
+    
+    rollup = {}
+    for key, sketches in groups.items():
+        merged = merge_hll_sketches(sketches, lg_max_k=lg_max_k)
+        rollup[key] = {
+            "sketch": merged,
+            "unique_count": estimate_distinct(merged),
+            "merged_sketches": len(sketches),
+        }
+    
+    logger.info(f"Rolled up {sum(len(s) for s in groups.values())} sketches into {len(rollup)} {period} groups")
+    return rollup
\ No newline at end of file
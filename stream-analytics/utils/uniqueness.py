@@ -0,0 +1,405 @@
+"""
+Cross-Batch Uniqueness Utilities
+
+This module tracks the keys (e.g. event_id or transaction_id) seen by earlier
+batches so that duplicates spanning hourly batches can be counted. Keys are
+hashed to 64-bit integers with vectorized hashing and kept in a history of
+time partitions, one per period (e.g. hour) of the batches, of which only the
+most recent are retained:
+
+- bloom: each partition is a Bloom filter, and the history has a fixed
+  memory budget; keys can be reported as seen with a small, known false
+  positive rate, but never missed
+- exact: each partition is a sorted array of key hashes (8 bytes per key)
+
+The history is saved to a file between runs. Recording a batch is
+idempotent: each partition keeps a digest and the result of the batches it
+recorded, and a batch recorded before (e.g. by a retried task) gets its
+original result instead of finding all of its keys in the history.
+"""
+
+import os
+import json
+import decimal
+import numbers
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+HISTORY_MODES = ("bloom", "exact")
+
+# Hashes probed or added at once, to bound the size of temporary arrays
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def _typed_key(value: Any) -> Tuple[str, Any]:
+    """Type and value of a key, with equal numbers of any type (1, 1.0, True) mapped to the same key."""
+    if isinstance(value, (numbers.Real, decimal.Decimal)):
+        try:
+            if value == int(value):
+                return "number", str(int(value))
+        except (ValueError, OverflowError):
+            pass
+        return "number", repr(float(value))
+    return type(value).__qualname__, value
+
+
+def hash_keys(keys: Union[pd.Series, np.ndarray]) -> np.ndarray:
+    """
+    Hash keys to 64-bit integers.
+    
+    Numbers are hashed from their bits and strings from their text, in
+    vectorized code, so keys are compared as a uint64 array instead of a hash
+    table of Python objects. Object columns holding anything but strings
+    (nulls, mixed types) are hashed together with the type of each value, so
+    that e.g. 1 and '1', or None and 'None', are different keys. Numbers of
+    different types compare by value, as in pandas' duplicated(): 1, 1.0 and
+    True are the same key.
+    
+    Args:
+        keys: Key values
+        
+    Returns:
+        np.ndarray: uint64 hash of each key
+    """
+    keys = pd.Series(keys)
+    if keys.dtype == object and pd.api.types.infer_dtype(keys, skipna=False) != "string":
+        typed = [_typed_key(value) for value in keys]
+        frame = pd.DataFrame({"key": [key for _, key in typed], "type": [kind for kind, _ in typed]}, dtype=object)
+        return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+    return pd.util.hash_pandas_object(keys, index=False, categorize=False).to_numpy()
+
+
+def batch_digest(hashes: np.ndarray) -> str:
+    """Digest of a batch's key hashes, independent of their order."""
+    return hashlib.sha1(np.sort(hashes).tobytes()).hexdigest()
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """Derive a second, independent hash (splitmix64 finalizer)."""
+    with np.errstate(over='ignore'):
+        z = hashes ^ (hashes >> np.uint64(30))
+        z = z * np.uint64(0xBF58476D1CE4E5B9)
+        z = z ^ (z >> np.uint64(27))
+        z = z * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+class BloomFilter:
+    """Bloom filter of 64-bit key hashes, probed and updated with vectorized numpy operations."""
+    
+    def __init__(self, num_bits: int, num_hashes: int, bits: Optional[np.ndarray] = None, keys: int = 0):
+        """
+        Initialize the Bloom filter.
+        
+        Args:
+            num_bits: Size of the filter in bits, a power of two of at least 64
+            num_hashes: Number of bits set per key
+            bits: Bits of a saved filter
+            keys: Number of keys added to a saved filter
+        """
+        if num_bits < 64 or num_bits & (num_bits - 1):
+            raise ValueError(f"Bloom filter size must be a power of two of at least 64 bits: {num_bits}")
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else np.zeros(num_bits // 8, dtype=np.uint8)
+        self.keys = keys
+    
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        """Bit positions of each hash (double hashing), as a (num_hashes, len(hashes)) array."""
+        step = _mix(hashes) | np.uint64(1)
+        rounds = np.arange(self.num_hashes, dtype=np.uint64)[:, None]
+        with np.errstate(over='ignore'):
+            return (hashes[None, :] + rounds * step[None, :]) & np.uint64(self.num_bits - 1)
+    
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Whether each hash may have been added (no false negatives)."""
+        found = np.empty(len(hashes), dtype=bool)
+        for start in range(0, len(hashes), HASH_BLOCK_SIZE):
+            positions = self._positions(hashes[start:start + HASH_BLOCK_SIZE])
+            bits = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+            found[start:start + HASH_BLOCK_SIZE] = bits.all(axis=0)
+        return found
+    
+    def add(self, hashes: np.ndarray) -> None:
+        """Add distinct hashes that are not in the filter yet."""
+        for start in range(0, len(hashes), HASH_BLOCK_SIZE):
+            positions = self._positions(hashes[start:start + HASH_BLOCK_SIZE]).ravel()
+            masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+            np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+        self.keys += len(hashes)
+    
+    def false_positive_rate(self) -> float:
+        """Probability that a new key is reported as added, given the keys added so far."""
+        return float((1.0 - np.exp(-self.num_hashes * self.keys / self.num_bits)) ** self.num_hashes)
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the filter's bits."""
+        return self.bits.nbytes
+
+
+class SortedHashSet:
+    """
+    Exact set of 64-bit key hashes, kept as disjoint sorted runs.
+    
+    Added hashes form a new run, and a run is merged into the one before it
+    once it holds at least half as many hashes (a log-structured merge), so
+    there are O(log n) runs and adding n hashes in chunks costs O(n log n)
+    overall instead of re-sorting the whole set for every chunk.
+    """
+    
+    def __init__(self, hashes: Optional[np.ndarray] = None):
+        self.runs = [hashes] if hashes is not None and len(hashes) else []
+    
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Whether each hash was added."""
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            index = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[index] == hashes
+        return found
+    
+    def add(self, hashes: np.ndarray) -> None:
+        """Add hashes; repeated hashes and hashes already in the set are ignored."""
+        hashes = np.unique(hashes)
+        hashes = hashes[~self.contains(hashes)]
+        if not len(hashes):
+            return
+        self.runs.append(hashes)
+        while len(self.runs) > 1 and 2 * len(self.runs[-1]) >= len(self.runs[-2]):
+            self._merge_last_runs()
+    
+    def _merge_last_runs(self) -> None:
+        """Merge the two most recent runs (stable sort merges sorted runs in linear time)."""
+        last = self.runs.pop()
+        self.runs[-1] = np.sort(np.concatenate([self.runs[-1], last]), kind="stable")
+    
+    @property
+    def hashes(self) -> np.ndarray:
+        """All hashes as one sorted array (the runs are merged into one)."""
+        while len(self.runs) > 1:
+            self._merge_last_runs()
+        return self.runs[0] if self.runs else np.empty(0, dtype=np.uint64)
+    
+    def false_positive_rate(self) -> float:
+        """Probability that a new key is reported as added (hash collisions are ignored)."""
+        return 0.0
+    
+    @property
+    def keys(self) -> int:
+        """Number of hashes in the set."""
+        return sum(len(run) for run in self.runs)
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the hashes."""
+        return sum(run.nbytes for run in self.runs)
+
+
+class KeyHistory:
+    """Keys seen by earlier batches, in rotating time partitions."""
+    
+    def __init__(self, mode: str = "bloom", retention: int = 24,
+                 memory_budget_bytes: int = 64 * 1024 * 1024, expected_keys: int = 1_000_000):
+        """
+        Initialize an empty key history.
+        
+        Args:
+            mode: 'bloom' or 'exact'
+            retention: Number of most recent partitions kept
+            memory_budget_bytes: Memory of all Bloom filter partitions together (bloom mode)
+            expected_keys: Expected number of distinct keys per partition, used to pick the number of hashes (bloom mode)
+        """
+        if mode not in HISTORY_MODES:
+            raise ValueError(f"Unsupported key history mode: {mode}")
+        self.mode = mode
+        self.retention = retention
+        
+        # Largest power-of-two filter that fits the budget, and the number of hashes that minimizes its error
+        budget_bits = max(64, memory_budget_bytes * 8 // retention)
+        self.num_bits = 1 << (budget_bits.bit_length() - 1)
+        self.num_hashes = max(1, int(round(self.num_bits / max(1, expected_keys) * np.log(2))))
+        
+        # Period -> partition, oldest first
+        self.partitions: Dict[str, Union[BloomFilter, SortedHashSet]] = {}
+        # Period -> digest -> result of the batches recorded in the partition
+        self.batches: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    
+    def _new_partition(self) -> Union[BloomFilter, SortedHashSet]:
+        if self.mode == "bloom":
+            return BloomFilter(self.num_bits, self.num_hashes)
+        return SortedHashSet()
+    
+    @property
+    def layout(self) -> Tuple[Any, ...]:
+        """Settings that determine how keys are stored in a partition."""
+        if self.mode == "bloom":
+            return (self.mode, self.num_bits, self.num_hashes)
+        return (self.mode,)
+    
+    def _expire(self) -> None:
+        """Drop the oldest partitions beyond the retention."""
+        for expired in list(self.partitions)[:-self.retention]:
+            del self.partitions[expired]
+            self.batches.pop(expired, None)
+            logger.info(f"Dropped key history partition {expired}")
+    
+    def check_batch(self, hashes: np.ndarray, period: str, record: bool = True) -> Dict[str, Any]:
+        """
+        Count the keys of a batch that repeat a key of the batch or of an earlier batch.
+        
+        Args:
+            hashes: uint64 key hashes of the batch, from hash_keys
+            period: Period the batch belongs to (e.g. '2024-05-01T10'); periods must sort chronologically
+            record: Whether to add the batch's keys to the history; a batch already
+                recorded in the period is not added again
+            
+        Returns:
+            Dict[str, Any]: Number of keys, duplicates within the batch, keys seen in
+                earlier batches, the duplicate rate and the history's false positive rate
+        """
+        if record:
+            digest = batch_digest(hashes)
+            recorded = self.batches.get(period, {}).get(digest)
+            if recorded is not None:
+                logger.info(f"Batch {digest} was already recorded in key history partition {period}")
+                return dict(recorded)
+        
+        unique = pd.unique(hashes)
+        seen = np.zeros(len(unique), dtype=bool)
+        for partition in self.partitions.values():
+            seen |= partition.contains(unique)
+        
+        result = {
+            "keys": int(len(hashes)),
+            "batch_duplicates": int(len(hashes) - len(unique)),
+            "cross_batch_duplicates": int(seen.sum()),
+            "false_positive_rate": self.false_positive_rate(),
+        }
+        duplicates = result["batch_duplicates"] + result["cross_batch_duplicates"]
+        result["duplicate_rate"] = duplicates / len(hashes) if len(hashes) else 0.0
+        
+        if record:
+            if period not in self.partitions:
+                self.partitions[period] = self._new_partition()
+                self.partitions = dict(sorted(self.partitions.items()))
+            partition = self.partitions[period]
+            partition.add(unique[~partition.contains(unique)])
+            self.batches.setdefault(period, {})[digest] = dict(result)
+            self._expire()
+        
+        return result
+    
+    def false_positive_rate(self) -> float:
+        """Probability that a new key is reported as seen by at least one partition."""
+        return float(1.0 - np.prod([1.0 - partition.false_positive_rate() for partition in self.partitions.values()]))
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory used by all partitions."""
+        return sum(partition.nbytes for partition in self.partitions.values())
+    
+    def save(self, path: str) -> None:
+        """Save the history to a file, replacing it atomically."""
+        metadata = {
+            "mode": self.mode,
+            "retention": self.retention,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "partitions": [
+                {"period": period, "keys": partition.keys, "batches": self.batches.get(period, {})}
+                for period, partition in self.partitions.items()
+            ],
+        }
+        arrays = {
+            f"partition_{index}": partition.bits if self.mode == "bloom" else partition.hashes
+            for index, partition in enumerate(self.partitions.values())
+        }
+        
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays)
+        os.replace(temp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "KeyHistory":
+        """
+        Load a history saved with save().
+        
+        Args:
+            path: Path of the saved history
+            
+        Returns:
+            KeyHistory: The saved history
+        """
+        with np.load(path, allow_pickle=False) as saved:
+            metadata = json.loads(str(saved["metadata"]))
+            history = cls(mode=metadata["mode"], retention=metadata["retention"])
+            history.num_bits = metadata["num_bits"]
+            history.num_hashes = metadata["num_hashes"]
+            
+            for index, partition in enumerate(metadata["partitions"]):
+                array = saved[f"partition_{index}"]
+                if history.mode == "bloom":
+                    history.partitions[partition["period"]] = BloomFilter(
+                        history.num_bits, history.num_hashes, bits=array, keys=partition["keys"]
+                    )
+                else:
+                    history.partitions[partition["period"]] = SortedHashSet(array)
+                history.batches[partition["period"]] = partition.get("batches", {})
+        
+        return history
+    
+    @classmethod
+    def open(cls, path: str, **kwargs: Any) -> "KeyHistory":
+        """
+        Load the history saved at path, or create an empty one with the given settings.
+        
+        A saved history is adapted to settings that differ from its own: a
+        new retention keeps the most recent partitions, and a new mode or
+        Bloom filter size rebuilds the partitions. Key hashes of exact
+        partitions are carried over; Bloom filters cannot be converted, so
+        their keys are forgotten.
+        
+        Args:
+            path: Path of the saved history
+            **kwargs: Settings of the history, as for KeyHistory(); the saved settings are kept without any
+            
+        Returns:
+            KeyHistory: The history with the given settings
+        """
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        
+        saved = cls.load(path)
+        if not kwargs:
+            return saved
+        
+        history = cls(**kwargs)
+        if saved.layout == history.layout:
+            history.partitions, history.batches = saved.partitions, saved.batches
+        elif saved.mode == "exact":
+            logger.info(f"Rebuilding key history {path} from {saved.layout} to {history.layout}")
+            for period, partition in saved.partitions.items():
+                history.partitions[period] = history._new_partition()
+                history.partitions[period].add(partition.hashes)
+            history.batches = saved.batches
+        else:
+            logger.warning(
+                f"Key history {path} was saved as {saved.layout} and cannot be converted to {history.layout}; "
+                f"starting an empty history"
+            )
+        
+        history._expire()
+        return history
\ No newline at end of file